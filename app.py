@@ -1,13 +1,19 @@
 # app.py
-from flask import Flask, render_template, jsonify, request, Response
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context, send_from_directory
 import mysql.connector
 from dotenv import load_dotenv
 import os
 import json
-import cv2
+import base64
+import datetime
 from detector.video_manager import VideoManager
+from detector.broadcaster import parse_profile
 import threading
-from db_utils import get_db_connection
+from db_utils import db_cursor, db_connection, pool as db_pool
+from config_cache import config_cache
+import event_rollups
+from event_hub import event_hub
+import metrics
 import time
 
 manager = VideoManager()
@@ -30,62 +36,74 @@ def history_page():
 
 @app.route("/video_feed/<int:camera_id>")
 def video_feed(camera_id):
+    # 串流規格：?profile=full|hd|sd|thumb，可再用 max_width / fps / quality 覆寫
+    profile = parse_profile(request.args)
+
     def generate():
-        while True:
-            # ✅ 改這裡：遍歷 .values()
-            for worker in manager.workers.values():
-                if worker.camera_id == camera_id:
-                    if hasattr(worker, "last_frame") and worker.last_frame is not None:
-                        _, buffer = cv2.imencode(".jpg", worker.last_frame)
-                        frame = buffer.tobytes()
-                        yield (b"--frame\r\n"
-                               b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
-                    break
-            time.sleep(0.03)
+        # 偵測系統可能尚未啟動完成，等到對應的廣播器出現
+        broadcaster = manager.get_broadcaster(camera_id)
+        while broadcaster is None:
+            time.sleep(1.0)
+            broadcaster = manager.get_broadcaster(camera_id)
+        # 同一規格的每張影格只編碼一次，由所有觀看者共用；沒有觀看者時不編碼
+        yield from broadcaster.subscribe(profile)
     return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 
 
 # ====== API ======
+def cached_json(key, loader, not_found=None):
+    """經由設定快取回應 JSON，並附 ETag；瀏覽器帶 If-None-Match 時回 304"""
+    value, etag = config_cache.get(key, loader)
+    if value is None and not_found is not None:
+        return jsonify(not_found), 404
+    resp = jsonify(value)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"   # 每次都向伺服器重新驗證
+    return resp.make_conditional(request)
+
+
 @app.route('/api/cameras')
 def get_cameras():
-    conn = get_db_connection()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT camera_id, camera_name, camera_url FROM cameras ORDER BY camera_id;")
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(data)
+    def load():
+        with db_cursor(dictionary=True) as cur:
+            cur.execute("SELECT camera_id, camera_name, camera_url FROM cameras ORDER BY camera_id;")
+            return cur.fetchall()
+    return cached_json(("cameras",), load)
 
 @app.route('/api/camera/<int:camera_id>')
 def get_camera(camera_id):
-    conn = get_db_connection()
-    cur = conn.cursor(dictionary=True)
-
-    # 讀取 camera 基本資料
-    cur.execute("""
-        SELECT camera_id, camera_name, camera_url,
-               falling_detection_mode, climbing_detection_mode
-        FROM cameras
-        WHERE camera_id = %s;
-    """, (camera_id,))
-    cam = cur.fetchone()
-
-    if not cam:
-        cur.close(); conn.close()
-        return jsonify({"error": "Camera not found"}), 404
-
-    # 讀取該攝影機的 schedule
-    cur.execute("""
-        SELECT function_type, start_time, end_time
-        FROM func_schedules
-        WHERE camera_id = %s
-          AND function_type IN ('falling', 'climbing')
-          AND is_active = 1;
-    """, (camera_id,))
-    schedules = cur.fetchall()
-
-    cur.close(); conn.close()
+    def load():
+        with db_cursor(dictionary=True) as cur:
+            # 讀取 camera 基本資料
+            cur.execute("""
+                SELECT camera_id, camera_name, camera_url,
+                       falling_detection_mode, climbing_detection_mode
+                FROM cameras
+                WHERE camera_id = %s;
+            """, (camera_id,))
+            cam = cur.fetchone()
+
+            if not cam:
+                return None
+
+            # 讀取該攝影機的 schedule
+            cur.execute("""
+                SELECT function_type, start_time, end_time
+                FROM func_schedules
+                WHERE camera_id = %s
+                  AND function_type IN ('falling', 'climbing')
+                  AND is_active = 1;
+            """, (camera_id,))
+            schedules = cur.fetchall()
+
+        cam["schedules"] = {
+            s["function_type"]: {
+                "start": fmt_time(s["start_time"]),
+                "end": fmt_time(s["end_time"])
+            } for s in schedules
+        }
+        return cam
 
     def fmt_time(t):
         """安全格式化 MySQL TIME 欄位（timedelta → HH:MM）"""
@@ -100,22 +118,13 @@ def get_camera(camera_id):
             return f"{h:02d}:{m:02d}"
         return str(t)
 
-    cam["schedules"] = {
-        s["function_type"]: {
-            "start": fmt_time(s["start_time"]),
-            "end": fmt_time(s["end_time"])
-        } for s in schedules
-    }
-
-    return jsonify(cam)
+    return cached_json(("camera", camera_id), load, not_found={"error": "Camera not found"})
 
 
 
 @app.route('/api/fence/<string:type>')
 def get_fence(type):
-    cam_id = request.args.get("camera_id")
-    conn = get_db_connection()
-    cur = conn.cursor(dictionary=True)
+    cam_id = request.args.get("camera_id", type=int)
 
     config = {
         "inout": {"table": "gates", "mode": "in_out_control_mode", "func": "in_out_control"},
@@ -131,36 +140,37 @@ def get_fence(type):
     mode_col = config[type]["mode"]
     func_type = config[type]["func"]
 
-    # --- 抓主表 ---
-    cur.execute(f"""
-        SELECT gate_id AS id, gate_name AS name, direction
-        FROM {table}
-        WHERE camera_id = %s AND {mode_col} = TRUE
-        ORDER BY gate_id;
-    """, (cam_id,))
-    items = cur.fetchall()
-
-    # --- 抓 schedule ---
-    cur.execute("""
-        SELECT gate_id, start_time, end_time
-        FROM func_schedules
-        WHERE function_type = %s AND is_active = 1;
-    """, (func_type,))
-    schedules = cur.fetchall()
-
-    sched_map = {
-        s["gate_id"]: {
-            "start_time": fmt_time(s["start_time"]),
-            "end_time": fmt_time(s["end_time"])
-        } for s in schedules
-    }
-
-    for g in items:
-        g.update(sched_map.get(g["id"], {"start_time": "--:--", "end_time": "--:--"}))
-
-    cur.close()
-    conn.close()
-    return jsonify(items)
+    def load():
+        with db_cursor(dictionary=True) as cur:
+            # --- 抓主表 ---
+            cur.execute(f"""
+                SELECT gate_id AS id, gate_name AS name, direction
+                FROM {table}
+                WHERE camera_id = %s AND {mode_col} = TRUE
+                ORDER BY gate_id;
+            """, (cam_id,))
+            items = cur.fetchall()
+
+            # --- 抓 schedule（只抓這支攝影機的）---
+            cur.execute("""
+                SELECT gate_id, start_time, end_time
+                FROM func_schedules
+                WHERE camera_id = %s AND function_type = %s AND is_active = 1;
+            """, (cam_id, func_type))
+            schedules = cur.fetchall()
+
+        sched_map = {
+            s["gate_id"]: {
+                "start_time": fmt_time(s["start_time"]),
+                "end_time": fmt_time(s["end_time"])
+            } for s in schedules
+        }
+
+        for g in items:
+            g.update(sched_map.get(g["id"], {"start_time": "--:--", "end_time": "--:--"}))
+        return items
+
+    return cached_json(("fence", cam_id, type), load)
 
 def fmt_time(t):
     """將 MySQL TIME (timedelta or str) 安全轉成 HH:MM"""
@@ -178,8 +188,6 @@ def fmt_time(t):
 @app.route('/api/fence/<string:type>/add', methods=['POST'])
 def add_fence(type):
     data = request.json
-    conn = get_db_connection()
-    cur = conn.cursor()
 
     if type == "inout":
         table, func_type, mode_col = "gates", "in_out_control", "in_out_control_mode"
@@ -193,51 +201,59 @@ def add_fence(type):
         return jsonify({"error": "invalid type"}), 400
 
     try:
-        # === Step 1. 新增主表 ===
-        cur.execute(f"""
-            INSERT INTO {table} (
-                camera_id, gate_name, polygon_json, direction, {mode_col}
-            ) VALUES (%s, %s, %s, %s, TRUE);
-        """, (
-            data["camera_id"],
-            data["name"],
-            json.dumps({"A": data["point_a"], "B": data["point_b"]}), 
-            data["direction"]
-        ))
-        obj_id = cur.lastrowid
-
-        # === Step 2. 新增對應的 schedule ===
-        cur.execute("""
-            INSERT INTO func_schedules (camera_id, gate_id, function_type, start_time, end_time, is_active)
-            VALUES (%s, %s, %s, %s, %s, 1);
-        """, (data["camera_id"], obj_id, func_type, data["start_time"], data["end_time"]))
-
-        conn.commit()
+        with db_cursor(commit=True) as cur:
+            # === Step 1. 新增主表 ===
+            cur.execute(f"""
+                INSERT INTO {table} (
+                    camera_id, gate_name, polygon_json, direction, {mode_col}
+                ) VALUES (%s, %s, %s, %s, TRUE);
+            """, (
+                data["camera_id"],
+                data["name"],
+                json.dumps({"A": data["point_a"], "B": data["point_b"]}), 
+                data["direction"]
+            ))
+            obj_id = cur.lastrowid
+
+            # === Step 2. 新增對應的 schedule ===
+            cur.execute("""
+                INSERT INTO func_schedules (camera_id, gate_id, function_type, start_time, end_time, is_active)
+                VALUES (%s, %s, %s, %s, %s, 1);
+            """, (data["camera_id"], obj_id, func_type, data["start_time"], data["end_time"]))
+
+        config_cache.invalidate(("fence", int(data["camera_id"])))
+        if func_type == "in_out_control":
+            manager.notify_gate_change(data["camera_id"], obj_id)   # 執行中的偵測器直接加入此門線
+        else:
+            manager.notify_analyzer_change(data["camera_id"])       # 區域類功能由分析器重新載入
         return jsonify({"status": "ok", "id": obj_id})
 
     except Exception as e:
-        conn.rollback()
         return jsonify({"status": "error", "message": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 
 # 更新 / 刪除圍籬
 @app.route('/api/gate_fence/<int:fence_id>', methods=['PUT', 'DELETE'])
 def update_or_delete_fence(fence_id):
-    conn = get_db_connection(); cur = conn.cursor()
-    if request.method == "DELETE":
-        cur.execute("DELETE FROM func_schedules WHERE id=%s;", (fence_id,))
-    else:
-        d = request.json
-        cur.execute("""
-            UPDATE func_schedules
-            SET fence_name=%s, direction=%s, start_time=%s, end_time=%s
-            WHERE id=%s;
-        """, (d["name"], d["direction"], d["start_time"], d["end_time"], fence_id))
-    conn.commit(); cur.close(); conn.close()
+    with db_cursor(commit=True) as cur:
+        # 先查出所屬攝影機，寫入後讓該攝影機的快取失效
+        cur.execute("SELECT camera_id, gate_id, function_type FROM func_schedules WHERE id=%s;", (fence_id,))
+        row = cur.fetchone()
+        if request.method == "DELETE":
+            cur.execute("DELETE FROM func_schedules WHERE id=%s;", (fence_id,))
+        else:
+            d = request.json
+            cur.execute("""
+                UPDATE func_schedules
+                SET fence_name=%s, direction=%s, start_time=%s, end_time=%s
+                WHERE id=%s;
+            """, (d["name"], d["direction"], d["start_time"], d["end_time"], fence_id))
+    if row:
+        config_cache.invalidate(("fence", row[0]), ("camera", row[0]))
+        if row[2] == "in_out_control":
+            manager.notify_gate_change(row[0], row[1])
+        else:
+            manager.notify_analyzer_change(row[0])
     return jsonify({"status": "ok"})
 
 @app.route("/api/mode/<mode>", methods=["POST"])
@@ -246,37 +262,32 @@ def update_mode(mode):
     camera_id = data["camera_id"]
     enabled = data["enabled"]
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
     try:
-        # 1️⃣ 更新 cameras 表
-        cur.execute(f"""
-            UPDATE cameras 
-            SET {mode}_detection_mode = %s 
-            WHERE camera_id = %s;
-        """, (enabled, camera_id))
-
-        # 2️⃣ 同步更新 func_schedules 啟用狀態
-        cur.execute("""
-            UPDATE func_schedules
-            SET is_active = %s
-            WHERE camera_id = %s AND function_type = %s;
-        """, (1 if enabled else 0, camera_id, mode))
-
-        conn.commit()
+        with db_cursor(commit=True) as cur:
+            # 1️⃣ 更新 cameras 表
+            cur.execute(f"""
+                UPDATE cameras 
+                SET {mode}_detection_mode = %s 
+                WHERE camera_id = %s;
+            """, (enabled, camera_id))
+
+            # 2️⃣ 同步更新 func_schedules 啟用狀態
+            cur.execute("""
+                UPDATE func_schedules
+                SET is_active = %s
+                WHERE camera_id = %s AND function_type = %s;
+            """, (1 if enabled else 0, camera_id, mode))
+
+        config_cache.invalidate(("camera", int(camera_id)), ("fence", int(camera_id)))
+        if mode == "in_out_control":
+            manager.notify_gate_change(camera_id)   # 影響該攝影機所有門線的排程
+        else:
+            manager.notify_analyzer_change(camera_id)   # 跌倒、攀爬等分析器啟用 / 停用
         return jsonify({"status": "ok", "message": f"{mode} mode updated"})
 
     except Exception as e:
-        conn.rollback()
         return jsonify({"status": "error", "message": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
-    return jsonify({"status": "ok", "message": f"{mode} mode updated"})
-
 @app.route("/api/schedule/<mode>", methods=["POST"])
 def update_schedule(mode):
     data = request.get_json()
@@ -284,38 +295,37 @@ def update_schedule(mode):
     start = data["start_time"]
     end = data["end_time"]
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # 檢查是否已有紀錄
-    cur.execute("""
-        SELECT COUNT(*) AS cnt FROM func_schedules
-        WHERE camera_id=%s AND function_type=%s;
-    """, (camera_id, mode))
-    exists = cur.fetchone()[0]
-
-    if exists:
-        # 更新既有時間設定
+    with db_cursor(commit=True) as cur:
+        # 檢查是否已有紀錄
         cur.execute("""
-            UPDATE func_schedules
-            SET start_time=%s, end_time=%s
-            WHERE camera_id=%s AND function_type=%s AND is_active=1;
-        """, (start, end, camera_id, mode))
+            SELECT COUNT(*) AS cnt FROM func_schedules
+            WHERE camera_id=%s AND function_type=%s;
+        """, (camera_id, mode))
+        exists = cur.fetchone()[0]
+
+        if exists:
+            # 更新既有時間設定
+            cur.execute("""
+                UPDATE func_schedules
+                SET start_time=%s, end_time=%s
+                WHERE camera_id=%s AND function_type=%s AND is_active=1;
+            """, (start, end, camera_id, mode))
+        else:
+            # 若沒有該相機的紀錄 → 新增一筆
+            cur.execute("""
+                INSERT INTO func_schedules (camera_id, function_type, start_time, end_time, is_active)
+                VALUES (%s, %s, %s, %s, 1);
+            """, (camera_id, mode, start, end))
+
+    config_cache.invalidate(("camera", int(camera_id)), ("fence", int(camera_id)))
+    if mode == "in_out_control":
+        manager.notify_gate_change(camera_id)
     else:
-        # 若沒有該相機的紀錄 → 新增一筆
-        cur.execute("""
-            INSERT INTO func_schedules (camera_id, function_type, start_time, end_time, is_active)
-            VALUES (%s, %s, %s, %s, 1);
-        """, (camera_id, mode, start, end))
-
-    conn.commit()
-    cur.close()
-    conn.close()
+        manager.notify_analyzer_change(camera_id)
     return jsonify({"status": "ok", "message": f"{mode} schedule updated"})
     
 @app.route("/api/reload_gates/<int:camera_id>", methods=["POST"])
 def reload_gates(camera_id):
-    from detector.video_manager import manager_instance
     worker = manager.workers.get(camera_id)
     if worker:
         worker.reload_gates()
@@ -324,14 +334,12 @@ def reload_gates(camera_id):
 
 @app.route('/api/events')
 def get_events():
-    conn = get_db_connection()
-    cur = conn.cursor(dictionary=True)
-
     # 取得查詢參數
     event_type = request.args.get("type")
     level = request.args.get("level")
     start = request.args.get("start")
     end = request.args.get("end")
+    camera_id = request.args.get("camera_id", type=int)
 
     query = """
         SELECT 
@@ -367,22 +375,271 @@ def get_events():
         query += " AND e.timestamp <= %s"
         params.append(end)
 
-    query += " ORDER BY e.timestamp DESC"
+    if camera_id:
+        query += " AND e.camera_id = %s"
+        params.append(camera_id)
+
+    # NDJSON 串流：大量匯出時用伺服器端 cursor 逐筆送出，不整包載入記憶體
+    if request.args.get("format") == "ndjson":
+        query += " ORDER BY e.timestamp DESC, e.event_id DESC"
+
+        def generate():
+            with db_connection() as conn:
+                cur = conn.cursor(dictionary=True, buffered=False)
+                done = False
+                try:
+                    cur.execute(query, params)
+                    for row in cur:
+                        yield app.json.dumps(row) + "\n"
+                    done = True
+                finally:
+                    if done:
+                        cur.close()
+                    else:
+                        # 客戶端中途斷線：結果未讀完，直接關閉連線，不讓歸還時的 rollback 讀完剩餘資料列
+                        conn.discard()
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    # 分頁：以 (timestamp, event_id) 為 keyset，需索引 events(timestamp, event_id)
+    limit = min(max(request.args.get("limit", 100, type=int), 1), 1000)
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            ts, eid = decode_event_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+        query += " AND (e.timestamp < %s OR (e.timestamp = %s AND e.event_id < %s))"
+        params += [ts, ts, eid]
+
+    query += " ORDER BY e.timestamp DESC, e.event_id DESC LIMIT %s"
+    params.append(limit + 1)
+
+    with db_cursor(dictionary=True) as cur:
+        cur.execute(query, params)
+        data = cur.fetchall()
+
+    next_cursor = None
+    if len(data) > limit:
+        data = data[:limit]
+        last = data[-1]
+        next_cursor = encode_event_cursor(last["timestamp"], last["event_id"])
+
+    return jsonify({"items": data, "next_cursor": next_cursor})
+
+
+@app.route('/api/events/stream')
+def stream_events():
+    """Server-Sent Events：即時推送新事件
+    ?camera_id=&type=&level= 於伺服器端過濾；斷線重連時依 Last-Event-ID 重播"""
+    camera_id = request.args.get("camera_id", type=int)
+    event_type = request.args.get("type")
+    level = request.args.get("level")
+    last_id = request.headers.get("Last-Event-ID", type=int)
+
+    def match(e):
+        return ((camera_id is None or e["camera_id"] == camera_id) and
+                (not event_type or e["event_type"] == event_type) and
+                (not level or e["alert_level"] == level))
+
+    resp = Response(event_hub.subscribe(last_id, match), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
 
-    cur.execute(query, params)
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
+# 事件影像（事件前後短片與縮圖）
+@app.route('/api/events/<int:event_id>/media')
+def get_event_media(event_id):
+    with db_cursor(dictionary=True) as cur:
+        cur.execute("""
+            SELECT m.clip_path, m.thumb_path
+            FROM events e
+            JOIN event_media m ON m.event_key = e.event_key
+            WHERE e.event_id = %s
+            ORDER BY m.id LIMIT 1;
+        """, (event_id,))
+        row = cur.fetchone()
+    if not row:
+        return jsonify({"error": "no media"}), 404
+    return jsonify({
+        "clip": f"/media/{row['clip_path']}" if row["clip_path"] else None,
+        "thumbnail": f"/media/{row['thumb_path']}" if row["thumb_path"] else None,
+    })
+
+
+@app.route('/media/<path:filename>')
+def event_media_file(filename):
+    return send_from_directory(os.path.abspath(os.getenv("CLIP_DIR", "data/clips")), filename)
+
+
+@app.route('/api/events/stats')
+def get_event_stats():
+    """時間分桶的事件計數（讀取預先彙總表）
+    ?bucket=minute|hour|day&start=&end=&camera_id=&gate_id=&type=&level=&group_by=camera,gate,type,level"""
+    bucket = request.args.get("bucket", "hour")
+    if bucket not in ("minute", "hour", "day"):
+        return jsonify({"error": "invalid bucket"}), 400
+    group_by = request.args.get("group_by", "camera,gate,type,level").split(",")
+
+    def parse_dt(value):
+        return datetime.datetime.fromisoformat(value) if value else None
 
-    return jsonify(data)
+    try:
+        start, end = parse_dt(request.args.get("start")), parse_dt(request.args.get("end"))
+    except ValueError:
+        return jsonify({"error": "invalid start/end"}), 400
+
+    rows = event_rollups.query_stats(
+        bucket=bucket, start=start, end=end,
+        camera_id=request.args.get("camera_id", type=int),
+        gate_id=request.args.get("gate_id", type=int),
+        event_type=request.args.get("type"),
+        alert_level=request.args.get("level"),
+        group_by=group_by,
+    )
+    return jsonify(rows)
+
+
+def encode_event_cursor(ts, event_id):
+    """分頁游標：(timestamp, event_id) → 不透明字串"""
+    raw = f"{ts.isoformat()}|{event_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_event_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        ts, eid = raw.split("|")
+        return datetime.datetime.fromisoformat(ts), int(eid)
+    except Exception as e:
+        raise ValueError(str(e))
+
+
+@app.route('/api/stats')
+def get_stats():
+    """連線池、擷取端與事件寫入的執行狀態"""
+    return jsonify({
+        "db_pool": db_pool.stats(),
+        "capture": manager.capture_stats(),
+        "tracks": manager.track_stats(),
+        "motion": manager.motion_stats(),
+        "clips": manager.clip_stats(),
+        "analyzers": manager.analyzer_stats(),
+        "events": manager.event_stats(),
+        "config_cache": config_cache.stats(),
+        "event_stream": event_hub.stats(),
+    })
+
+
+
+# =========================================================
+# 🔸 Prometheus 指標（/metrics）
+# =========================================================
+@app.before_request
+def _start_timer():
+    request._t0 = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    t0 = getattr(request, "_t0", None)
+    # 串流回應（/video_feed、SSE）只計到開始傳送為止
+    if t0 is not None and request.endpoint != "metrics_endpoint":
+        metrics.http_request_seconds.labels(
+            request.endpoint or "unknown", request.method, response.status_code
+        ).observe(time.perf_counter() - t0)
+    return response
+
+
+@metrics.registry.collector
+def _detector_metrics():
+    stage_hist = metrics.stage_histogram()   # 只用來輸出各攝影機的快照
+    lines = stage_hist.header()
+    for cid, snap in manager.stage_stats().items():
+        lines += stage_hist.render(snap, extra=("camera", cid))
+
+    capture = manager.capture_stats()
+    for key, name, help in (("captured", "capture_frames_total", "Frames decoded from the camera"),
+                            ("dropped", "capture_dropped_total", "Frames overwritten before the detector read them"),
+                            ("read_errors", "capture_read_errors_total", "Failed camera reads")):
+        lines += metrics.counter(name, help, [((cid,), s.get(key, 0)) for cid, s in capture.items()], ("camera",))
+    lines += metrics.gauge("capture_staleness_seconds", "Age of the frame handed to the detector",
+                           [((cid,), s.get("staleness_ms", 0) / 1000.0) for cid, s in capture.items()], ("camera",))
+
+    motion = manager.motion_stats()
+    lines += metrics.counter("detector_frames_total", "Frames processed by the detector",
+                             [((cid,), s.get("frames", 0)) for cid, s in motion.items()], ("camera",))
+    lines += metrics.counter("detector_inferred_frames_total", "Frames sent to YOLO inference",
+                             [((cid,), s.get("inferred", 0)) for cid, s in motion.items()], ("camera",))
+
+    tracks = manager.track_stats()
+    lines += metrics.gauge("detector_tracks", "Track ids with gate state",
+                           [((cid,), s.get("tracks", 0)) for cid, s in tracks.items()], ("camera",))
+    lines += metrics.counter("detector_tracks_evicted_total", "Track states removed by TTL or capacity",
+                             [((cid,), s.get("expired", 0) + s.get("evicted", 0)) for cid, s in tracks.items()],
+                             ("camera",))
+
+    analyzers = manager.analyzer_stats()
+    lines += metrics.counter("analyzer_events_total", "Events raised by per-camera analyzers",
+                             [((cid, name), s.get("events", 0)) for cid, a in analyzers.items()
+                              for name, s in a.items()], ("camera", "analyzer"))
+
+    inference = manager.inference_stats()
+    if inference:
+        lines += metrics.counter("inference_batches_total", "Inference batches run", [((), inference["batches"])])
+        lines += metrics.gauge("inference_pending", "Frames waiting for inference", [((), inference["pending"])])
+
+    viewers = []
+    for cid in manager.workers:
+        b = manager.get_broadcaster(cid)
+        if b is not None:
+            viewers.append(((cid,), b.stats()["viewers"]))
+    lines += metrics.gauge("stream_viewers", "Connected /video_feed viewers", viewers, ("camera",))
+    return lines
+
+
+@metrics.registry.collector
+def _service_metrics():
+    ev = manager.event_stats()
+    pool = db_pool.stats()
+    lines = []
+    if ev:
+        lines += metrics.gauge("event_queue_depth", "Events waiting to be written", [((), ev["queue_depth"])])
+        lines += metrics.counter("events_written_total", "Events written to the database", [((), ev["written"])])
+        lines += metrics.counter("events_dropped_total", "Events dropped because the queue was full",
+                                 [((), ev["dropped"])])
+        lines += metrics.counter("events_spooled_total", "Events spooled to disk", [((), ev["spooled"])])
+    lines += metrics.gauge("db_pool_connections", "DB pool connections by state",
+                           [(("in_use",), pool["in_use"]), (("idle",), pool["idle"])], ("state",))
+    lines += metrics.counter("db_pool_reconnects_total", "DB reconnects", [((), pool["reconnects"])])
+    lines += metrics.gauge("event_stream_subscribers", "Connected SSE clients",
+                           [((), event_hub.stats()["subscribers"])])
+    return lines
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 文字格式；指標只在此時彙整，平時幾乎無額外成本"""
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+_detection_lock = threading.Lock()
+_detection_started = False
 
 
 def start_detection_system():
+    """啟動偵測系統；重複呼叫（例如 dev server 重載、server.py 與 app.py 並用）不會再啟動一次"""
+    global _detection_started
+    with _detection_lock:
+        if _detection_started:
+            return False
+        _detection_started = True
     manager.load_all_cameras()   # 從資料庫撈出所有攝影機
     manager.start_all()          # 為每支攝影機啟動 YOLO 偵測 worker
+    return True
 
 
 if __name__ == "__main__":
+    # 開發用；正式環境請用 server.py（事件迴圈串流，少量執行緒）
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true":  # 只在重載後主進程啟動時執行
         threading.Thread(target=start_detection_system, daemon=True).start()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,77 @@
+# 推論後端準確度檢查：同一段錄影分別以 PyTorch 與指定後端重播，比對跨越判斷
+#   python -m benchmarks.backend_accuracy videos/door.mp4 --backend openvino-int8 --gates benchmarks/gates.json
+#
+#   - 事件以 (門線, 事件類型) 配對，允許 --tolerance 幀的時間差
+#   - recall：PyTorch 的事件有多少被重現；precision：後端的事件有多少是 PyTorch 也有的
+#   - 指定 --threads 時，兩次重播實際使用的執行緒數都必須等於指定值
+import argparse, json
+
+from benchmarks.replay import replay
+
+
+def match_events(ref, cand, tolerance):
+    """貪婪配對：每個參考事件找同門線、同類型且幀差最小的候選事件"""
+    unused = list(cand)
+    matched = 0
+    for e in ref:
+        best = None
+        for c in unused:
+            if c["gate_id"] != e["gate_id"] or c["event_type"] != e["event_type"]:
+                continue
+            d = abs(c["frame"] - e["frame"])
+            if d <= tolerance and (best is None or d < abs(best["frame"] - e["frame"])):
+                best = c
+        if best is not None:
+            unused.remove(best)
+            matched += 1
+    recall = matched / len(ref) if ref else 1.0
+    precision = matched / len(cand) if cand else 1.0
+    return matched, recall, precision
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare crossing decisions of a backend against PyTorch")
+    ap.add_argument("video")
+    ap.add_argument("--backend", required=True)
+    ap.add_argument("--gates", help="JSON gate definitions (same format as benchmarks.replay)")
+    ap.add_argument("--frames", type=int, default=0)
+    ap.add_argument("--threads", type=int)
+    ap.add_argument("--tolerance", type=int, default=3, help="allowed frame offset between matching events")
+    ap.add_argument("--min-recall", type=float, default=0.95)
+    ap.add_argument("--out", help="write both runs and the comparison as JSON")
+    args = ap.parse_args()
+
+    gates = None
+    if args.gates:
+        with open(args.gates) as f:
+            gates = json.load(f)
+
+    base = replay(args.video, gates, args.frames, backend="pytorch", threads=args.threads)
+    cand = replay(args.video, gates, args.frames, backend=args.backend, threads=args.threads)
+    matched, recall, precision = match_events(base["events"], cand["events"], args.tolerance)
+
+    print(f"video={args.video} frames={base['frames']}")
+    print(f"  {'backend':<14} {'threads':>7} {'fps':>7} {'p95 ms':>8} {'events':>7}")
+    for r in (base, cand):
+        print(f"  {r['backend']:<14} {str(r['threads']):>7} {r['fps']:7.2f} "
+              f"{r['latency_ms']['p95']:8.2f} {len(r['events']):7d}")
+    print(f"  matched={matched} recall={recall:.3f} precision={precision:.3f} (±{args.tolerance} frames)")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"baseline": base, "candidate": cand, "matched": matched,
+                       "recall": recall, "precision": precision}, f, indent=2, default=str)
+
+    ok = recall >= args.min_recall and precision >= args.min_recall
+    if not ok:
+        print(f"  BELOW THRESHOLD ({args.min_recall:.2f})")
+    if args.threads:
+        wrong = [r["backend"] for r in (base, cand) if r["threads"] != args.threads]
+        if wrong:
+            print(f"  THREADS NOT APPLIED ({', '.join(wrong)}; expected {args.threads})")
+            ok = False
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
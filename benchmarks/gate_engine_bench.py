@@ -0,0 +1,103 @@
+# 門線判斷微基準：純量迴圈 vs. 向量化 GateEngine（預設 50 人 × 30 條門線）
+#   python -m benchmarks.gate_engine_bench --people 50 --gates 30 --frames 300
+import argparse, time
+
+import numpy as np
+
+from detector.gate_engine import (GateEngine, side_sign, point_seg_dist, unit_normal,
+                                  COOLDOWN, MIN_NEAR, MIN_NORM_MOVE)
+
+
+class ScalarGates:
+    """原本 InOutDetector.run 內層迴圈的逐點版本（作為正確性與效能對照）"""
+
+    def __init__(self, gates):
+        self.gates = gates
+        self.last_side = {}   # gate_id → {tid / f"{tid}_x" / f"{tid}_y" → value}
+        self.last_evt = {}    # (gate_id, tid) → last_time
+
+    def step(self, feet, tids, tnow, now):
+        out = []
+        for i, (foot, tid) in enumerate(zip(feet, tids)):
+            for g in self.gates:
+                if g["a"][0] < 0 or g["b"][0] < 0:
+                    continue
+                last_side = self.last_side.setdefault(g["id"], {})
+                prev_side = last_side.get(tid, 0)
+                curr_side = side_sign(g["a"], g["b"], foot)
+                if curr_side == 0:
+                    curr_side = prev_side
+                if point_seg_dist(foot, g["a"], g["b"]) > MIN_NEAR:
+                    continue
+                if prev_side != 0 and curr_side != 0 and prev_side != curr_side:
+                    if tnow - self.last_evt.get((g["id"], tid), 0) < COOLDOWN:
+                        continue
+                    self.last_evt[(g["id"], tid)] = now
+                    nx, ny = unit_normal(g["a"], g["b"])
+                    dx = foot[0] - last_side.get(f"{tid}_x", foot[0])
+                    dy = foot[1] - last_side.get(f"{tid}_y", foot[1])
+                    norm_move = abs(dx * nx + dy * ny)
+                    last_side[f"{tid}_x"] = foot[0]
+                    last_side[f"{tid}_y"] = foot[1]
+                    if norm_move < MIN_NORM_MOVE:
+                        continue
+                    cross_dir = "A->B" if (prev_side > 0 and curr_side < 0) else "B->A"
+                    if (cross_dir == "A->B" and int(g["in_dir"]) == 1) or \
+                       (cross_dir == "B->A" and int(g["in_dir"]) == -1):
+                        state = "Entry"
+                    else:
+                        state = "inout"
+                    out.append((i, tid, g["id"], cross_dir, state))
+                last_side[tid] = curr_side
+        return out
+
+
+def make_scene(n_people, n_gates, n_frames, seed=0, w=1280, h=720):
+    """隨機門線與隨機漫步的腳點軌跡"""
+    rng = np.random.default_rng(seed)
+    gates = []
+    for k in range(n_gates):
+        a = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        b = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        gates.append({"id": k + 1, "name": f"G{k + 1}", "a": a, "b": b,
+                      "in_dir": int(rng.choice([1, -1]))})
+    pos = rng.uniform([0, 0], [w, h], size=(n_people, 2))
+    frames = []
+    for _ in range(n_frames):
+        pos = np.clip(pos + rng.normal(0, 12, size=pos.shape), 0, [w - 1, h - 1])
+        frames.append([(int(x), int(y)) for x, y in pos])
+    return gates, frames
+
+
+def run(n_people, n_gates, n_frames, fps=15.0):
+    gates, frames = make_scene(n_people, n_gates, n_frames)
+    tids = list(range(1, n_people + 1))
+    scalar, engine = ScalarGates(gates), GateEngine(gates)
+
+    def timed(fn):
+        results, t0 = [], time.perf_counter()
+        for k, feet in enumerate(frames):
+            t = k / fps
+            results.append(fn(feet, tids, t, t))
+        return results, time.perf_counter() - t0
+
+    ref, t_scalar = timed(scalar.step)
+    vec, t_vec = timed(lambda feet, tids, tnow, now:
+                       [(c.person, c.tid, c.gate["id"], c.cross_dir, c.state)
+                        for c in engine.step(np.array(feet), tids, tnow, now)])
+
+    n_events = sum(len(r) for r in ref)
+    print(f"people={n_people} gates={n_gates} frames={n_frames} crossings={n_events}")
+    print(f"  scalar : {1000 * t_scalar / n_frames:8.3f} ms/frame")
+    print(f"  numpy  : {1000 * t_vec / n_frames:8.3f} ms/frame  (x{t_scalar / t_vec:.1f})")
+    print(f"  match  : {ref == vec}")
+    return ref == vec
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--people", type=int, default=50)
+    ap.add_argument("--gates", type=int, default=30)
+    ap.add_argument("--frames", type=int, default=300)
+    args = ap.parse_args()
+    raise SystemExit(0 if run(args.people, args.gates, args.frames) else 1)
@@ -0,0 +1,233 @@
+# 偵測流程離線重播基準：不需攝影機與 MySQL
+#   python -m benchmarks.replay videos/door.mp4 --gates benchmarks/gates.json --out results/door.json
+#   python -m benchmarks.replay videos/door.mp4 --baseline results/door.json   # 與先前結果比較
+#
+#   - 門線由 JSON 指定（或預設畫面中央一條水平線），事件存在記憶體
+#   - 影格依影片時間軸處理（冷卻、排程判斷與實際處理速度無關），結果可重現
+#   - 輸出各階段耗時（decode / inference / gates / draw / publish / encode）、
+#     端到端 fps、p50/p95/p99 延遲與所有跨越事件
+import argparse, datetime, json, os, subprocess, time
+
+# db_utils 在 import 時讀取連線設定；重播不連資料庫，給預設值即可
+for key, value in (("DB_HOST", "localhost"), ("DB_PORT", "3306"), ("DB_NAME", "replay"),
+                   ("DB_USER", "replay"), ("DB_PASSWORD", "")):
+    os.environ.setdefault(key, value)
+
+import cv2
+import numpy as np
+
+from detector.detector_inout import InOutDetector
+from detector.inference_service import InferenceService
+from detector.schedule import ActiveSchedule
+from detector.overlay import draw_overlay
+
+STAGES = ("decode", "inference", "gates", "draw", "publish", "encode")
+
+
+class MemorySink:
+    """EventSink 的記憶體版本：只記錄，不寫資料庫"""
+
+    def __init__(self):
+        self.events = []
+        self.frame = 0
+
+    def emit(self, camera_id, gate_id, event_type, alert_level, timestamp=None, event_key=None):
+        self.events.append({"frame": self.frame, "camera_id": camera_id, "gate_id": gate_id,
+                            "event_type": event_type, "alert_level": alert_level})
+        return event_key or str(len(self.events))
+
+    def stop(self):
+        pass
+
+
+class ReplayDetector(InOutDetector):
+    """以固定門線（與指定的攝影機層級分析器）取代資料庫設定的 InOutDetector"""
+
+    def __init__(self, gates, *args, analyzers=(), **kwargs):
+        self._fixed_gates = gates
+        self._fixed_analyzers = analyzers
+        super().__init__(*args, **kwargs)
+
+    def _load_analyzer_configs(self):
+        # 全天排程；區域類分析器需要區域設定，重播不提供
+        return {name: None for name in self._fixed_analyzers}
+
+    def _load_gates(self, gate_id=None):
+        gates = []
+        for g in self._fixed_gates:
+            if gate_id is not None and g["id"] != gate_id:
+                continue
+            gates.append({
+                "id": g["id"],
+                "name": g.get("name", f"G{g['id']}"),
+                "a": tuple(g["a"]),
+                "b": tuple(g["b"]),
+                "in_dir": int(g.get("in_dir", 1)),
+                "start": g.get("start", "00:00:00"),
+                "end": g.get("end", "23:59:59"),
+                "schedule": ActiveSchedule.from_times(g.get("start"), g.get("end")),
+            })
+        return gates
+
+
+def default_gates(width, height):
+    return [{"id": 1, "name": "G1", "a": [width // 8, height // 2], "b": [width * 7 // 8, height // 2], "in_dir": 1}]
+
+
+def percentiles(samples):
+    if not samples:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ms = 1000.0 * np.asarray(samples)
+    return {
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def replay(video, gates=None, max_frames=0, model_path=None, imgsz=960,
+           jpeg_quality=80, warmup=5, backend=None, threads=None, analyzers=()):
+    inference = InferenceService(model_path=model_path, batch_size=1, imgsz=imgsz,
+                                 backend=backend, threads=threads)
+    sink = MemorySink()
+    det = ReplayDetector(gates or [], camera_id=0, camera_url=video, inference=inference, events=sink,
+                         analyzers=analyzers)
+    cap = det.grabber.cap   # 直接讀取，不經擷取執行緒的節流
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    if not gates:
+        w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        det._fixed_gates = default_gates(w, h)
+        det.gates = det._load_gates()
+        det.engine = det.engine.with_gates(det.gates)
+
+    timings = {s: [] for s in STAGES}
+    latency = []
+    # 分析器的 stage 為 analyze:<name>，出現時才加入
+    det.stage_timer = lambda stage, sec: timings.setdefault(stage, []).append(sec)
+
+    t_base = time.time()
+    k = 0
+    wall = 0.0
+    while max_frames <= 0 or k < max_frames:
+        t0 = time.perf_counter()
+        ok, frame = cap.read()
+        if not ok:
+            break
+        t1 = time.perf_counter()
+        sink.frame = k
+        overlay = det.process_frame(frame, tnow=t_base + k / fps, render=True)
+        t2 = time.perf_counter()
+        # 模擬一位觀看者：繪製疊圖後編碼
+        annotated = draw_overlay(frame, overlay)
+        t_draw = time.perf_counter()
+        cv2.imencode(".jpg", annotated, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        t3 = time.perf_counter()
+
+        if k < warmup:
+            # 前幾幀含模型初始化，不列入統計
+            for samples in timings.values():
+                samples.clear()
+        else:
+            timings["decode"].append(t1 - t0)
+            timings["draw"].append(t_draw - t2)
+            timings["encode"].append(t3 - t_draw)
+            latency.append(t3 - t0)
+            wall += t3 - t0
+        k += 1
+
+    cap.release()
+    inference.stop()
+    measured = len(latency)
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "video": video,
+        "video_fps": fps,
+        "frames": k,
+        "measured_frames": measured,
+        "backend": inference.backend.name,
+        "threads": inference.threads,
+        "imgsz": inference.imgsz,
+        "gates": det._fixed_gates,
+        "fps": round(measured / wall, 2) if wall else 0.0,
+        "latency_ms": percentiles(latency),
+        "stages_ms": {s: percentiles(v) for s, v in timings.items()},
+        "motion": det.motion_stats(),
+        "tracks": det.track_stats(),
+        "analyzers": det.analyzer_stats(),
+        "events": sink.events,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """與基準結果比較；fps 下降或 p95 延遲上升超過 tolerance 視為退步"""
+    print(f"  baseline {baseline.get('commit')} → {result.get('commit')}")
+    print(f"  {'stage':<10} {'p50 ms':>16} {'p95 ms':>16}")
+    for s in STAGES:
+        old, new = baseline["stages_ms"].get(s, {}), result["stages_ms"][s]
+        print(f"  {s:<10} {old.get('p50', 0):7.2f} → {new['p50']:7.2f} {old.get('p95', 0):7.2f} → {new['p95']:7.2f}")
+    print(f"  fps       {baseline['fps']:7.2f} → {result['fps']:7.2f}")
+    print(f"  events    {len(baseline['events']):7d} → {len(result['events']):7d}")
+
+    regressed = result["fps"] < baseline["fps"] * (1 - tolerance) \
+        or result["latency_ms"]["p95"] > baseline["latency_ms"]["p95"] * (1 + tolerance)
+    if regressed:
+        print(f"  REGRESSION (tolerance {tolerance:.0%})")
+    return not regressed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay recorded video through the detection pipeline")
+    ap.add_argument("video")
+    ap.add_argument("--gates", help="JSON file: [{id, name, a: [x, y], b: [x, y], in_dir, start, end}]")
+    ap.add_argument("--frames", type=int, default=0, help="stop after N frames (0 = whole file)")
+    ap.add_argument("--model", help="PyTorch weights (overrides --backend)")
+    ap.add_argument("--backend", help="pytorch / onnx / onnx-int8 / openvino / openvino-int8")
+    ap.add_argument("--threads", type=int)
+    ap.add_argument("--imgsz", type=int, default=960)
+    ap.add_argument("--analyzers", default="", help="comma-separated camera-level analyzers, e.g. falling,climbing")
+    ap.add_argument("--out", help="write results as JSON")
+    ap.add_argument("--baseline", help="previous results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.1)
+    args = ap.parse_args()
+
+    gates = None
+    if args.gates:
+        with open(args.gates) as f:
+            gates = json.load(f)
+
+    result = replay(args.video, gates, args.frames, args.model, args.imgsz,
+                    backend=args.backend, threads=args.threads,
+                    analyzers=[a for a in args.analyzers.split(",") if a])
+    print(f"video={args.video} frames={result['frames']} fps={result['fps']} "
+          f"events={len(result['events'])}")
+    print(f"  latency  p50={result['latency_ms']['p50']}ms p95={result['latency_ms']['p95']}ms "
+          f"p99={result['latency_ms']['p99']}ms")
+    for s in result["stages_ms"]:
+        st = result["stages_ms"][s]
+        print(f"  {s:<18} mean={st['mean']:7.2f}ms p95={st['p95']:7.2f}ms")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"[INFO] Results written to {args.out}")
+
+    ok = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            ok = compare(result, json.load(f), args.tolerance)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# 設定資料的讀取快取（攝影機、圍籬、排程）
+#   key 為 tuple，例如 ("cameras",)、("camera", 3)、("fence", 3, "inout")
+#   寫入 API 以前綴失效，例如 invalidate(("fence", 3)) 會清掉該攝影機所有圍籬
+import os, json, time, hashlib, threading
+
+
+class ConfigCache:
+    """TTL 快取，附帶內容 ETag 供瀏覽器重新驗證"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("CONFIG_CACHE_TTL", 30))
+        self._data = {}              # key → (expires, value, etag)
+        self._lock = threading.Lock()
+        self._generation = 0         # 每次失效遞增；載入期間被失效的結果不存入快取
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        """取得 (value, etag)；過期或不存在時呼叫 loader() 重新載入"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1], entry[2]
+            generation = self._generation
+        self.misses += 1
+        value = loader()
+        etag = hashlib.md5(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+        with self._lock:
+            # 載入途中有寫入 API 失效快取：這份資料可能是舊的，只回傳、不快取
+            if self._generation == generation:
+                self._data[key] = (now + self.ttl, value, etag)
+        return value, etag
+
+    def invalidate(self, *prefixes):
+        """移除所有以任一前綴開頭的 key"""
+        with self._lock:
+            self._generation += 1
+            for key in list(self._data):
+                if any(key[:len(p)] == p for p in prefixes):
+                    del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+config_cache = ConfigCache()
@@ -1,7 +1,9 @@
 # db_utils.py
-# 資料庫連線管理
-import mysql.connector, os
+# 資料庫連線管理（連線池）
+import mysql.connector, os, time, queue, threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from metrics import db_wait_seconds, db_cursor_seconds
 
 load_dotenv()
 
@@ -14,5 +16,204 @@ DB_CONFIG = {
     "ssl_disabled": False
 }
 
+
+class PooledConnection:
+    """連線池借出的連線；close() 會歸還連線而非真正關閉"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool._release(self._conn)
+            self._conn = None
+
+    def discard(self):
+        """不歸還，直接關閉連線（例如串流查詢未讀完，rollback 會先讀完剩餘的資料列）"""
+        if self._conn is not None:
+            self._pool._discard(self._conn)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """固定大小的 MySQL 連線池：借出時檢查連線健康，失效則重新連線"""
+
+    def __init__(self, size=None, timeout=None, ping_after=None, **config):
+        self.size = size or int(os.getenv("DB_POOL_SIZE", 8))
+        self.timeout = timeout or float(os.getenv("DB_POOL_TIMEOUT", 10))
+        # 閒置超過此秒數的連線在借出前先 ping（0 表示每次都檢查）
+        self.ping_after = ping_after if ping_after is not None else float(os.getenv("DB_POOL_PING_SEC", 30))
+        self.config = config or DB_CONFIG
+
+        self._idle = queue.LifoQueue()   # (conn, 歸還時間)
+        self._lock = threading.Lock()
+        self._created = 0
+
+        # 統計資料
+        self.checkouts = 0
+        self.reconnects = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    # =====================================================
+    # 🔹 借出 / 歸還
+    # =====================================================
+    def get(self):
+        t0 = time.time()
+        conn = self._acquire()
+        wait = time.time() - t0
+        db_wait_seconds.observe(wait)
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return PooledConnection(self, conn)
+
+    def _acquire(self):
+        try:
+            conn, released = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                return self._connect()
+            try:
+                conn, released = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"DB pool exhausted ({self.size} connections in use)")
+        if conn is None:
+            # 空名額（先前丟棄的連線）：建立新連線
+            return self._connect()
+        return self._check(conn, released)
+
+    def _connect(self):
+        """替已佔用的名額建立連線；失敗時把名額放回佇列，等待中的借用者才會被喚醒"""
+        try:
+            return mysql.connector.connect(**self.config)
+        except Exception:
+            self._idle.put((None, 0.0))
+            raise
+
+    def _check(self, conn, released):
+        """健康檢查：閒置太久就 ping，斷線則重連"""
+        if time.time() - released < self.ping_after:
+            return conn
+        try:
+            if conn.is_connected():   # 內部會送 ping
+                return conn
+        except Exception:
+            pass
+        self.reconnects += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+        return self._connect()
+
+    def _release(self, conn):
+        try:
+            # 結束未提交的交易，避免下一位使用者看到舊的快照
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            # 連線已損壞：丟棄，釋出名額
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.time()))
+
+    def _discard(self, conn):
+        """關閉連線並以空名額 (None) 放回佇列：名額總數不變，等待中的借用者會被喚醒"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self.reconnects += 1
+        self._idle.put((None, 0.0))
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "created": self._created,
+            "idle": self._idle.qsize(),   # 含尚未建立連線的空名額
+            "in_use": self._created - self._idle.qsize(),
+            "checkouts": self.checkouts,
+            "reconnects": self.reconnects,
+            "avg_wait_ms": round(1000.0 * self.total_wait / self.checkouts, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(1000.0 * self.max_wait, 3),
+        }
+
+
+pool = ConnectionPool()
+
+
 def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+    """從連線池借出連線；用完呼叫 close() 即歸還"""
+    return pool.get()
+
+
+@contextmanager
+def db_connection():
+    """with db_connection() as conn: ...（離開時自動歸還）"""
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def db_cursor(dictionary=False, commit=False):
+    """with db_cursor(dictionary=True) as cur: ...
+    commit=True 時正常離開自動 commit，發生例外則 rollback"""
+    t0 = time.time()
+    conn = pool.get()
+    cur = conn.cursor(dictionary=dictionary)
+    try:
+        yield cur
+        if commit:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            pass   # cursor 關閉失敗不影響歸還連線（損壞的連線由 _release 丟棄）
+        finally:
+            conn.close()
+            db_cursor_seconds.observe(time.time() - t0)
+
+
+# =========================================================
+# 🔸 結構檢查（唯讀；建立 / 變更結構請用 python -m event_sink init）
+# =========================================================
+def table_exists(*tables):
+    """目前資料庫是否已有全部指定的資料表"""
+    with db_cursor() as cur:
+        cur.execute(f"""
+            SELECT COUNT(*) FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({', '.join(['%s'] * len(tables))});
+        """, tables)
+        return cur.fetchone()[0] == len(set(tables))
+
+
+def column_exists(table, column):
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*) FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s;
+        """, (table, column))
+        return cur.fetchone()[0] > 0
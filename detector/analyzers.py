@@ -0,0 +1,422 @@
+# 單次推論、多功能分析：pose 推論與追蹤每幀只做一次，結果分送給各功能分析器
+#   - 分析器依攝影機的模式欄位啟用（cameras.*_detection_mode / gates.*_mode），不另外跑模型
+#   - 每個分析器自有狀態（每個 track 或每個區域一筆，逾時淘汰）與耗時統計（stage 標籤 analyze:<name>）
+#   - 新增功能：繼承 Analyzer、以 @register 登記，宣告模式欄位、function_type 與 analyze() 即可
+import os, json, datetime
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+import numpy as np
+
+from detector.schedule import ActiveSchedule, load_camera_schedules
+from detector.track_store import TrackStore
+from detector.zones import ZoneIndex, zone_polygon
+from db_utils import db_cursor
+
+# 一幀的共用結果（分析器只讀）；labels 為疊圖標籤清單，分析器可附加
+#   boxes (N, 4)、tids [N]、kps (N, 17, 2) 或 None、feet (N, 2)
+#   tnow：影格時間（重播時為影片時間軸）；now：排程與冷卻用時間；minute：minute_of_day(now)
+FrameResult = namedtuple("FrameResult", ["frame", "boxes", "tids", "kps", "feet", "tnow", "now", "minute", "labels"])
+
+# COCO 17 點關鍵點索引
+L_SHOULDER, R_SHOULDER, L_WRIST, R_WRIST, L_HIP, R_HIP = 5, 6, 9, 10, 11, 12
+
+ANALYZERS = {}   # name → 分析器類別
+
+
+def register(cls):
+    ANALYZERS[cls.name] = cls
+    return cls
+
+
+def _valid(kps, idx):
+    """(N,) 該關鍵點是否有偵測到（未偵測到的座標為 0）"""
+    return (kps[:, idx, 0] > 0) | (kps[:, idx, 1] > 0)
+
+
+# =========================================================
+# 🔸 分析器基底
+# =========================================================
+class Analyzer(ABC):
+    """由攝影機的偵測器每幀呼叫 analyze()；本身沒有執行緒與影像來源"""
+    name = None             # 登記名稱，也是 stage 標籤 analyze:<name>
+    table = "cameras"       # 模式欄位所在表："cameras"（整支攝影機）或 "gates"（區域）
+    mode = None             # 啟用欄位
+    function_type = None    # func_schedules.function_type
+    event_type = None
+    color = (0, 0, 255)
+
+    def __init__(self, camera_id, events, clips=None, config=None):
+        self.camera_id = camera_id
+        self.events = events
+        self.clips = clips
+        self.stage = f"analyze:{self.name}"
+        self.emitted = 0
+        self.configure(config)
+
+    def configure(self, config):
+        """套用新設定（排程 / 區域）；在偵測迴圈中呼叫，保留既有追蹤狀態"""
+        self.config = config
+
+    @abstractmethod
+    def analyze(self, res):
+        """處理一幀的 FrameResult；觸發事件時呼叫 _emit()"""
+
+    def stats(self):
+        return {"events": self.emitted}
+
+    def _emit(self, res, gate_id, schedule, label_xy, text, tnow):
+        # 排程時段內為 heavy，與門線事件相同；影像證據以 emit() 回傳的事件鍵對應
+        level = "heavy" if schedule is None or schedule.is_active(res.minute) else "light"
+        event_time = datetime.datetime.fromtimestamp(res.now).replace(microsecond=0)   # 重播時為影片時間
+        key = self.events.emit(self.camera_id, gate_id, self.event_type, level, timestamp=event_time)
+        if self.clips is not None and key:
+            self.clips.trigger(self.camera_id, key, gate_id, self.event_type, event_time, tnow)
+        res.labels.append((int(label_xy[0]), int(label_xy[1]), text, self.color))
+        self.emitted += 1
+        print(f"[{self.event_type.upper()}] camera={self.camera_id} {text} ({level})")
+
+
+class _Hold:
+    """單一 track 的持續判斷狀態"""
+    __slots__ = ("since", "last_evt", "base_y", "seen_frame", "seen_at")
+
+    def __init__(self, _=None):
+        self.since = 0.0        # 條件開始成立的時間，0 表示目前不成立
+        self.last_evt = 0.0     # 上次觸發時間（冷卻用）
+        self.base_y = None      # 爬高判斷用：雙手未舉高時的腳點高度
+        self.seen_frame = 0
+        self.seen_at = 0.0
+
+
+class TrackAnalyzer(Analyzer):
+    """逐人判斷的分析器：條件需持續 hold_sec 才觸發，同一 track 觸發後冷卻 cooldown 秒"""
+    hold_sec = 1.0
+    cooldown = 10.0
+
+    def __init__(self, camera_id, events, clips=None, config=None):
+        super().__init__(camera_id, events, clips, config)
+        self.tracks = TrackStore(factory=_Hold)
+        self.frame = 0
+
+    @abstractmethod
+    def hits(self, res, recs):
+        """回傳 (N,) bool：本幀各人是否符合條件；recs 為各人的 _Hold 狀態"""
+
+    def analyze(self, res):
+        self.frame += 1
+        tnow = res.tnow
+        if len(res.boxes):
+            recs = [self.tracks.touch(tid, None, self.frame, tnow) for tid in res.tids]
+            hits = self.hits(res, recs)
+            for i, rec in enumerate(recs):
+                if not hits[i]:
+                    rec.since = 0.0
+                    continue
+                if not rec.since:
+                    rec.since = tnow
+                if tnow - rec.since >= self.hold_sec and tnow - rec.last_evt >= self.cooldown:
+                    rec.last_evt = tnow
+                    x1, _, _, y2 = res.boxes[i]
+                    self._emit(res, None, self.config, (x1, y2 + 40),
+                               f"{self.event_type} tid={res.tids[i]}", tnow)
+        self.tracks.sweep(self.frame, tnow)
+
+    def stats(self):
+        return {"events": self.emitted, **self.tracks.stats()}
+
+
+# =========================================================
+# 🔸 攝影機層級分析器（cameras.*_detection_mode）
+# =========================================================
+@register
+class FallingAnalyzer(TrackAnalyzer):
+    """跌倒：軀幹（肩中點→髖中點）偏離垂直超過 FALL_ANGLE 度；
+    缺少關鍵點時改用人框寬高比（躺下時寬大於高）"""
+    name = "falling"
+    mode = "falling_detection_mode"
+    function_type = "falling"
+    event_type = "falling"
+
+    def __init__(self, camera_id, events, clips=None, config=None):
+        super().__init__(camera_id, events, clips, config)
+        self.angle = float(os.getenv("FALL_ANGLE", 60))
+        self.aspect = float(os.getenv("FALL_ASPECT", 1.3))
+        self.hold_sec = float(os.getenv("FALL_HOLD_SEC", 1.0))
+        self.cooldown = float(os.getenv("FALL_COOLDOWN_SEC", 10))
+
+    def hits(self, res, recs):
+        boxes = np.asarray(res.boxes, dtype=np.float32)
+        w = boxes[:, 2] - boxes[:, 0]
+        h = np.maximum(boxes[:, 3] - boxes[:, 1], 1.0)
+        fallen = w / h > self.aspect
+        kps = res.kps
+        if kps is None or kps.shape[1] < 17:
+            return fallen
+
+        ok = _valid(kps, L_SHOULDER) & _valid(kps, R_SHOULDER) & _valid(kps, L_HIP) & _valid(kps, R_HIP)
+        shoulder = (kps[:, L_SHOULDER] + kps[:, R_SHOULDER]) / 2
+        hip = (kps[:, L_HIP] + kps[:, R_HIP]) / 2
+        d = hip - shoulder
+        tilt = np.degrees(np.arctan2(np.abs(d[:, 0]), np.abs(d[:, 1])))
+        return np.where(ok, tilt > self.angle, fallen)
+
+
+@register
+class ClimbingAnalyzer(TrackAnalyzer):
+    """攀爬：雙手舉過肩膀，且腳點比雙手未舉高時上升超過人框高度的 CLIMB_RISE 倍"""
+    name = "climbing"
+    mode = "climbing_detection_mode"
+    function_type = "climbing"
+    event_type = "climbing"
+
+    def __init__(self, camera_id, events, clips=None, config=None):
+        super().__init__(camera_id, events, clips, config)
+        self.rise = float(os.getenv("CLIMB_RISE", 0.25))
+        self.hold_sec = float(os.getenv("CLIMB_HOLD_SEC", 1.0))
+        self.cooldown = float(os.getenv("CLIMB_COOLDOWN_SEC", 10))
+
+    def hits(self, res, recs):
+        n = len(res.boxes)
+        kps = res.kps
+        if kps is None or kps.shape[1] < 17:
+            return np.zeros(n, dtype=bool)
+
+        shoulder_y = np.minimum(np.where(_valid(kps, L_SHOULDER), kps[:, L_SHOULDER, 1], np.inf),
+                                np.where(_valid(kps, R_SHOULDER), kps[:, R_SHOULDER, 1], np.inf))
+        arms_up = (_valid(kps, L_WRIST) & _valid(kps, R_WRIST)
+                   & (kps[:, L_WRIST, 1] < shoulder_y) & (kps[:, R_WRIST, 1] < shoulder_y))
+        h = np.asarray(res.boxes[:, 3] - res.boxes[:, 1], dtype=np.float32)
+
+        out = np.zeros(n, dtype=bool)
+        for i, rec in enumerate(recs):
+            foot_y = float(res.feet[i][1])
+            if not arms_up[i] or rec.base_y is None:
+                rec.base_y = foot_y     # 正常行走時持續更新基準高度
+                continue
+            out[i] = rec.base_y - foot_y > self.rise * h[i]
+        return out
+
+
+# =========================================================
+# 🔸 區域分析器（gates.*_mode，座標存在 polygon_json）
+# =========================================================
+class ZoneAnalyzer(Analyzer):
+    """以區域為單位判斷；config 為區域清單 [{id, name, poly, schedule}]"""
+    table = "gates"
+
+    def configure(self, config):
+        self.config = config or []
+        if not hasattr(self, "index"):
+            self.index = ZoneIndex()
+        # 只重新點陣化座標有變動的區域
+        self.index.replace({z["id"]: z["poly"] for z in self.config})
+        self._slots = self.index.slots([z["id"] for z in self.config])
+
+    def membership(self, res):
+        """(N, Z) bool：每個腳點是否在各區域內（一次查表）"""
+        return self.index.membership(res.feet, self._slots)
+
+    def stats(self):
+        return {"events": self.emitted, "index": self.index.stats()}
+
+
+class _ZoneHold:
+    """單一 track 在各區域的持續判斷狀態：zone_id → [since, last_evt]"""
+    __slots__ = ("zones", "seen_frame", "seen_at")
+
+    def __init__(self, _=None):
+        self.zones = {}
+        self.seen_frame = 0
+        self.seen_at = 0.0
+
+
+@register
+class IntrusionAnalyzer(ZoneAnalyzer):
+    """區域入侵：有人腳點進入區域持續 INTRUSION_HOLD_SEC 秒；同一人同一區域冷卻 INTRUSION_COOLDOWN_SEC 秒"""
+    name = "intrusion"
+    mode = "intrusion_mode"
+    function_type = "intrusion"
+    event_type = "intrusion"
+
+    def __init__(self, camera_id, events, clips=None, config=None):
+        self.tracks = TrackStore(factory=_ZoneHold)
+        self.frame = 0
+        super().__init__(camera_id, events, clips, config)
+        self.hold_sec = float(os.getenv("INTRUSION_HOLD_SEC", 0.5))
+        self.cooldown = float(os.getenv("INTRUSION_COOLDOWN_SEC", 10))
+
+    def configure(self, config):
+        super().configure(config)
+        # 已刪除（或停用）的區域不再保留各 track 的判斷狀態
+        live = {z["id"] for z in self.config}
+        for _, rec in self.tracks.items():
+            for zid in [zid for zid in rec.zones if zid not in live]:
+                del rec.zones[zid]
+
+    def analyze(self, res):
+        self.frame += 1
+        tnow = res.tnow
+        if len(res.boxes) and self.config:
+            inside = self.membership(res)
+            for i, tid in enumerate(res.tids):
+                rec = self.tracks.touch(tid, None, self.frame, tnow)
+                for j, z in enumerate(self.config):
+                    st = rec.zones.setdefault(z["id"], [0.0, 0.0])
+                    if not inside[i, j]:
+                        st[0] = 0.0
+                        continue
+                    if not st[0]:
+                        st[0] = tnow
+                    if tnow - st[0] >= self.hold_sec and tnow - st[1] >= self.cooldown:
+                        st[1] = tnow
+                        x1, _, _, y2 = res.boxes[i]
+                        self._emit(res, z["id"], z["schedule"], (x1, y2 + 40),
+                                   f"{z['name']} intrusion", tnow)
+        self.tracks.sweep(self.frame, tnow)
+
+    def stats(self):
+        return {"events": self.emitted, "index": self.index.stats(), **self.tracks.stats()}
+
+
+class ZoneCountAnalyzer(ZoneAnalyzer):
+    """區域人數達 threshold 並持續 hold_sec 秒時觸發，每區域冷卻 cooldown 秒"""
+    threshold = 1
+    hold_sec = 1.0
+    cooldown = 30.0
+
+    def __init__(self, camera_id, events, clips=None, config=None):
+        self._since = {}    # zone_id → 條件開始成立時間
+        self._last = {}     # zone_id → 上次觸發時間
+        self.counts = {}    # zone_id → 最新人數
+        super().__init__(camera_id, events, clips, config)
+
+    def configure(self, config):
+        super().configure(config)
+        live = {z["id"] for z in self.config}
+        for state in (self._since, self._last, self.counts):
+            for zid in [zid for zid in state if zid not in live]:
+                del state[zid]
+
+    def analyze(self, res):
+        if not self.config:
+            return
+        tnow = res.tnow
+        counts = self.index.counts(res.feet, self._slots)
+        for j, z in enumerate(self.config):
+            zid, count = z["id"], int(counts[j])
+            self.counts[zid] = count
+            if count < self.threshold:
+                self._since.pop(zid, None)
+                continue
+            since = self._since.setdefault(zid, tnow)
+            if tnow - since >= self.hold_sec and tnow - self._last.get(zid, 0.0) >= self.cooldown:
+                self._last[zid] = tnow
+                x, y = z["poly"][0]
+                self._emit(res, zid, z["schedule"], (x, y + 20), f"{z['name']}: {count}", tnow)
+
+    def stats(self):
+        return {"events": self.emitted, "index": self.index.stats(), "counts": dict(self.counts)}
+
+
+@register
+class CrowdAnalyzer(ZoneCountAnalyzer):
+    """人數管制：區域內人數達 CROWD_MAX_PEOPLE"""
+    name = "crowd"
+    mode = "person_count_mode"
+    function_type = "crowd_count"
+    event_type = "crowd"
+
+    def __init__(self, camera_id, events, clips=None, config=None):
+        self.threshold = int(os.getenv("CROWD_MAX_PEOPLE", 5))
+        self.hold_sec = float(os.getenv("CROWD_HOLD_SEC", 3))
+        self.cooldown = float(os.getenv("CROWD_COOLDOWN_SEC", 60))
+        super().__init__(camera_id, events, clips, config)
+
+
+@register
+class PeopleAnalyzer(ZoneCountAnalyzer):
+    """人員偵測：區域內出現任何人"""
+    name = "people"
+    mode = "people_detect_mode"
+    function_type = "people_detect"
+    event_type = "people"
+    color = (0, 165, 255)
+
+    def __init__(self, camera_id, events, clips=None, config=None):
+        self.hold_sec = float(os.getenv("PEOPLE_HOLD_SEC", 1))
+        self.cooldown = float(os.getenv("PEOPLE_COOLDOWN_SEC", 30))
+        super().__init__(camera_id, events, clips, config)
+
+
+# =========================================================
+# 🔸 設定載入與建立
+# =========================================================
+def load_analyzer_configs(camera_id):
+    """查詢此攝影機啟用的分析器：name → config（資料庫查詢在呼叫端執行緒完成）。
+    攝影機層級的 config 為 ActiveSchedule（無排程時為 None，視為全天）；區域層級為區域清單"""
+    cam_types = [c for c in ANALYZERS.values() if c.table == "cameras"]
+    zone_types = [c for c in ANALYZERS.values() if c.table == "gates"]
+    zone_rows = []
+    with db_cursor(dictionary=True) as cur:
+        cur.execute(f"SELECT {', '.join(c.mode for c in cam_types)} FROM cameras WHERE camera_id=%s;",
+                    (camera_id,))
+        cam = cur.fetchone() or {}
+        if zone_types:
+            funcs = [c.function_type for c in zone_types]
+            cur.execute(f"""
+                SELECT g.gate_id, g.gate_name, g.polygon_json, {', '.join('g.' + c.mode for c in zone_types)},
+                       s.function_type, s.start_time, s.end_time
+                FROM gates g
+                LEFT JOIN func_schedules s
+                  ON g.gate_id=s.gate_id AND s.is_active=1
+                 AND s.function_type IN ({', '.join(['%s'] * len(funcs))})
+                WHERE g.camera_id=%s AND ({' OR '.join(f'g.{c.mode}=1' for c in zone_types)});
+            """, (*funcs, camera_id))
+            zone_rows = cur.fetchall()
+
+    configs = {}
+    enabled = [c for c in cam_types if cam.get(c.mode)]
+    if enabled:
+        schedules = load_camera_schedules(camera_id, tuple(c.function_type for c in enabled))
+        for c in enabled:
+            configs[c.name] = schedules.get(c.function_type)
+
+    for c in zone_types:
+        zones = {}
+        for r in zone_rows:
+            if not r[c.mode]:
+                continue
+            z = zones.get(r["gate_id"])
+            if z is None:
+                z = zones[r["gate_id"]] = {
+                    "id": r["gate_id"],
+                    "name": r["gate_name"],
+                    "poly": zone_polygon(json.loads(r["polygon_json"])),
+                    "schedule": None,
+                }
+            if r["function_type"] == c.function_type:
+                # 同一區域有多個時段時，併入同一張啟用表
+                if z["schedule"] is None:
+                    z["schedule"] = ActiveSchedule()
+                z["schedule"].add_times(r["start_time"], r["end_time"])
+        if zones:
+            configs[c.name] = list(zones.values())
+    return configs
+
+
+def build_analyzers(camera_id, configs, events, clips=None, current=()):
+    """依設定建立分析器清單；已存在的分析器只更新設定（保留追蹤狀態）"""
+    existing = {a.name: a for a in current}
+    out = []
+    for name, config in configs.items():
+        cls = ANALYZERS.get(name)
+        if cls is None:
+            continue
+        a = existing.get(name)
+        if a is not None:
+            a.configure(config)
+        else:
+            a = cls(camera_id, events, clips, config)
+        out.append(a)
+    return out
@@ -0,0 +1,273 @@
+# 推論後端：PyTorch / ONNX Runtime / OpenVINO（含 INT8 量化版本）
+#   - 全部透過 Ultralytics YOLO 載入，輸出（框、track id、關鍵點）與 PyTorch 版本相同
+#   - 部署時以 INFER_BACKEND / INFER_THREADS 選擇後端與執行緒數
+#   - 匯出（一次性）：
+#       python -m detector.backends export --backend onnx
+#       python -m detector.backends export --backend openvino-int8 --calib videos/door.mp4
+#       python -m detector.backends export --backend onnx-int8 --calib videos/door.mp4
+import argparse, glob, json, os
+from collections import namedtuple
+
+import numpy as np
+from ultralytics import YOLO
+
+MODEL_DIR = "models"
+BASE_NAME = "yolo11n-pose"
+
+# 後端 → 模型檔名（相對 MODEL_DIR）
+BACKENDS = {
+    "pytorch":       "{base}.pt",
+    "onnx":          "{base}.onnx",
+    "onnx-int8":     "{base}_int8.onnx",
+    "openvino":      "{base}_openvino_model",
+    "openvino-int8": "{base}_int8_openvino_model",
+}
+
+# name: 後端名稱；path: 模型路徑；imgsz: 匯出尺寸；dynamic: 是否可接受任意輸入尺寸
+# batch: 一次推論最多幾張（None 表示不限；固定形狀的匯出模型為匯出時的 batch）
+BackendInfo = namedtuple("BackendInfo", ["name", "path", "imgsz", "dynamic", "batch"])
+
+
+def model_path(backend, base=BASE_NAME, model_dir=MODEL_DIR):
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}, choose from {', '.join(BACKENDS)}")
+    return os.path.join(model_dir, BACKENDS[backend].format(base=base))
+
+
+def _sidecar(path):
+    return path.rstrip("/\\") + ".backend.json"
+
+
+def load(backend=None, threads=None, base=BASE_NAME, model_dir=MODEL_DIR):
+    """載入模型，回傳 (YOLO, BackendInfo)；執行緒數在 tune_threads() 暖機後套用"""
+    backend = backend or os.getenv("INFER_BACKEND", "pytorch")
+    path = model_path(backend, base, model_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; run: python -m detector.backends export --backend {backend}")
+
+    meta = {}
+    if os.path.exists(_sidecar(path)):
+        with open(_sidecar(path)) as f:
+            meta = json.load(f)
+    # PyTorch 可接受任意尺寸；匯出模型除非以 --dynamic 匯出，否則輸入尺寸與 batch 固定
+    dynamic = backend == "pytorch" or bool(meta.get("dynamic"))
+    info = BackendInfo(backend, path, meta.get("imgsz"), dynamic, None if dynamic else meta.get("batch", 1))
+
+    threads = threads if threads is not None else int(os.getenv("INFER_THREADS", 0))
+    if backend == "pytorch" and threads:
+        import torch
+        torch.set_num_threads(threads)
+    return YOLO(path, task="pose"), info
+
+
+def _autobackend(model):
+    return getattr(getattr(model, "predictor", None), "model", None)
+
+
+def tune_threads(model, info, threads=None):
+    """設定 ONNX Runtime / OpenVINO 的執行緒數。
+    Ultralytics 建立 session 時不提供此參數，暖機（第一次 predict）後以相同模型重建一次，
+    並重建 AutoBackend 依 session 產生的狀態（輸出名稱、io_binding）。"""
+    threads = threads if threads is not None else int(os.getenv("INFER_THREADS", 0))
+    if not threads or info.name == "pytorch":
+        return False
+    ab = _autobackend(model)
+    if ab is None:
+        return False
+
+    if info.name.startswith("onnx") and hasattr(ab, "session"):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        _rebind_onnx(ab, ort.InferenceSession(info.path, opts, providers=ab.session.get_providers()))
+        return True
+
+    if info.name.startswith("openvino") and hasattr(ab, "ov_compiled_model"):
+        import openvino as ov
+        core = ov.Core()
+        xml = glob.glob(os.path.join(info.path, "*.xml"))[0]
+        ab.ov_compiled_model = core.compile_model(
+            core.read_model(xml), "CPU",
+            config={"INFERENCE_NUM_THREADS": threads, "PERFORMANCE_HINT": "LATENCY"})
+        if hasattr(ab, "input_name"):
+            ab.input_name = ab.ov_compiled_model.input().get_any_name()
+        return True
+    return False
+
+
+def _rebind_onnx(ab, session):
+    """換上新 session：輸出名稱與 io_binding（GPU 上預先綁定的輸出張量）都綁在舊 session 上，需一併重建"""
+    ab.session = session
+    ab.output_names = [x.name for x in session.get_outputs()]
+    if getattr(ab, "io", None) is None:
+        return
+    ab.io = session.io_binding()
+    for output, y in zip(session.get_outputs(), ab.bindings):
+        ab.io.bind_output(name=output.name, device_type=y.device.type, device_id=y.device.index or 0,
+                          element_type=np.float16 if "float16" in output.type else np.float32,
+                          shape=tuple(y.shape), buffer_ptr=y.data_ptr())
+
+
+def session_threads(model, info):
+    """目前推論實際使用的執行緒數（由 session / 編譯後的模型讀回），無法得知時回傳 None"""
+    if info.name == "pytorch":
+        import torch
+        return torch.get_num_threads()
+    ab = _autobackend(model)
+    if info.name.startswith("onnx") and hasattr(ab, "session"):
+        return ab.session.get_session_options().intra_op_num_threads
+    if info.name.startswith("openvino") and hasattr(ab, "ov_compiled_model"):
+        return int(ab.ov_compiled_model.get_property("INFERENCE_NUM_THREADS"))
+    return None
+
+
+# =========================================================
+# 🔸 匯出與量化
+# =========================================================
+def letterbox(frame, imgsz):
+    """與 Ultralytics 相同的等比縮放 + 灰邊補齊，回傳 (1, 3, imgsz, imgsz) float32"""
+    import cv2
+    h, w = frame.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    img = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    img = cv2.copyMakeBorder(img, top, imgsz - nh - top, left, imgsz - nw - left,
+                             cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    img = img[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+    return np.ascontiguousarray(img)
+
+
+def calibration_frames(video, n, imgsz):
+    """從實際攝影機錄影中平均取 n 張作為量化校正資料"""
+    import cv2
+    cap = cv2.VideoCapture(video)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or n
+    frames = []
+    for idx in np.linspace(0, max(total - 1, 0), n).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(idx))
+        ok, frame = cap.read()
+        if ok:
+            frames.append(letterbox(frame, imgsz))
+    cap.release()
+    if not frames:
+        raise ValueError(f"no frames read from {video}")
+    return frames
+
+
+def _quantize_onnx(src, dst, calib, imgsz, n):
+    """ONNX Runtime 靜態量化（QDQ、per-channel），以錄影畫面校正"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = ort.InferenceSession(src, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    frames = calibration_frames(calib, n, imgsz)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.it = iter(frames)
+
+        def get_next(self):
+            x = next(self.it, None)
+            return None if x is None else {input_name: x}
+
+    quantize_static(src, dst, Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def export(backend, imgsz=960, calib=None, calib_frames=200, dynamic=False,
+           base=BASE_NAME, model_dir=MODEL_DIR):
+    """由 PyTorch 權重匯出指定後端的模型，並寫入 sidecar 設定"""
+    if backend == "pytorch":
+        raise ValueError("pytorch is the source model, nothing to export")
+    int8 = backend.endswith("-int8")
+    if int8 and not calib:
+        raise ValueError("INT8 export needs --calib <video> for calibration")
+    src = model_path("pytorch", base, model_dir)
+    dst = model_path(backend, base, model_dir)
+    model = YOLO(src)
+
+    if backend == "onnx":
+        out = model.export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True)
+    elif backend == "onnx-int8":
+        # 沿用既有的 FP32 ONNX 前先確認匯出設定相同，否則以本次設定重新匯出
+        fp32 = model_path("onnx", base, model_dir)
+        if not _same_export(fp32, imgsz, dynamic):
+            fp32 = str(model.export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True))
+            _write_sidecar(fp32, "onnx", imgsz, dynamic)   # 覆寫了 onnx 後端的模型，設定一併更新
+        _quantize_onnx(fp32, dst, calib, imgsz, calib_frames)
+        out = dst
+    else:
+        # OpenVINO INT8 由 Ultralytics 以 NNCF 量化，校正資料需為 dataset yaml；
+        # 這裡先以錄影畫面建立臨時資料集
+        kwargs = {}
+        if int8:
+            kwargs = {"int8": True, "data": _calib_dataset(calib, calib_frames, imgsz)}
+        out = model.export(format="openvino", imgsz=imgsz, dynamic=dynamic, **kwargs)
+
+    out = str(out)
+    if os.path.abspath(out) != os.path.abspath(dst) and os.path.exists(out):
+        os.replace(out, dst)
+    _write_sidecar(dst, backend, imgsz, dynamic, calib if int8 else None, calib_frames if int8 else 0)
+    print(f"[INFO] Exported {backend} model to {dst}")
+    return dst
+
+
+def _write_sidecar(path, backend, imgsz, dynamic, calib=None, calib_frames=0):
+    with open(_sidecar(path), "w") as f:
+        # 固定形狀的模型以 batch 1 匯出，InferenceService 依此限制批次大小
+        json.dump({"backend": backend, "imgsz": imgsz, "dynamic": dynamic, "batch": None if dynamic else 1,
+                   "int8": backend.endswith("-int8"), "calib": calib, "calib_frames": calib_frames},
+                  f, indent=2)
+
+
+def _same_export(path, imgsz, dynamic):
+    """path 已存在，且其 sidecar 記錄的 imgsz / dynamic 與指定值相同"""
+    try:
+        with open(_sidecar(path)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False   # 沒有 sidecar：無法確認匯出設定
+    return os.path.exists(path) and meta.get("imgsz") == imgsz and bool(meta.get("dynamic")) == dynamic
+
+
+def _calib_dataset(video, n, imgsz):
+    """把錄影取樣存成圖片資料夾，並產生 Ultralytics dataset yaml（只用於校正）"""
+    import cv2
+    root = os.path.abspath(os.path.join("data", "calib", os.path.splitext(os.path.basename(video))[0]))
+    img_dir = os.path.join(root, "images", "val")
+    os.makedirs(img_dir, exist_ok=True)
+    cap = cv2.VideoCapture(video)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or n
+    for k, idx in enumerate(np.linspace(0, max(total - 1, 0), n).astype(int)):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(idx))
+        ok, frame = cap.read()
+        if ok:
+            cv2.imwrite(os.path.join(img_dir, f"{k:05d}.jpg"), frame)
+    cap.release()
+    yaml_path = os.path.join(root, "calib.yaml")
+    with open(yaml_path, "w") as f:
+        f.write(f"path: {root}\ntrain: images/val\nval: images/val\n"
+                "kpt_shape: [17, 3]\nnames:\n  0: person\n")
+    return yaml_path
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Inference backend export / listing")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export", help="export the PyTorch model to another backend")
+    ex.add_argument("--backend", required=True, choices=[b for b in BACKENDS if b != "pytorch"])
+    ex.add_argument("--imgsz", type=int, default=960)
+    ex.add_argument("--calib", help="video file used for INT8 calibration")
+    ex.add_argument("--calib-frames", type=int, default=200)
+    ex.add_argument("--dynamic", action="store_true", help="allow any input size (needed for INFER_ROI)")
+    sub.add_parser("list", help="show which backends are available")
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        export(args.backend, args.imgsz, args.calib, args.calib_frames, args.dynamic)
+    else:
+        for name in BACKENDS:
+            path = model_path(name)
+            print(f"  {name:<14} {'ok ' if os.path.exists(path) else '-- '} {path}")
@@ -0,0 +1,221 @@
+# 每支攝影機一個 MJPEG 廣播器：每張新影格只編碼一次，所有觀看者共用
+#   - 同步觀看者（Flask / Werkzeug）以 subscribe() 阻塞等待新影格
+#   - 事件迴圈（server.py）以 add_listener() 取得新影格通知，再以 next_jpeg() 取圖，不佔執行緒
+import time, threading
+from collections import namedtuple
+from contextlib import contextmanager
+import cv2
+
+from metrics import stream_encode_seconds
+from detector.overlay import draw_overlay
+
+# 串流規格：max_width=0 表示不縮放
+StreamProfile = namedtuple("StreamProfile", ["max_width", "fps", "quality"])
+
+PROFILES = {
+    "full":  StreamProfile(0, 30, 95),      # 原始解析度（與舊版相同）
+    "hd":    StreamProfile(1280, 15, 80),   # 牆面監視器
+    "sd":    StreamProfile(640, 10, 70),    # 平板 / 手機
+    "thumb": StreamProfile(320, 5, 60),     # 總覽頁縮圖
+}
+DEFAULT_PROFILE = PROFILES["full"]
+_PROFILE_NAMES = {p: name for name, p in PROFILES.items()}
+
+
+def parse_profile(args):
+    """由查詢參數取得串流規格：?profile=sd&max_width=480&fps=8&quality=60"""
+    base = PROFILES.get(args.get("profile", ""), DEFAULT_PROFILE)
+
+    def pick(key, cast, lo, hi, default):
+        try:
+            return min(max(cast(args.get(key, default)), lo), hi)
+        except (TypeError, ValueError):
+            return default
+
+    return StreamProfile(
+        pick("max_width", int, 0, 4096, base.max_width),
+        pick("fps", float, 0.5, 30.0, base.fps),
+        pick("quality", int, 10, 100, base.quality),
+    )
+
+
+def profile_label(p):
+    return f"{p.max_width}w/{p.fps:g}fps/q{p.quality}"
+
+
+def profile_metric_label(p):
+    """指標標籤只用具名規格；以查詢參數覆寫的規格一律為 custom，避免標籤組合無限增長"""
+    return _PROFILE_NAMES.get(p, "custom")
+
+
+def mjpeg_part(jpeg):
+    """multipart/x-mixed-replace 的一段（boundary=frame）"""
+    return b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n"
+
+
+class _ProfileCache:
+    """單一串流規格的編碼快取"""
+    __slots__ = ("lock", "seq", "jpeg", "ts", "viewers", "encoded", "encode_hist")
+
+    def __init__(self, encode_hist):
+        self.lock = threading.Lock()
+        self.seq = 0          # jpeg 對應的影格序號
+        self.jpeg = None
+        self.ts = 0.0         # 編碼時間
+        self.viewers = 0
+        self.encoded = 0
+        self.encode_hist = encode_hist   # 編碼耗時直方圖（含縮圖）
+
+
+class FrameBroadcaster:
+    """偵測端 publish() 新影格；觀看者以 subscribe(profile) 取得 JPEG 串流。
+    編碼只在有觀看者、且影格有更新時進行；同一規格的結果帶序號供所有觀看者共用，
+    且每個規格的編碼頻率不超過其 fps。"""
+
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self._cond = threading.Condition()
+        self._frame = None      # 最新原始影格（未標註）
+        self._overlay = None    # 對應的疊圖資料，編碼前才繪製
+        self._seq = 0           # 最新影格序號
+        self._caches = {}       # StreamProfile → _ProfileCache
+        self._render_lock = threading.Lock()
+        self._rendered = (0, None)   # (seq, 已繪製疊圖的影格)，每個序號只畫一次
+        self.viewers = 0
+        self.on_viewers = None  # 觀看人數變化回呼（多行程模式用來通知子行程）
+        self._listeners = []    # 新影格通知回呼（在偵測執行緒呼叫，必須立即返回）
+
+    @property
+    def has_viewers(self):
+        return self.viewers > 0
+
+    # =====================================================
+    # 🔹 偵測端
+    # =====================================================
+    def publish(self, frame, overlay=None):
+        """放入新影格（與疊圖資料）並喚醒等待中的觀看者（不做任何繪圖或編碼）"""
+        with self._cond:
+            self._frame = frame
+            self._overlay = overlay
+            self._seq += 1
+            self._cond.notify_all()
+            listeners = self._listeners
+        for fn in listeners:
+            fn()
+
+    def add_listener(self, fn):
+        with self._cond:
+            self._listeners = self._listeners + [fn]   # 複本替換，publish 不需持鎖走訪
+
+    def remove_listener(self, fn):
+        with self._cond:
+            self._listeners = [f for f in self._listeners if f is not fn]
+
+    # =====================================================
+    # 🔹 觀看端
+    # =====================================================
+    def _encode(self, profile, seq, frame):
+        """取得該規格最新的 JPEG；同一序號只編碼一次，且不超過規格的 fps"""
+        cache = self._caches[profile]
+        with cache.lock:
+            now = time.time()
+            if cache.jpeg is not None and (cache.seq >= seq or now - cache.ts < 1.0 / profile.fps):
+                return cache.seq, cache.jpeg
+            h, w = frame.shape[:2]
+            if profile.max_width and w > profile.max_width:
+                frame = cv2.resize(frame, (profile.max_width, int(h * profile.max_width / w)),
+                                   interpolation=cv2.INTER_AREA)
+            ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, profile.quality])
+            cache.encode_hist.observe(time.time() - now)
+            if not ok:
+                return cache.seq, cache.jpeg
+            cache.seq, cache.jpeg, cache.ts = seq, buffer.tobytes(), now
+            cache.encoded += 1
+            return cache.seq, cache.jpeg
+
+    def wait(self, last_seq, timeout=5.0):
+        """等待比 last_seq 更新的影格，回傳 (seq, frame)；逾時回傳 (last_seq, None)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq, timeout)
+        return self.poll(last_seq)
+
+    def poll(self, last_seq):
+        """不等待：有比 last_seq 更新的影格時回傳 (seq, frame)，否則 (last_seq, None)"""
+        with self._cond:
+            seq, frame, overlay = self._seq, self._frame, self._overlay
+        if seq == last_seq:
+            return last_seq, None
+        return seq, self._render(seq, frame, overlay)
+
+    def next_jpeg(self, profile, last_seq):
+        """不等待地取得新影格的 JPEG：回傳 (影格 seq, JPEG 對應 seq, jpeg)；
+        沒有新影格時為 (last_seq, None, None)。繪圖與編碼在呼叫端執行緒進行"""
+        seq, frame = self.poll(last_seq)
+        if frame is None:
+            return last_seq, None, None
+        enc_seq, jpeg = self._encode(profile, seq, frame)
+        return seq, enc_seq, jpeg
+
+    def _render(self, seq, frame, overlay):
+        """畫上疊圖；多位觀看者、多種規格共用同一張結果"""
+        with self._render_lock:
+            if self._rendered[0] != seq:
+                self._rendered = (seq, draw_overlay(frame, overlay))
+            return self._rendered[1]
+
+    def _join(self, profile):
+        with self._cond:
+            self.viewers += 1
+            cache = self._caches.get(profile)
+            if cache is None:
+                cache = self._caches[profile] = _ProfileCache(
+                    stream_encode_seconds.labels(self.camera_id, profile_metric_label(profile)))
+            cache.viewers += 1
+            viewers = self.viewers
+        if self.on_viewers is not None:
+            self.on_viewers(viewers)
+
+    def _leave(self, profile):
+        with self._cond:
+            self.viewers -= 1
+            cache = self._caches[profile]
+            cache.viewers -= 1
+            if cache.viewers == 0:
+                del self._caches[profile]   # 沒人看的規格不保留快取
+            viewers = self.viewers
+        if self.on_viewers is not None:
+            self.on_viewers(viewers)
+
+    @contextmanager
+    def watching(self, profile):
+        """觀看期間計入觀看人數與該規格的快取"""
+        self._join(profile)
+        try:
+            yield self
+        finally:
+            self._leave(profile)
+
+    def subscribe(self, profile=DEFAULT_PROFILE):
+        """MJPEG 產生器：依規格的 fps 送出最新 JPEG"""
+        interval = 1.0 / profile.fps
+        with self.watching(profile):
+            seq, sent, next_at = 0, 0, 0.0
+            while True:
+                delay = next_at - time.time()
+                if delay > 0:
+                    time.sleep(delay)   # fps 節流
+                seq, frame = self.wait(seq)
+                if frame is None:
+                    continue
+                enc_seq, jpeg = self._encode(profile, seq, frame)
+                if jpeg is None or enc_seq == sent:
+                    continue
+                sent, next_at = enc_seq, time.time() + interval
+                yield mjpeg_part(jpeg)
+
+    def stats(self):
+        with self._cond:
+            profiles = {profile_label(p):
+                        {"viewers": c.viewers, "encoded": c.encoded}
+                        for p, c in self._caches.items()}
+        return {"viewers": self.viewers, "published": self._seq, "profiles": profiles}
@@ -0,0 +1,272 @@
+# 事件影像證據：事件前後 N 秒的短片與縮圖
+#   - 每支攝影機一個環形緩衝，存壓縮後的 JPEG（降低解析度與幀率），總記憶體有上限
+#   - 偵測迴圈只把影格參照丟進有界佇列（滿了就丟），壓縮、組片、寫檔都在背景執行緒
+#   - 等待中的原始影格也計入記憶體上限；事件後畫面是否到齊以影格時間（與觸發相同的時鐘）判斷
+#   - 寫好的檔案記錄在 event_media 表，以 event_key（EventSink.emit 的回傳值）對應 events；
+#     資料表由 python -m event_sink init 建立，執行期只檢查是否存在
+import os, time, queue, threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+from db_utils import db_cursor, table_exists
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS event_media (
+        id          INT AUTO_INCREMENT PRIMARY KEY,
+        event_key   CHAR(32)     NOT NULL,
+        camera_id   INT          NOT NULL,
+        gate_id     INT          NULL,
+        event_type  VARCHAR(32)  NOT NULL,
+        event_time  DATETIME     NOT NULL,
+        clip_path   VARCHAR(255) NULL,
+        thumb_path  VARCHAR(255) NULL,
+        created_at  DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        KEY idx_event_key (event_key)
+    );
+"""
+
+INSERT_SQL = """
+    INSERT INTO event_media (event_key, camera_id, gate_id, event_type, event_time, clip_path, thumb_path)
+    VALUES (%s, %s, %s, %s, %s, %s, %s);
+"""
+
+
+def ensure_table():
+    with db_cursor(commit=True) as cur:
+        cur.execute(CREATE_SQL)
+
+
+class _Ring:
+    __slots__ = ("frames", "bytes", "last_push")
+
+    def __init__(self):
+        self.frames = deque()   # (ts, jpeg bytes)
+        self.bytes = 0
+        self.last_push = 0.0
+
+
+class ClipRecorder:
+    def __init__(self, root=None, pre_sec=None, post_sec=None, fps=None, budget_mb=None,
+                 max_width=None, quality=None, queue_size=None, wait_sec=None):
+        self.root = root or os.getenv("CLIP_DIR", "data/clips")
+        self.pre_sec = pre_sec or float(os.getenv("CLIP_PRE_SEC", 5))
+        self.post_sec = post_sec or float(os.getenv("CLIP_POST_SEC", 5))
+        self.fps = fps or float(os.getenv("CLIP_FPS", 10))
+        self.max_width = max_width or int(os.getenv("CLIP_MAX_WIDTH", 960))
+        self.quality = quality or int(os.getenv("CLIP_QUALITY", 70))
+        # 攝影機停止送影格時，最多再等這麼久（實際經過秒數）就用現有畫面組片
+        self.wait_sec = wait_sec or float(os.getenv("CLIP_WAIT_SEC", 10))
+        # 所有攝影機共用的緩衝上限（bytes）：壓縮後的環形緩衝 + 佇列中等待壓縮的原始影格
+        self.budget = int((budget_mb or float(os.getenv("CLIP_BUFFER_MB", 256))) * 1024 * 1024)
+        self.used = 0
+        self.queued = 0
+
+        self._rings = {}                 # camera_id → _Ring（只由壓縮執行緒修改）
+        # 等待事件後畫面的觸發：(camera_id, event_key, gate_id, event_type, event_time, ts, expires)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._ingest = queue.Queue(maxsize=queue_size or int(os.getenv("CLIP_QUEUE_SIZE", 32)))
+        self._writes = queue.Queue(maxsize=64)
+        self._media_table = None         # event_media 是否存在（第一次寫入時檢查一次）
+        self.running = True
+
+        # 統計資料
+        self.buffered = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.clips = 0
+        self.skipped = 0                 # 觸發時緩衝區內沒有影格，未產生短片
+        self.failed = 0
+
+        threading.Thread(target=self._compress_loop, daemon=True).start()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    # =====================================================
+    # 🔹 偵測端（不阻塞）
+    # =====================================================
+    def push(self, camera_id, frame, ts):
+        """放入一張原始影格（參照）；依 CLIP_FPS 取樣，佇列滿時直接丟棄"""
+        ring = self._rings.get(camera_id)
+        if ring is not None and ts - ring.last_push < 1.0 / self.fps:
+            return
+        nbytes = frame.nbytes
+        with self._lock:
+            # 原始影格遠大於壓縮後，佇列中的影格最多佔上限的一半
+            if self.queued + nbytes > self.budget // 2:
+                self.dropped += 1
+                return
+            self.queued += nbytes
+        try:
+            self._ingest.put_nowait((camera_id, frame, ts))
+        except queue.Full:
+            with self._lock:
+                self.queued -= nbytes
+            self.dropped += 1
+            return
+        if ring is not None:
+            ring.last_push = ts
+
+    def trigger(self, camera_id, event_key, gate_id, event_type, event_time, ts):
+        """事件發生：等事件後 post_sec 的畫面進來再組成短片。
+        event_key 為 EventSink.emit() 的回傳值；ts 與 push() 的影格時間同一個時鐘"""
+        expires = time.monotonic() + self.post_sec + self.wait_sec
+        with self._lock:
+            self._pending.append((camera_id, event_key, gate_id, event_type, event_time, ts, expires))
+
+    def stop(self):
+        self.running = False
+        try:
+            self._ingest.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def stats(self):
+        return {
+            "budget_mb": round(self.budget / 1048576, 1),
+            "used_mb": round(self.used / 1048576, 1),
+            "queued_mb": round(self.queued / 1048576, 1),
+            "buffered_frames": sum(len(r.frames) for r in list(self._rings.values())),
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+            "pending": len(self._pending),
+            "clips": self.clips,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
+
+    # =====================================================
+    # 🔹 壓縮與環形緩衝（背景）
+    # =====================================================
+    def _compress_loop(self):
+        while self.running:
+            try:
+                item = self._ingest.get(timeout=0.5)
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item:
+                self._append(*item)
+                with self._lock:
+                    self.queued -= item[1].nbytes
+            self._collect_due()
+
+    def _append(self, camera_id, frame, ts):
+        h, w = frame.shape[:2]
+        if w > self.max_width:
+            frame = cv2.resize(frame, (self.max_width, int(h * self.max_width / w)), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        data = buf.tobytes()
+        ring = self._rings.get(camera_id)
+        if ring is None:
+            ring = self._rings[camera_id] = _Ring()
+        ring.last_push = ts
+        ring.frames.append((ts, data))
+        ring.bytes += len(data)
+        self.used += len(data)
+        self.buffered += 1
+
+        # 超過保留時間（事件前 + 事件後）的影格移除
+        keep = self.pre_sec + self.post_sec
+        while ring.frames and ring.frames[0][0] < ts - keep:
+            self._pop(ring)
+        # 總量（含佇列中的原始影格）超過上限：從用量最大的攝影機淘汰最舊影格
+        while self.used + self.queued > self.budget:
+            biggest = max(self._rings.values(), key=lambda r: r.bytes)
+            if not biggest.frames:
+                break
+            self._pop(biggest)
+            self.evicted += 1
+
+    def _pop(self, ring):
+        _, data = ring.frames.popleft()
+        ring.bytes -= len(data)
+        self.used -= len(data)
+
+    def _collect_due(self):
+        """緩衝中已有事件後 post_sec 的影格（或等待逾時）的觸發，取出影格交給寫檔執行緒。
+        影格時間與觸發時間都來自偵測端（重播時為影片時間軸），不和本機時鐘比較"""
+        now = time.monotonic()
+        with self._lock:
+            pending, self._pending = self._pending, []
+        due, waiting = [], []
+        for p in pending:
+            ring = self._rings.get(p[0])
+            newest = ring.frames[-1][0] if ring is not None and ring.frames else None
+            ready = (newest is not None and newest >= p[5] + self.post_sec) or now >= p[6]
+            (due if ready else waiting).append(p)
+        if waiting:
+            with self._lock:
+                self._pending = waiting + self._pending
+        for camera_id, event_key, gate_id, event_type, event_time, ts, _ in due:
+            ring = self._rings.get(camera_id)
+            frames = [f for f in ring.frames if ts - self.pre_sec <= f[0] <= ts + self.post_sec] if ring else []
+            try:
+                self._writes.put_nowait((camera_id, event_key, gate_id, event_type, event_time, ts, frames))
+            except queue.Full:
+                self.failed += 1
+
+    # =====================================================
+    # 🔹 寫檔與資料庫紀錄（背景）
+    # =====================================================
+    def _write_loop(self):
+        while self.running or not self._writes.empty():
+            try:
+                job = self._writes.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                if self._write(*job):
+                    self.clips += 1
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[WARN] Clip write failed: {e}")
+
+    def _write(self, camera_id, event_key, gate_id, event_type, event_time, ts, frames):
+        """寫出縮圖與短片並記錄到 event_media；沒有影格可寫時回傳 False"""
+        if not frames:
+            return False
+        folder = os.path.join(self.root, str(camera_id), event_time.strftime("%Y%m%d"))
+        os.makedirs(folder, exist_ok=True)
+        # 同一秒、同一門線可能有多筆事件，檔名加上事件鍵區分
+        base = os.path.join(folder, f"{event_time:%H%M%S}_{gate_id or 0}_{event_type}_{event_key[:12]}")
+
+        # 縮圖：最接近事件時間的影格，直接使用已壓縮的 JPEG
+        thumb = min(frames, key=lambda f: abs(f[0] - ts))[1]
+        thumb_path = base + ".jpg"
+        with open(thumb_path, "wb") as f:
+            f.write(thumb)
+
+        clip_path = base + ".mp4"
+        writer = None
+        try:
+            for _, data in frames:
+                img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if img is None:
+                    continue
+                if writer is None:
+                    h, w = img.shape[:2]
+                    writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (w, h))
+                writer.write(img)
+        finally:
+            if writer is not None:
+                writer.release()
+
+        if self._media_table is None:
+            # 資料庫無法連線時例外向上拋（計入 failed），下一段短片再檢查
+            self._media_table = table_exists("event_media")
+            if not self._media_table:
+                print("[WARN] event_media table missing, clips will not be linked; run: python -m event_sink init")
+        if not self._media_table:
+            return True
+        with db_cursor(commit=True) as cur:
+            cur.execute(INSERT_SQL, (event_key, camera_id, gate_id, event_type, event_time,
+                                     os.path.relpath(clip_path, self.root),
+                                     os.path.relpath(thumb_path, self.root)))
+        return True
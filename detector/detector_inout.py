@@ -1,64 +1,61 @@
 # detector/detector_inout.py
-import cv2, math, time, datetime, json
-from ultralytics import YOLO
+import cv2, os, time, datetime, json, queue
+import numpy as np
 from detector.detector_base import DetectorBase
-from db_utils import get_db_connection
+from detector.gate_engine import GateEngine
+from detector.inference_service import InferenceService, EMPTY_DETECTIONS
+from detector.frame_source import FrameGrabber
+from detector.motion import MotionGate
+from detector.roi import GateROI
+from detector.overlay import Overlay, draw_overlay
+from detector.broadcaster import FrameBroadcaster
+from detector.schedule import ActiveSchedule, minute_of_day
+from detector.analyzers import FrameResult, load_analyzer_configs, build_analyzers
+from db_utils import db_cursor
+from event_sink import EventSink
+import metrics
 from datetime import timedelta
 
 # =========================================================
 # 🔸 輔助工具類別與函式
 # =========================================================
 class GateRuntime:
-    """用於儲存每個 gate 的即時狀態"""
+    """用於儲存每個 gate 的即時顯示狀態（跨越狀態由 GateEngine 管理）"""
     def __init__(self):
-        self.last_side = {}      # 每個 tid 上一幀在哪一側
         self.flash_color = None  # 閃爍顏色
         self.flash_until = 0     # 顯示時間
 
 
-def side_sign(a, b, p) -> int:
-    """以 A->B 的左法向量判斷點 p 位於 A 側(-1)、B 側(+1) 或 線上(0)。"""
-    ax, ay = a; bx, by = b; px, py = p
-    vx, vy = bx - ax, by - ay
-    nx, ny = -vy, vx  # 左法向（未正規化也可以）
-    s = (px - ax) * nx + (py - ay) * ny
-    if s > 0:  return +1   # B 側（左側）
-    if s < 0:  return -1   # A 側（右側）
-    return 0               # 線上
-
-def point_seg_dist(p, a, b):
-    """計算點 p 到線段 AB 的距離"""
-    ax, ay = a; bx, by = b; px, py = p
-    vx, vy = bx-ax, by-ay
-    if vx == 0 and vy == 0: return math.hypot(px-ax, py-ay)
-    t = ((px-ax)*vx + (py-ay)*vy) / float(vx*vx + vy*vy)
-    t = max(0.0, min(1.0, t))
-    cx, cy = ax + t*vx, ay + t*vy
-    return math.hypot(px-cx, py-cy)
-
-
-
-def is_inside(side_val, in_dir):
-    """根據門線方向與外積符號判定是否在內側"""
-    # in_dir: +1 表示 A→B 方向為內部，-1 表示相反
-    if in_dir == 1:
-        return side_val > 0
-    else:
-        return side_val < 0
-
-
 # =========================================================
 # 🔸 主類別
 # =========================================================
 class InOutDetector(DetectorBase):
-    def __init__(self, camera_id, camera_url):
+    def __init__(self, camera_id, camera_url, inference=None, events=None, clips=None):
         super().__init__(camera_id, camera_url)
-        self.model = YOLO("models/yolo11n-pose.pt") 
+        # 由 VideoManager 傳入共用推論服務與事件寫入器；單獨使用時自行建立
+        self.inference = inference or InferenceService(batch_size=1)
+        self.events = events or EventSink()
+        self.clips = clips  # ClipRecorder（事件前後影像），None 表示不錄
         self.gates = self._load_gates()
+        self.engine = GateEngine(self.gates)  # 向量化門線跨越判斷
         self.rt = {}  # GateRuntime 暫存
-        self.cap = cv2.VideoCapture(camera_url)
+        self._gate_updates = queue.SimpleQueue()  # 門線變更，由偵測迴圈在幀與幀之間套用
+        # 其他功能（跌倒、攀爬、區域入侵、人數…）共用同一次推論結果，依模式欄位啟用
+        self.analyzers = build_analyzers(camera_id, self._load_analyzer_configs(), self.events, self.clips)
+        self._analyzer_updates = queue.SimpleQueue()  # 分析器設定變更，同樣在幀與幀之間套用
+        self.grabber = FrameGrabber(camera_url)  # 獨立擷取執行緒，只保留最新影格
+        self.motion = MotionGate()  # 畫面靜止且無人時降低推論頻率
+        self._people = 0  # 上一次推論的人數
+        self.use_roi = os.getenv("INFER_ROI", "0") == "1"  # 只對門線附近區域推論
+        self.roi = None  # GateROI，門線或影格大小變動時重建
+        self._roi_gates = None  # 建立 self.roi 時的門線清單
+        self.broadcaster = FrameBroadcaster(camera_id)  # /video_feed 觀看者共用的 JPEG 編碼
+        # 無桌面環境（伺服器）不呼叫 imshow / waitKey；Linux 沒有 DISPLAY 時預設開啟
+        self.headless = os.getenv("HEADLESS", "0" if os.name == "nt" or os.getenv("DISPLAY") else "1") == "1"
+        self._last = None  # 最新一幀的原始影格與偵測結果（參照）
+        self.stage_hist = metrics.stage_histogram()  # 各階段耗時直方圖（/metrics）
+        self.stage_timer = lambda stage, sec: self.stage_hist.labels(stage).observe(sec)
         self.FLASH_SEC = 1.5  # 閃爍時間
-        self.conf = 0.3  
 
     # =====================================================
     # 🔹 將 MySQL TIME / timedelta 轉成 HH:MM:SS
@@ -80,19 +77,31 @@ class InOutDetector(DetectorBase):
     # =====================================================
     # 🔹 從資料庫載入門線設定
     # =====================================================
-    def _load_gates(self):
-        conn = get_db_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
+    def _load_gates(self, gate_id=None):
+        """載入此攝影機的門線；指定 gate_id 時只查該門線（查無代表已停用或刪除）"""
+        query = """
             SELECT g.gate_id, g.gate_name, g.direction AS in_direction, g.polygon_json,
                    s.start_time, s.end_time
             FROM gates g
             LEFT JOIN func_schedules s
               ON g.gate_id=s.gate_id AND s.function_type='in_out_control' AND s.is_active=1
-            WHERE g.camera_id=%s AND g.in_out_control_mode=1;
-        """, (self.camera_id,))
+            WHERE g.camera_id=%s AND g.in_out_control_mode=1
+        """
+        params = [self.camera_id]
+        if gate_id is not None:
+            query += " AND g.gate_id=%s"
+            params.append(gate_id)
+        with db_cursor(dictionary=True) as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
         gates = []
-        for g in cur.fetchall():
+        by_id = {}
+        for g in rows:
+            # 同一門線有多個時段時，併入同一張啟用表
+            if g["gate_id"] in by_id:
+                by_id[g["gate_id"]]["schedule"].add_times(g["start_time"], g["end_time"])
+                continue
+
             coords = json.loads(g["polygon_json"])
             frame_h, frame_w = 720, 1280
             # ---- 安全轉型方向 ----
@@ -106,220 +115,290 @@ class InOutDetector(DetectorBase):
                 in_dir = 1       # 預設
             # ---------------------
 
-            gates.append({
+            gate = {
                 "id": g["gate_id"],
                 "name": g["gate_name"],
                 "a": (int(coords["A"][0] * frame_w), int(coords["A"][1] * frame_h)),
                 "b": (int(coords["B"][0] * frame_w), int(coords["B"][1] * frame_h)),
                 "in_dir": in_dir,
                 "start": self._format_time(g["start_time"], "00:00:00"),
-                "end": self._format_time(g["end_time"], "23:59:59")
-            })
-            print(f"[LOAD] Gate {g['gate_name']} dir={in_dir} ({g['in_direction']})")
-        cur.close(); conn.close()
-        # print(f"[LOAD] Camera {self.camera_id} with in/out gates loaded.")
+                "end": self._format_time(g["end_time"], "23:59:59"),
+                # 預先編譯的啟用表，偵測時 O(1) 查詢
+                "schedule": ActiveSchedule.from_times(g["start_time"], g["end_time"]),
+            }
+            gates.append(gate)
+            by_id[g["gate_id"]] = gate
         return gates
 
     # =====================================================
-    # 🔹 寫入事件到資料庫
+    # 🔹 主執行迴圈
     # =====================================================
-    def _save_event(self, gate, state):
-        now = datetime.datetime.now().time()
-        fmt = "%H:%M:%S"
+    def run(self):
+        self.grabber.start()
+        while self.running:
+            t0 = time.perf_counter()
+            ok, frame = self.grabber.read()
+            if not ok:
+                continue
+            if self.stage_timer is not None:
+                self.stage_timer("capture", time.perf_counter() - t0)   # 等待新影格的時間
+            try:
+                overlay = self.process_frame(frame, render=not self.headless)
+            except Exception as e:
+                if not self.running:
+                    break   # 停止時推論服務會讓等待中的請求失敗
+                # 單幀失敗不結束偵測執行緒
+                print(f"[ERROR] Camera {self.camera_id} frame failed: {e}")
+                time.sleep(0.5)
+                continue
+
+            # -------------------------
+            # 顯示畫面（可選，無桌面環境時不呼叫任何 GUI）
+            # -------------------------
+            if not self.headless:
+                cv2.imshow(str(self.camera_id), draw_overlay(frame, overlay))
+                if cv2.waitKey(1) & 0xFF == 27:
+                    break
 
-        start_t = datetime.datetime.strptime(gate["start"], fmt).time()
-        end_t   = datetime.datetime.strptime(gate["end"], fmt).time()
+        self.grabber.stop()
 
-        # 支援跨日區間
-        if start_t <= end_t:
-            in_active = start_t <= now <= end_t
+    # =====================================================
+    # 🔹 單張影格處理：推論 → 門線判斷 → 功能分析 → 發布
+    # =====================================================
+    def process_frame(self, frame, tnow=None, render=False):
+        """處理一張影格；影格本身不會被修改。
+        有觀看者或 render=True 時回傳疊圖資料（Overlay），否則回傳 None，不做任何繪圖。
+        tnow 由呼叫端指定時（重播影片）整幀都使用該時間，結果不受處理速度影響；
+        各階段耗時回報給 self.stage_timer(stage, 秒數)，可替換（基準測試用）"""
+        timer = self.stage_timer
+        replay = tnow is not None
+        tnow = tnow if replay else time.time()
+        t0 = time.perf_counter()
+        if self.clips is not None:
+            self.clips.push(self.camera_id, frame, tnow)   # 只放參照，壓縮在背景
+
+        # 交給共用推論服務（與其他攝影機一起批次推論）；靜止無人時跳過
+        if self.motion.should_infer(frame, tnow, self._people):
+            roi = self._roi_for(frame)
+            if roi is not None:
+                dets = roi.to_frame(self.inference.infer(self.camera_id, roi.crop(frame), imgsz=roi.imgsz))
+            else:
+                dets = self.inference.infer(self.camera_id, frame)
+            self._people = len(dets.boxes)
         else:
-            in_active = now >= start_t or now <= end_t
-
-        level = "heavy" if in_active else "light"
+            dets = EMPTY_DETECTIONS
+        now = tnow if replay else time.time()
+        minute = minute_of_day(now)   # 排程判斷用，每幀算一次
+        t1 = time.perf_counter()
+
+        self._apply_gate_updates()
+        self._apply_analyzer_updates()
+
+        # -------------------------
+        # 門線判斷（所有人 × 所有門線一次計算：側邊、距離、冷卻、方向）
+        # -------------------------
+        feet, tids, labels = [], [], []
+        boxes, ids, kps = dets
+        for i, box in enumerate(boxes):
+            x1, y1, x2, y2 = map(int, box.tolist())
+            tid = int(ids[i]) if ids is not None else i
+
+            # 預設腳底中點
+            foot = (int((x1 + x2) / 2), int(y2))
+
+            # 如果有關鍵點，就用雙腳踝中點
+            if kps is not None and kps.shape[1] >= 17:
+                left_ankle = kps[i][15]
+                right_ankle = kps[i][16]
+                if left_ankle[0] > 0 and right_ankle[0] > 0:
+                    foot = (
+                        int((left_ankle[0] + right_ankle[0]) / 2),
+                        int((left_ankle[1] + right_ankle[1]) / 2),
+                    )
+            feet.append(foot)
+            tids.append(tid)
+
+        # 無人時仍推進引擎，讓逾時的 track 狀態被清除
+        feet_xy = np.array(feet).reshape(-1, 2)
+        for c in self.engine.step(feet_xy, tids, tnow, now):
+            g = c.gate
+            rt = self.rt.setdefault(g["id"], GateRuntime())
+            cross_dir, state = c.cross_dir, c.state
+            if state == "Entry":
+                continue
+            color = (0, 0, 255)
+            text = f"{cross_dir} (Invasion)"
+
+            # 排程時段內為 heavy（支援跨日與多時段）
+            level = "heavy" if g["schedule"].is_active(minute) else "light"
+            # 放入事件佇列，由背景執行緒批次寫入資料庫；影像證據以 emit() 回傳的事件鍵對應
+            # 事件時間取自本幀時間（重播時為影片時間軸）
+            event_time = datetime.datetime.fromtimestamp(now).replace(microsecond=0)
+            key = self.events.emit(self.camera_id, g["id"], "inout", level, timestamp=event_time)
+            if self.clips is not None and key:
+                self.clips.trigger(self.camera_id, key, g["id"], "inout", event_time, tnow)
+            x1, _, _, y2 = map(int, boxes[c.person].tolist())
+            labels.append((x1, y2 + 20, text, color))
+            rt.flash_color = color
+            rt.flash_until = now + self.FLASH_SEC
+        t2 = time.perf_counter()
+
+        # -------------------------
+        # 其他功能分析器：共用本幀的偵測結果，各自計時
+        # -------------------------
+        if self.analyzers:
+            res = FrameResult(frame, boxes, tids, kps, feet_xy, tnow, now, minute, labels)
+            for a in self.analyzers:
+                ta = time.perf_counter()
+                a.analyze(res)
+                if timer is not None:
+                    timer(a.stage, time.perf_counter() - ta)
+        t3 = time.perf_counter()
+
+        # -------------------------
+        # 只保留原始偵測結果（參照，不複製）；疊圖在需要顯示時才繪製
+        # -------------------------
+        self._last = (frame, boxes, feet, labels, tnow)
+        overlay = None
+        viewers = self.broadcaster.has_viewers
+        if viewers or render:
+            overlay = self._overlay(boxes, feet, labels, tnow)
+        if viewers:
+            self.broadcaster.publish(frame, overlay)
+
+        if timer is not None:
+            timer("inference", t1 - t0)
+            timer("gates", t2 - t1)
+            timer("publish", time.perf_counter() - t3)
+        return overlay
+
+    def _overlay(self, boxes, feet, labels, tnow):
+        """人框、腳點、入侵標籤與門線（含閃爍顏色）"""
+        gates = []
+        for g in self.gates:
+            if g["a"][0] < 0 or g["b"][0] < 0:
+                continue
+            rt = self.rt.get(g["id"])
+            color = rt.flash_color if rt is not None and tnow < rt.flash_until else (255, 255, 255)
+            gates.append((g["a"], g["b"], g["name"], color))
+        return Overlay([tuple(map(int, b.tolist())) for b in boxes], feet, labels, gates)
+
+    @property
+    def last_frame(self):
+        """最新一幀的標註畫面（呼叫時才繪製）"""
+        if self._last is None:
+            return None
+        frame, boxes, feet, labels, tnow = self._last
+        return draw_overlay(frame, self._overlay(boxes, feet, labels, tnow))
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO events (camera_id, gate_id, event_type, alert_level, timestamp)
-            VALUES (%s, %s, %s, %s, NOW());
-        """, (self.camera_id, gate["id"], "inout_cross", level))
-        conn.commit()
-        cur.close()
-        conn.close()
+    # =====================================================
+    # 🔹 門線 ROI
+    # =====================================================
+    def _roi_for(self, frame):
+        """取得目前門線的裁切範圍；範圍改變時重置 tracker（座標系不同）"""
+        if not self.use_roi:
+            return None
+        if self.roi is None or self._roi_gates is not self.gates or self.roi.frame_shape != frame.shape[:2]:
+            old = self.roi.rect if self.roi is not None else None
+            self.roi = GateROI(self.gates, frame.shape)
+            self._roi_gates = self.gates
+            if self.roi.rect != old:
+                self.inference.reset_tracker(self.camera_id)
+                print(f"[INFO] Camera {self.camera_id} inference ROI: {self.roi.stats()}")
+        return self.roi
 
     # =====================================================
-    # 🔹 主執行迴圈
+    # 🔹 擷取端統計
     # =====================================================
-    def run(self):
-        # print(f"[INFO] InOutDetector started for camera {self.camera_id}")
+    def capture_stats(self):
+        """擷取端統計：解碼數、丟棄數、讀取失敗數、影格等待時間"""
+        return self.grabber.stats()
 
-        model = self.model
-        COOLDOWN = 0.5       # 1 秒內不重複觸發
-        MIN_NEAR = 30        # 人到門線的最大距離（像素）
-        MIN_NORM_MOVE = 0     # 法向位移最小量（像素）
-        last_evt = {}         # (gate_id, tid) → last_time
+    def motion_stats(self):
+        """動態預篩統計：duty_cycle 為實際送推論的幀比例"""
+        return self.motion.stats()
 
-        def unit_normal(a, b):
-            ax, ay = a; bx, by = b
-            vx, vy = bx - ax, by - ay
-            L = math.hypot(vx, vy) or 1.0
-            return (-vy / L, vx / L)
+    def clip_stats(self):
+        return self.clips.stats() if self.clips is not None else {}
 
-        while self.running:
-            tnow = time.time()
-            ok, frame = self.cap.read()
-            if not ok:
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                continue
+    def stage_stats(self):
+        """各階段耗時直方圖快照（metrics.Histogram.snapshot 格式）"""
+        return self.stage_hist.snapshot()
 
-            # results = model.track(frame, persist=True, conf=self.conf, classes=[0], verbose=False)
-            results = model.track(frame, persist=True, conf=self.conf, imgsz=960, verbose=False)
-            events = []
-            now = time.time()
-
-            if results:
-                r = results[0]
-                if r.boxes is not None and len(r.boxes) > 0:
-                    boxes = r.boxes.xyxy.cpu().numpy()
-                    ids = r.boxes.id.cpu().numpy() if r.boxes.id is not None else None
-                    kps = r.keypoints.xy.cpu().numpy() if hasattr(r, "keypoints") else None
-
-                    for i, box in enumerate(boxes):
-                        x1, y1, x2, y2 = map(int, box.tolist())
-                        tid = int(ids[i]) if ids is not None else i
-
-                        # 預設腳底中點
-                        foot = (int((x1 + x2) / 2), int(y2))
-
-                        # 如果有關鍵點，就用雙腳踝中點
-                        if kps is not None and kps.shape[1] >= 17:
-                            left_ankle = kps[i][15]
-                            right_ankle = kps[i][16]
-                            if left_ankle[0] > 0 and right_ankle[0] > 0:
-                                foot = (
-                                    int((left_ankle[0] + right_ankle[0]) / 2),
-                                    int((left_ankle[1] + right_ankle[1]) / 2),
-                                )
-
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        cv2.circle(frame, foot, 5, (0, 0, 255), -1)
-                        # print("Has keypoints:", hasattr(r, "keypoints"), "Shape:", None if not hasattr(r, "keypoints") else r.keypoints.xy.shape)
-
-
-                        for g in self.gates:
-                            if g["a"][0] < 0 or g["b"][0] < 0:
-                                continue
-                            rt = self.rt.setdefault(g["id"], GateRuntime())
-
-                            # --- 側邊判斷 ---
-                            prev_side = rt.last_side.get(tid, 0)
-                            curr_side = side_sign(g["a"], g["b"], foot)
-                            if curr_side == 0:
-                                curr_side = prev_side
-
-                            # --- 距離門線太遠，不檢查 ---
-                            dist = point_seg_dist(foot, g["a"], g["b"])
-                            if dist > MIN_NEAR:
-                                continue
-                            
-                            print(f"[CROSS] tid={tid}, gate={g['name']} "
-                                    f"prev_side={prev_side}, curr_side={curr_side},dist={dist:.1f}")
-                            # --- 偵測跨越門線 ---
-                            if prev_side != 0 and curr_side != 0 and prev_side != curr_side:
-
-                                # --- 冷卻檢查 ---
-                                if tnow  - last_evt.get((g["id"], tid), 0) < COOLDOWN:
-                                    continue
-                                last_evt[(g["id"], tid)] = now
-
-                                # --- 法向位移計算 ---
-                                nx, ny = unit_normal(g["a"], g["b"])
-                                dx, dy = (
-                                    foot[0] - rt.last_side.get(f"{tid}_x", foot[0]),
-                                    foot[1] - rt.last_side.get(f"{tid}_y", foot[1])
-                                )
-                                norm_move = abs(dx * nx + dy * ny)
-                                rt.last_side[f"{tid}_x"] = foot[0]
-                                rt.last_side[f"{tid}_y"] = foot[1]
-
-                                if norm_move < MIN_NORM_MOVE:
-                                    print(f"[DEBUG] norm_move={norm_move:.2f}, MIN_NORM_MOVE={MIN_NORM_MOVE}")
-                                    continue  # 抖動忽略
-
-                                # --- 判斷跨越方向 ---
-                                cross_dir = "A->B" if (prev_side > 0 and curr_side < 0) else "B->A"
-
-                                # --- 根據 in_dir 判斷 Entry / Exit ---
-                                if (cross_dir == "A->B" and int(g["in_dir"]) == 1) or \
-                                (cross_dir == "B->A" and int(g["in_dir"]) == -1):
-                                    state = "Entry"
-                                    color = (0, 255, 0)
-                                    text = f"{cross_dir} ({state})"
-                                else:
-                                    state = "inout"
-                                    color = (0, 0, 255)
-                                    text = f"{cross_dir} (Invasion)"
-                                    now = datetime.datetime.now().time()
-                                    fmt = "%H:%M:%S"
-
-                                    start_t = datetime.datetime.strptime(gate["start"], fmt).time()
-                                    end_t   = datetime.datetime.strptime(gate["end"], fmt).time()
-
-                                    # 支援跨日區間
-                                    if start_t <= end_t:
-                                        in_active = start_t <= now <= end_t
-                                    else:
-                                        in_active = now >= start_t or now <= end_t
-
-                                    level = "heavy" if in_active else "light"
-                                    # 寫入資料庫
-                                    conn = get_db_connection()
-                                    cur = conn.cursor()
-                                    cur.execute("""
-                                        INSERT INTO events (camera_id, gate_id, event_type, alert_level, timestamp)
-                                        VALUES (%s, %s, %s, %s, NOW());
-                                    """, (self.camera_id, g["id"], "inout", level))
-                                    cv2.putText(frame, text, (x1, y2 + 20),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-                                    rt.flash_color = color
-                                    rt.flash_until = now + self.FLASH_SEC
-                                    conn.commit()
-                                    cur.close()
-                                    conn.close()
-
-                                # --- 顯示在畫面上 ---
-                                
-
-                                # --- 閃爍效果 ---
-                                
-                            rt.last_side[tid] = curr_side
+    def track_stats(self):
+        """追蹤狀態統計：目前 track 數、逾時移除數、超量淘汰數"""
+        return self.engine.tracks.stats()
 
-            # -------------------------
-            # 畫門線與閃爍效果
-            # -------------------------
-            # tnow = time.time()
-            for g in self.gates:
-                if g["a"][0] < 0 or g["b"][0] < 0:
-                    continue
-                rt = self.rt.setdefault(g["id"], GateRuntime())
-                color = rt.flash_color if tnow < rt.flash_until else (255, 255, 255)
-                cv2.line(frame, g["a"], g["b"], color, 2)
-                cv2.putText(frame, g["name"], (g["a"][0] + 8, g["a"][1] - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    def analyzer_stats(self):
+        """各功能分析器統計（name → stats）"""
+        return {a.name: a.stats() for a in self.analyzers}
 
-            # -------------------------
-            # 顯示畫面（可選）
-            # -------------------------
-            self.last_frame = frame.copy()
-            cv2.imshow(str(self.camera_id), frame)
-            if cv2.waitKey(1) & 0xFF == 27:
-                break
+    # =====================================================
+    # 🔹 門線變更（增量）
+    # =====================================================
+    def apply_gate_change(self, op, payload):
+        """由其他執行緒呼叫，只排入佇列不碰偵測狀態：
+           ("upsert", gate dict) / ("remove", gate_id) / ("replace", gate 清單)"""
+        self._gate_updates.put((op, payload))
+
+    def gate_changed(self, gate_id=None):
+        """設定寫入後的通知：查詢單一門線（None 表示整支攝影機）並排入變更。
+        資料庫查詢在呼叫端執行緒完成，偵測迴圈不會等待資料庫。"""
+        if gate_id is None:
+            self.apply_gate_change("replace", self._load_gates())
+            return
+        gates = self._load_gates(gate_id)
+        if gates:
+            self.apply_gate_change("upsert", gates[0])
+        else:
+            self.apply_gate_change("remove", gate_id)
+
+    def _apply_gate_updates(self):
+        """於偵測迴圈中套用所有待處理變更，門線清單與引擎一次替換"""
+        if self._gate_updates.empty():
+            return
+        gates = list(self.gates)
+        while not self._gate_updates.empty():
+            op, payload = self._gate_updates.get()
+            if op == "replace":
+                gates = list(payload)
+            elif op == "upsert":
+                ids = [g["id"] for g in gates]
+                if payload["id"] in ids:
+                    gates[ids.index(payload["id"])] = payload
+                else:
+                    gates.append(payload)
+            elif op == "remove":
+                gates = [g for g in gates if g["id"] != payload]
+        # 未變動門線的追蹤狀態由 with_gates 依 id 保留
+        self.gates, self.engine = gates, self.engine.with_gates(gates)
+        live = {g["id"] for g in gates}
+        for gid in [gid for gid in self.rt if gid not in live]:
+            del self.rt[gid]
+        print(f"[INFO] Applied gate changes for camera {self.camera_id} ({len(gates)} gates)")
 
+    # =====================================================
+    # 🔹 功能分析器設定變更
+    # =====================================================
+    def _load_analyzer_configs(self):
+        return load_analyzer_configs(self.camera_id)
+
+    def analyzers_changed(self):
+        """模式 / 排程 / 區域寫入後的通知：在呼叫端執行緒查詢設定，偵測迴圈只做替換"""
+        self._analyzer_updates.put(self._load_analyzer_configs())
+
+    def _apply_analyzer_updates(self):
+        if self._analyzer_updates.empty():
+            return
+        while not self._analyzer_updates.empty():
+            configs = self._analyzer_updates.get()
+        # 仍啟用的分析器只更新設定，追蹤狀態保留
+        self.analyzers = build_analyzers(self.camera_id, configs, self.events, self.clips, self.analyzers)
+        print(f"[INFO] Camera {self.camera_id} analyzers: {[a.name for a in self.analyzers] or 'none'}")
 
     # =====================================================
     # 🔹 重新載入門線設定
     # =====================================================
     def reload_gates(self):
-        self.gates = self._load_gates()
+        self.gate_changed()
         print(f"[INFO] Reloaded gates for camera {self.camera_id}")
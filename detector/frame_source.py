@@ -0,0 +1,100 @@
+# 影像擷取執行緒：持續解碼，只保留最新影格
+import time, threading
+import cv2
+
+
+class FrameGrabber:
+    """每支攝影機一條擷取執行緒，持續讀取串流並放入單格槽位。
+    推論端永遠拿最新的影格，來不及處理的舊影格直接丟棄並計數。"""
+
+    def __init__(self, camera_url, loop_file=True):
+        self.camera_url = camera_url
+        self.loop_file = loop_file     # 影片檔讀到結尾時是否重頭播放
+        self.cap = cv2.VideoCapture(camera_url)
+        self.running = False
+
+        # 影片檔沒有即時性，依檔案 fps 節流，避免瞬間解碼完整支影片
+        self.pace = 0.0
+        if not self._is_live(camera_url):
+            fps = self.cap.get(cv2.CAP_PROP_FPS) or 0
+            self.pace = 1.0 / fps if fps > 0 else 0.0
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0          # 擷取到的影格序號
+        self._ts = 0.0         # 最新影格擷取時間
+
+        # 統計資料
+        self.captured = 0      # 成功解碼的影格數
+        self.dropped = 0       # 尚未被取走就被新影格覆蓋的數量
+        self.read_errors = 0   # 讀取失敗次數
+        self.last_staleness = 0.0   # 最近一次取用時影格已等待的秒數
+        self._taken_seq = 0
+
+        self.thread = None
+
+    @staticmethod
+    def _is_live(url):
+        url = str(url)
+        return url.isdigit() or url.lower().startswith(("rtsp://", "rtmp://", "http://", "https://"))
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+
+    # =====================================================
+    # 🔹 擷取迴圈
+    # =====================================================
+    def _loop(self):
+        while self.running:
+            t0 = time.time()
+            ok, frame = self.cap.read()
+            if not ok:
+                self.read_errors += 1
+                if self.loop_file:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                time.sleep(0.01)
+                continue
+
+            with self._cond:
+                if self._frame is not None and self._seq != self._taken_seq:
+                    self.dropped += 1
+                self._frame = frame
+                self._seq += 1
+                self._ts = time.time()
+                self.captured += 1
+                self._cond.notify_all()
+
+            if self.pace:
+                time.sleep(max(0.0, self.pace - (time.time() - t0)))
+        self.cap.release()
+
+    # =====================================================
+    # 🔹 取得最新影格
+    # =====================================================
+    def read(self, timeout=1.0):
+        """等待比上次取走更新的影格，回傳 (ok, frame)"""
+        with self._cond:
+            if self._seq == self._taken_seq:
+                self._cond.wait_for(lambda: self._seq != self._taken_seq or not self.running,
+                                    timeout)
+            if self._seq == self._taken_seq:
+                return False, None
+            self._taken_seq = self._seq
+            self.last_staleness = time.time() - self._ts
+            return True, self._frame
+
+    def stats(self):
+        return {
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "read_errors": self.read_errors,
+            "staleness_ms": round(self.last_staleness * 1000.0, 1),
+        }
@@ -0,0 +1,209 @@
+# 向量化門線跨越判斷：所有腳點 × 所有門線一次以 NumPy 計算
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from detector.track_store import TrackStore, TrackState
+
+COOLDOWN = 0.5        # 同一人同一門線冷卻時間（秒）
+MIN_NEAR = 30         # 人到門線的最大距離（像素）
+MIN_NORM_MOVE = 0     # 法向位移最小量（像素）
+
+# 單次跨越結果
+#   person: 本幀第幾個人；gate: 門線 dict；cross_dir: "A->B" / "B->A"
+#   state: "Entry"（允許方向）或 "inout"（逆向入侵）
+Crossing = namedtuple("Crossing", ["person", "tid", "gate", "cross_dir", "state"])
+
+
+# =========================================================
+# 🔸 純量版本（逐點計算，保留作為對照基準）
+# =========================================================
+def side_sign(a, b, p) -> int:
+    """以 A->B 的左法向量判斷點 p 位於 A 側(-1)、B 側(+1) 或 線上(0)。"""
+    ax, ay = a; bx, by = b; px, py = p
+    vx, vy = bx - ax, by - ay
+    nx, ny = -vy, vx  # 左法向（未正規化也可以）
+    s = (px - ax) * nx + (py - ay) * ny
+    if s > 0:  return +1   # B 側（左側）
+    if s < 0:  return -1   # A 側（右側）
+    return 0               # 線上
+
+def point_seg_dist(p, a, b):
+    """計算點 p 到線段 AB 的距離"""
+    ax, ay = a; bx, by = b; px, py = p
+    vx, vy = bx-ax, by-ay
+    if vx == 0 and vy == 0: return math.hypot(px-ax, py-ay)
+    t = ((px-ax)*vx + (py-ay)*vy) / float(vx*vx + vy*vy)
+    t = max(0.0, min(1.0, t))
+    cx, cy = ax + t*vx, ay + t*vy
+    return math.hypot(px-cx, py-cy)
+
+def unit_normal(a, b):
+    """線段 AB 的單位左法向量"""
+    ax, ay = a; bx, by = b
+    vx, vy = bx - ax, by - ay
+    L = math.hypot(vx, vy) or 1.0
+    return (-vy / L, vx / L)
+
+def is_inside(side_val, in_dir):
+    """根據門線方向與外積符號判定是否在內側"""
+    # in_dir: +1 表示 A→B 方向為內部，-1 表示相反
+    if in_dir == 1:
+        return side_val > 0
+    else:
+        return side_val < 0
+
+
+# =========================================================
+# 🔸 向量化門線引擎
+# =========================================================
+class GateEngine:
+    """將一支攝影機的所有門線端點存成陣列，每幀批次計算側邊、距離與跨越。
+    判斷規則與原本逐點迴圈完全一致（含冷卻與抖動過濾）。"""
+
+    def __init__(self, gates, cooldown=COOLDOWN, min_near=MIN_NEAR, min_norm_move=MIN_NORM_MOVE, tracks=None):
+        self.cooldown = cooldown
+        self.min_near = min_near
+        self.min_norm_move = min_norm_move
+
+        # 端點座標為負代表未設定，直接略過
+        self.gates = [g for g in gates if g["a"][0] >= 0 and g["b"][0] >= 0]
+        G = len(self.gates)
+        self.ids = [g["id"] for g in self.gates]
+        self.A = np.array([g["a"] for g in self.gates], dtype=np.int64).reshape(G, 2)
+        self.B = np.array([g["b"] for g in self.gates], dtype=np.int64).reshape(G, 2)
+        self.in_dir = np.array([int(g["in_dir"]) for g in self.gates], dtype=np.int64)
+
+        V = self.B - self.A
+        self.V = V
+        self.N = np.stack([-V[:, 1], V[:, 0]], axis=1)          # 左法向（未正規化）
+        self.VV = (V * V).sum(axis=1)                           # |V|^2
+        L = np.hypot(V[:, 0], V[:, 1])
+        L[L == 0] = 1.0
+        self.NU = self.N / L[:, None]                           # 單位左法向
+
+        # 每個 track id 對每條門線的狀態（TrackState），逾時或超量自動淘汰
+        self.tracks = tracks if tracks is not None else TrackStore()
+        self.frame = 0       # 已處理幀數（track 逾時以幀計）
+
+    def __len__(self):
+        return len(self.gates)
+
+    # =====================================================
+    # 🔹 門線更新：保留未變動門線的追蹤狀態
+    # =====================================================
+    def with_gates(self, gates):
+        """以新的門線清單建立引擎，並依 gate id 搬移既有追蹤狀態。
+        端點或方向有變的門線，舊的側邊已無意義，狀態歸零重新累積。"""
+        new = GateEngine(gates, self.cooldown, self.min_near, self.min_norm_move,
+                         tracks=self.tracks.empty_like())
+        new.frame = self.frame
+        old_col = {gid: j for j, gid in enumerate(self.ids)}
+        pairs = [(j, old_col[gid]) for j, gid in enumerate(new.ids)
+                 if gid in old_col and _same_line(new.gates[j], self.gates[old_col[gid]])]
+        dst = np.array([p[0] for p in pairs], dtype=np.int64)
+        src = np.array([p[1] for p in pairs], dtype=np.int64)
+        G = len(new)
+        for tid, rec in self.tracks.items():
+            r = TrackState(G)
+            r.side[dst] = rec.side[src]
+            r.last_evt[dst] = rec.last_evt[src]
+            r.last_xy[dst] = rec.last_xy[src]
+            r.seen_frame, r.seen_at = rec.seen_frame, rec.seen_at
+            new.tracks.put(tid, r)
+        return new
+
+    # =====================================================
+    # 🔹 幾何計算
+    # =====================================================
+    def sides(self, feet):
+        """(P, 2) 腳點 → (P, G) 側邊 (-1 / 0 / +1)"""
+        D = feet[:, None, :] - self.A[None, :, :]
+        return np.sign((D * self.N[None, :, :]).sum(axis=2)).astype(np.int8)
+
+    def distances(self, feet):
+        """(P, 2) 腳點 → (P, G) 到各線段的距離"""
+        F = feet.astype(np.float64)
+        D = F[:, None, :] - self.A[None, :, :]
+        VV = self.VV.astype(np.float64)
+        safe = np.where(VV == 0, 1.0, VV)
+        t = (D * self.V[None, :, :]).sum(axis=2) / safe
+        t = np.clip(t, 0.0, 1.0)
+        t[:, VV == 0] = 0.0
+        C = self.A[None, :, :] + t[:, :, None] * self.V[None, :, :]
+        return np.hypot(F[:, None, 0] - C[:, :, 0], F[:, None, 1] - C[:, :, 1])
+
+    # =====================================================
+    # 🔹 每幀更新
+    # =====================================================
+    def step(self, feet, tids, tnow, now):
+        """計算本幀所有人 × 所有門線的跨越，更新狀態並回傳 Crossing 清單。
+        feet: (P, 2) 整數腳點；tids: 長度 P 的 track id；
+        tnow: 本幀開始時間（冷卻判斷）；now: 推論完成時間（記錄觸發時間）"""
+        G = len(self.gates)
+        P = len(tids)
+        self.frame += 1
+        if G == 0 or P == 0:
+            self.tracks.sweep(self.frame, now)
+            return []
+
+        feet = np.asarray(feet, dtype=np.int64).reshape(P, 2)
+        recs = [self.tracks.touch(t, G, self.frame, now) for t in tids]
+        prev = np.stack([r.side for r in recs])
+        last_evt = np.stack([r.last_evt for r in recs])
+        last_xy = np.stack([r.last_xy for r in recs])
+
+        # --- 側邊判斷（落在線上沿用上一幀）---
+        curr = self.sides(feet)
+        curr = np.where(curr == 0, prev, curr)
+
+        # --- 距離門線太遠，不檢查（也不更新狀態）---
+        near = self.distances(feet) <= self.min_near
+
+        # --- 偵測跨越門線 ---
+        crossing = near & (prev != 0) & (curr != 0) & (prev != curr)
+
+        # --- 冷卻檢查 ---
+        cooling = crossing & ((tnow - last_evt) < self.cooldown)
+        fired = crossing & ~cooling
+        last_evt[fired] = now
+
+        # --- 法向位移計算（無紀錄時位移為 0）---
+        F = np.broadcast_to(feet[:, None, :].astype(np.float64), (P, G, 2))
+        ref = np.where(np.isnan(last_xy), F, last_xy)
+        d = F - ref
+        norm_move = np.abs(d[:, :, 0] * self.NU[None, :, 0] + d[:, :, 1] * self.NU[None, :, 1])
+        last_xy[fired] = F[fired]
+
+        jitter = fired & (norm_move < self.min_norm_move)
+        fired &= ~jitter
+
+        # --- 更新側邊（被略過的組合維持原狀態）---
+        update = near & ~cooling & ~jitter
+        side = np.where(update, curr, prev).astype(np.int8)
+
+        for i, r in enumerate(recs):
+            # 原地寫回，避免每個 track 持有整幀陣列的 view
+            r.side[:] = side[i]
+            r.last_evt[:] = last_evt[i]
+            r.last_xy[:] = last_xy[i]
+        self.tracks.sweep(self.frame, now)
+
+        # --- 判斷跨越方向與 Entry / Invasion（依人、門線順序）---
+        out = []
+        for i, j in zip(*np.nonzero(fired)):
+            cross_dir = "A->B" if (prev[i, j] > 0 and curr[i, j] < 0) else "B->A"
+            in_dir = int(self.in_dir[j])
+            if (cross_dir == "A->B" and in_dir == 1) or (cross_dir == "B->A" and in_dir == -1):
+                state = "Entry"
+            else:
+                state = "inout"
+            out.append(Crossing(int(i), tids[i], self.gates[j], cross_dir, state))
+        return out
+
+
+def _same_line(g1, g2):
+    return tuple(g1["a"]) == tuple(g2["a"]) and tuple(g1["b"]) == tuple(g2["b"]) \
+        and int(g1["in_dir"]) == int(g2["in_dir"])
+
@@ -0,0 +1,194 @@
+# 共用 YOLO 推論服務：所有攝影機共用一份模型，批次推論
+import os, time, queue, threading
+from collections import namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+import yaml
+from ultralytics import YOLO
+from ultralytics.trackers.bot_sort import BOTSORT
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+
+from detector import backends
+
+MODEL_PATH = "models/yolo11n-pose.pt"
+TRACKER_MAP = {"bytetrack": BYTETracker, "botsort": BOTSORT}
+
+# 單一攝影機、單一影格的推論結果（座標皆為原始影格座標）
+#   boxes: (N, 4) xyxy
+#   ids:   (N,) track id，未追蹤時為 None
+#   kps:   (N, 17, 2) 關鍵點，無關鍵點時為 None
+Detections = namedtuple("Detections", ["boxes", "ids", "kps"])
+
+EMPTY_DETECTIONS = Detections(np.zeros((0, 4), dtype=np.float32), None, None)
+
+
+class InferenceService:
+    """集中式推論排程器：收集多支攝影機的影格，湊成批次後一次推論，
+    再依攝影機各自的 tracker 更新 track id。"""
+
+    def __init__(self, model_path=None, batch_size=None, max_wait_ms=None,
+                 conf=0.3, imgsz=960, tracker="botsort.yaml", backend=None, threads=None):
+        # 指定 model_path 時直接以 PyTorch 載入；否則依 INFER_BACKEND 選擇後端
+        if model_path is not None:
+            self.model = YOLO(model_path)
+            self.backend = backends.BackendInfo("pytorch", model_path, None, True, None)
+        else:
+            self.model, self.backend = backends.load(backend, threads)
+        self.batch_size = batch_size or int(os.getenv("INFER_BATCH_SIZE", 8))
+        if self.backend.batch:
+            # 固定形狀的匯出模型只接受匯出時的 batch（要批次推論請以 --dynamic 匯出）
+            self.batch_size = min(self.batch_size, self.backend.batch)
+        self.max_wait = (max_wait_ms if max_wait_ms is not None
+                         else float(os.getenv("INFER_MAX_WAIT_MS", 10))) / 1000.0
+        self.conf = conf
+        # 固定輸入尺寸的匯出模型只能用匯出時的尺寸（ROI 裁切的 imgsz 也會被覆寫）
+        self.imgsz = self.backend.imgsz if not self.backend.dynamic and self.backend.imgsz else imgsz
+
+        # 暖機：建立 predictor 後套用 ONNX Runtime / OpenVINO 執行緒數
+        self.model.predict(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8),
+                           conf=self.conf, imgsz=self.imgsz, verbose=False)
+        backends.tune_threads(self.model, self.backend, threads)
+        self.threads = backends.session_threads(self.model, self.backend)
+
+        with open(check_yaml(tracker)) as f:
+            self.tracker_cfg = IterableSimpleNamespace(**yaml.safe_load(f))
+        self.trackers = {}   # camera_id → tracker（各攝影機狀態獨立）
+
+        self.requests = queue.Queue()
+        self.running = True
+        self._lock = threading.Lock()   # running 與佇列一起判斷，停止後不會留下無人處理的請求
+
+        # 統計資料
+        self.frames = 0
+        self.batches = 0
+        self.total_latency = 0.0
+
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    # =====================================================
+    # 🔹 對外介面
+    # =====================================================
+    def submit(self, camera_id, frame, imgsz=None):
+        """送出一張影格，回傳 Future（結果為 Detections）；
+        imgsz 可依影格大小指定（例如 ROI 裁切後的小圖），預設為服務設定值"""
+        fut = Future()
+        if imgsz is None or not self.backend.dynamic:
+            imgsz = self.imgsz
+        with self._lock:
+            if not self.running:
+                fut.set_exception(RuntimeError("inference service stopped"))
+                return fut
+            self.requests.put((camera_id, frame, time.time(), fut, imgsz))
+        return fut
+
+    def infer(self, camera_id, frame, timeout=None, imgsz=None):
+        """同步版本：送出影格並等待結果"""
+        return self.submit(camera_id, frame, imgsz).result(timeout)
+
+    def reset_tracker(self, camera_id):
+        """清除指定攝影機的追蹤狀態（例如串流重新連線時）"""
+        self.trackers.pop(camera_id, None)
+
+    def stop(self):
+        """停止排程；尚未推論的請求以例外結束，等待 infer() 的偵測執行緒不會卡住"""
+        with self._lock:
+            self.running = False
+            self.requests.put(None)
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "batches": self.batches,
+            "avg_batch": self.frames / self.batches if self.batches else 0.0,
+            "avg_latency_ms": 1000.0 * self.total_latency / self.frames if self.frames else 0.0,
+            "pending": self.requests.qsize(),
+            "backend": self.backend.name,
+        }
+
+    # =====================================================
+    # 🔹 排程迴圈
+    # =====================================================
+    def _collect(self):
+        """阻塞等待第一筆請求，之後在期限內盡量湊滿批次"""
+        first = self.requests.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while self.running:
+            batch = self._collect()
+            if not batch:
+                continue
+            # 同一批次內依 imgsz 分組，每組各推論一次
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[4], []).append(item)
+            for imgsz, items in groups.items():
+                self._run(items, imgsz)
+            self.frames += len(batch)
+            self.batches += 1
+        self._fail_pending()
+
+    def _fail_pending(self):
+        with self._lock:
+            while True:
+                try:
+                    item = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[3].set_exception(RuntimeError("inference service stopped"))
+
+    def _run(self, items, imgsz):
+        try:
+            results = self.model.predict([b[1] for b in items], conf=self.conf,
+                                         imgsz=imgsz, verbose=False)
+        except Exception as e:
+            for item in items:
+                item[3].set_exception(e)
+            return
+
+        done = time.time()
+        for (camera_id, frame, t0, fut, _), r in zip(items, results):
+            try:
+                fut.set_result(self._track(camera_id, r))
+            except Exception as e:
+                fut.set_exception(e)
+            self.total_latency += done - t0
+
+    def _track(self, camera_id, r):
+        """以該攝影機自己的 tracker 更新，回傳帶 track id 的 Detections"""
+        tracker = self.trackers.get(camera_id)
+        if tracker is None:
+            tracker = TRACKER_MAP[self.tracker_cfg.tracker_type](args=self.tracker_cfg, frame_rate=30)
+            self.trackers[camera_id] = tracker
+
+        det = r.boxes.cpu().numpy()
+        tracks = tracker.update(det, r.orig_img)
+        if len(tracks) == 0:
+            return EMPTY_DETECTIONS
+
+        # tracks 欄位：x1, y1, x2, y2, track_id, score, cls, idx
+        idx = tracks[:, -1].astype(int)
+        kps = None
+        if r.keypoints is not None:
+            kps = r.keypoints.xy.cpu().numpy()[idx]
+        return Detections(tracks[:, :4], tracks[:, 4], kps)
@@ -0,0 +1,68 @@
+# 動態預篩：畫面靜止時跳過 YOLO 推論
+#   - 縮小成灰階小圖後與上一張比較（frame differencing），成本遠低於推論
+#   - 有動態或畫面中仍有人時維持每幀推論；靜止時只以低頻率推論一次確認
+#   - 只在「沒有人」時才跳幀，追蹤器看到的 track 不會因跳幀而中斷
+import os
+import cv2
+
+
+class MotionGate:
+    def __init__(self, enabled=None, width=None, threshold=None, min_area=None,
+                 hold_sec=None, idle_interval=None):
+        self.enabled = enabled if enabled is not None else os.getenv("MOTION_GATE", "1") != "0"
+        self.width = width or int(os.getenv("MOTION_WIDTH", 160))                  # 比對用小圖寬度
+        self.threshold = threshold or int(os.getenv("MOTION_THRESHOLD", 25))       # 像素差門檻
+        self.min_area = min_area or float(os.getenv("MOTION_MIN_AREA", 0.002))     # 變動像素比例門檻
+        self.hold_sec = hold_sec or float(os.getenv("MOTION_HOLD_SEC", 2.0))       # 動態結束後維持全速的時間
+        self.idle_interval = idle_interval or float(os.getenv("MOTION_IDLE_SEC", 1.0))  # 靜止時的推論間隔
+
+        self._prev = None
+        self._active_until = 0.0
+        self._last_infer = 0.0
+
+        # 統計資料
+        self.frames = 0
+        self.inferred = 0
+        self.motion_ratio = 0.0
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        scale = self.width / float(w)
+        small = cv2.resize(frame, (self.width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def should_infer(self, frame, now, people=0):
+        """本幀是否需要推論；people 為上一次推論偵測到的人數"""
+        self.frames += 1
+        if not self.enabled:
+            self.inferred += 1
+            return True
+
+        small = self._small(frame)
+        prev, self._prev = self._prev, small
+        if prev is None or prev.shape != small.shape:
+            moving = True
+        else:
+            diff = cv2.absdiff(prev, small)
+            self.motion_ratio = cv2.countNonZero(cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)[1]) \
+                / float(diff.size)
+            moving = self.motion_ratio >= self.min_area
+
+        if moving or people > 0:
+            self._active_until = now + self.hold_sec
+
+        run = now < self._active_until or now - self._last_infer >= self.idle_interval
+        if run:
+            self._last_infer = now
+            self.inferred += 1
+        return run
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "frames": self.frames,
+            "inferred": self.inferred,
+            "duty_cycle": round(self.inferred / self.frames, 3) if self.frames else 0.0,
+            "motion_ratio": round(self.motion_ratio, 4),
+        }
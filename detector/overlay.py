@@ -0,0 +1,44 @@
+# 畫面疊圖：偵測結果只記錄成資料，需要顯示時才畫到影格副本上
+#   - 沒有觀看者時完全不做繪圖與影格複製
+#   - 有觀看者時由 FrameBroadcaster 在編碼前繪製，每個影格序號只畫一次
+from collections import namedtuple
+
+import cv2
+
+# boxes:  [(x1, y1, x2, y2)] 人框
+# feet:   [(x, y)] 腳點
+# labels: [(x, y, text, color)] 入侵標籤
+# gates:  [(a, b, name, color)] 門線與目前顏色（含閃爍）
+Overlay = namedtuple("Overlay", ["boxes", "feet", "labels", "gates"])
+
+
+def scale_overlay(overlay, scale):
+    """疊圖座標乘上 scale（影格經縮小傳送時使用）；scale 為 1 或 overlay 為 None 時原樣回傳"""
+    if overlay is None or scale == 1.0:
+        return overlay
+
+    def pt(p):
+        return (int(p[0] * scale), int(p[1] * scale))
+
+    return Overlay(
+        [tuple(int(v * scale) for v in box) for box in overlay.boxes],
+        [pt(f) for f in overlay.feet],
+        [(*pt((x, y)), text, color) for x, y, text, color in overlay.labels],
+        [(pt(a), pt(b), name, color) for a, b, name, color in overlay.gates],
+    )
+
+
+def draw_overlay(frame, overlay):
+    """回傳畫好疊圖的副本；overlay 為 None 時直接回傳原影格"""
+    if overlay is None:
+        return frame
+    out = frame.copy()
+    for (x1, y1, x2, y2), foot in zip(overlay.boxes, overlay.feet):
+        cv2.rectangle(out, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.circle(out, foot, 5, (0, 0, 255), -1)
+    for x, y, text, color in overlay.labels:
+        cv2.putText(out, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+    for a, b, name, color in overlay.gates:
+        cv2.line(out, a, b, color, 2)
+        cv2.putText(out, name, (a[0] + 8, a[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return out
@@ -0,0 +1,346 @@
+# 多行程執行模式：每個子行程負責 N 支攝影機
+#   - 有人觀看時，原始影格透過 shared memory、疊圖資料透過 Queue 回傳給 Flask 主行程
+#   - 控制指令（reload_gates / gate_changed / analyzers_changed / stop）與狀態訊息透過 Queue 傳遞
+import os, time, queue, threading, datetime
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+import cv2
+
+from detector.broadcaster import FrameBroadcaster
+from detector.overlay import draw_overlay, scale_overlay
+from event_sink import new_event_key
+
+# seq, height, width, channels, wanted（主行程是否有觀看者）, scale（縮小倍率 × SCALE_UNIT）
+HEADER_FIELDS = 6
+SCALE_UNIT = 1_000_000
+
+
+# =========================================================
+# 🔸 共享記憶體影格槽位
+# =========================================================
+class FrameSlot:
+    """單一攝影機的共享影格槽位（seqlock：寫入中 seq 為奇數）"""
+
+    def __init__(self, max_width, max_height, name=None):
+        self.max_width = max_width
+        self.max_height = max_height
+        size = HEADER_FIELDS * 8 + max_width * max_height * 3
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((max_width * max_height * 3,), dtype=np.uint8,
+                               buffer=self.shm.buf, offset=HEADER_FIELDS * 8)
+        if self.owner:
+            self.header[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def seq(self):
+        return int(self.header[0])
+
+    @property
+    def wanted(self):
+        return bool(self.header[4])
+
+    @wanted.setter
+    def wanted(self, value):
+        self.header[4] = 1 if value else 0
+
+    def write(self, frame):
+        """寫入影格；超過槽位大小時等比縮小，倍率記在標頭（疊圖座標仍為原始像素）"""
+        h, w = frame.shape[:2]
+        scale = 1.0
+        if w > self.max_width or h > self.max_height:
+            scale = min(self.max_width / w, self.max_height / h)
+            frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
+            h, w = frame.shape[:2]
+        c = frame.shape[2] if frame.ndim == 3 else 1
+        n = h * w * c
+
+        self.header[0] += 1          # 奇數：寫入中
+        self.header[1:4] = (h, w, c)
+        self.header[5] = round(scale * SCALE_UNIT)
+        self.data[:n] = frame.reshape(-1)
+        self.header[0] += 1          # 偶數：寫入完成
+
+    def read(self):
+        """複製出最新影格，回傳 (frame, 縮小倍率)；尚無影格時回傳 (None, 1.0)"""
+        for _ in range(3):
+            s1 = self.seq
+            if s1 == 0:
+                return None, 1.0
+            if s1 % 2:
+                time.sleep(0.001)
+                continue
+            h, w, c = (int(v) for v in self.header[1:4])
+            scale = int(self.header[5]) / SCALE_UNIT
+            frame = self.data[:h * w * c].copy()
+            if self.seq == s1:
+                return (frame.reshape((h, w, c)) if c > 1 else frame.reshape((h, w))), scale
+        return None, 1.0
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# =========================================================
+# 🔸 主行程端的 worker 代理
+# =========================================================
+class RemoteWorker:
+    """在 Flask 主行程中代表子行程裡的偵測器，介面與 InOutDetector 相同"""
+
+    def __init__(self, camera_id, camera_url, slot, ctrl_q):
+        self.camera_id = camera_id
+        self.camera_url = camera_url
+        self.slot = slot
+        self.ctrl_q = ctrl_q
+        self.stats = {}
+        self.overlay = None   # 最近一次收到的疊圖資料
+        self.broadcaster = FrameBroadcaster(camera_id)
+        # 觀看人數變化時通知子行程是否需要寫入影格
+        self.broadcaster.on_viewers = lambda n: setattr(slot, "wanted", n > 0)
+
+    @property
+    def last_frame(self):
+        """共享記憶體中最後一張影格（只在有觀看者時更新）"""
+        frame, scale = self.slot.read()
+        return draw_overlay(frame, scale_overlay(self.overlay, scale)) if frame is not None else None
+
+    def reload_gates(self):
+        self.ctrl_q.put(("reload_gates", self.camera_id, None))
+
+    def gate_changed(self, gate_id=None):
+        # 子行程自行查詢該門線並在偵測迴圈中套用
+        self.ctrl_q.put(("gate_changed", self.camera_id, gate_id))
+
+    def analyzers_changed(self):
+        self.ctrl_q.put(("analyzers_changed", self.camera_id, None))
+
+    def stop(self):
+        self.ctrl_q.put(("stop", self.camera_id, None))
+
+    def capture_stats(self):
+        return self.stats.get("capture", {})
+
+    def track_stats(self):
+        return self.stats.get("tracks", {})
+
+    def motion_stats(self):
+        return self.stats.get("motion", {})
+
+    def stage_stats(self):
+        return self.stats.get("stages", {})
+
+    def clip_stats(self):
+        return self.stats.get("clips", {})
+
+    def analyzer_stats(self):
+        return self.stats.get("analyzers", {})
+
+
+class ProcessPool:
+    """將攝影機分組，每組交給一個子行程執行"""
+
+    def __init__(self, cameras, events=None, cameras_per_process=None, max_width=None, max_height=None,
+                 clip_budget_mb=None):
+        self.cameras_per_process = cameras_per_process or int(os.getenv("CAMERAS_PER_PROCESS", 4))
+        max_width = max_width or int(os.getenv("SHM_MAX_WIDTH", 1920))
+        max_height = max_height or int(os.getenv("SHM_MAX_HEIGHT", 1080))
+
+        self.ctx = mp.get_context("spawn")
+        self.msg_q = self.ctx.Queue()
+        self.events = events   # 主行程的 EventSink，子行程事件經 msg_q 轉送
+        self.workers = {}      # camera_id → RemoteWorker
+        self.groups = []       # [(process, ctrl_q, [camera_id, ...])]
+        self.running = False
+
+        # 事件影像緩衝的總記憶體上限平均分給各子行程（0 表示不錄）
+        n_groups = max(1, -(-len(cameras) // self.cameras_per_process))
+        clip_budget = (clip_budget_mb / n_groups) if clip_budget_mb else 0
+
+        for i in range(0, len(cameras), self.cameras_per_process):
+            group = cameras[i:i + self.cameras_per_process]
+            ctrl_q = self.ctx.Queue()
+            specs = []
+            for cam in group:
+                slot = FrameSlot(max_width, max_height)
+                self.workers[cam["camera_id"]] = RemoteWorker(
+                    cam["camera_id"], cam["camera_url"], slot, ctrl_q)
+                specs.append((cam["camera_id"], cam["camera_url"], slot.name))
+            proc = self.ctx.Process(
+                target=_worker_main,
+                args=(specs, max_width, max_height, ctrl_q, self.msg_q, clip_budget),
+                daemon=True)
+            self.groups.append((proc, ctrl_q, [c["camera_id"] for c in group]))
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._pump_messages, daemon=True).start()
+        for proc, _, cids in self.groups:
+            proc.start()
+            print(f"[INFO] Started worker process pid={proc.pid} for cameras {cids}")
+
+    def stop(self, timeout=5.0):
+        for proc, ctrl_q, _ in self.groups:
+            ctrl_q.put(("stop_all", None, None))
+        for proc, _, _ in self.groups:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+        self.running = False
+        # 子行程結束前送出的事件仍要轉交 EventSink
+        while True:
+            try:
+                self._handle(*self.msg_q.get_nowait())
+            except (queue.Empty, EOFError, OSError):
+                break
+        for w in self.workers.values():
+            w.slot.close()
+
+    def _pump_messages(self):
+        """接收子行程回報的狀態訊息"""
+        while self.running:
+            try:
+                kind, camera_id, payload = self.msg_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            self._handle(kind, camera_id, payload)
+
+    def _handle(self, kind, camera_id, payload):
+        if kind == "frame" and camera_id in self.workers:
+            # 只有在有人觀看時才從共享記憶體複製影格
+            w = self.workers[camera_id]
+            seq, w.overlay = payload
+            if w.broadcaster.has_viewers:
+                frame, scale = w.slot.read()
+                if frame is not None:
+                    w.broadcaster.publish(frame, scale_overlay(w.overlay, scale))
+        elif kind == "stats" and camera_id in self.workers:
+            self.workers[camera_id].stats = payload
+        elif kind == "event" and self.events is not None:
+            self.events.emit(**payload)
+        elif kind == "log":
+            print(payload)
+
+
+# =========================================================
+# 🔸 子行程進入點
+# =========================================================
+class _ForwardSink:
+    """子行程內的事件寫入器：把事件轉送給主行程的 EventSink"""
+
+    def __init__(self, msg_q):
+        self.msg_q = msg_q
+
+    def emit(self, camera_id, gate_id, event_type, alert_level, timestamp=None, event_key=None):
+        # 事件鍵在子行程產生，本行程的 ClipRecorder 才能以同一個鍵記錄影像證據
+        event_key = event_key or new_event_key()
+        self.msg_q.put(("event", camera_id, {
+            "camera_id": camera_id, "gate_id": gate_id, "event_type": event_type,
+            "alert_level": alert_level, "timestamp": timestamp or datetime.datetime.now(),
+            "event_key": event_key,
+        }))
+        return event_key
+
+
+class _SlotPublisher:
+    """子行程內取代 FrameBroadcaster：主行程有觀看者時才寫入共享記憶體並通知"""
+
+    def __init__(self, camera_id, slot, msg_q):
+        self.camera_id = camera_id
+        self.slot = slot
+        self.msg_q = msg_q
+
+    @property
+    def has_viewers(self):
+        return self.slot.wanted
+
+    def publish(self, frame, overlay=None):
+        self.slot.write(frame)
+        self.msg_q.put(("frame", self.camera_id, (self.slot.seq, overlay)))
+
+
+def _worker_main(specs, max_width, max_height, ctrl_q, msg_q, clip_budget_mb=0):
+    from detector.detector_inout import InOutDetector
+    from detector.inference_service import InferenceService
+    from detector.clip_recorder import ClipRecorder
+
+    inference = InferenceService()   # 同一子行程內的攝影機共用模型
+    events = _ForwardSink(msg_q)
+    clips = ClipRecorder(budget_mb=clip_budget_mb) if clip_budget_mb else None
+    detectors = {}
+    threads = []
+    slots = []
+    for camera_id, camera_url, slot_name in specs:
+        slot = FrameSlot(max_width, max_height, name=slot_name)
+        slots.append(slot)
+        det = InOutDetector(camera_id, camera_url, inference=inference, events=events, clips=clips)
+        det.broadcaster = _SlotPublisher(camera_id, slot, msg_q)
+        detectors[camera_id] = det
+        t = threading.Thread(target=det.run, daemon=True)
+        t.start()
+        threads.append(t)
+        msg_q.put(("log", camera_id, f"[INFO] Started InOutDetector for Camera {camera_id} (pid={os.getpid()})"))
+
+    last_report = 0.0
+    while True:
+        try:
+            cmd, camera_id, arg = ctrl_q.get(timeout=1.0)
+        except queue.Empty:
+            cmd = None
+
+        if cmd == "reload_gates" and camera_id in detectors:
+            detectors[camera_id].reload_gates()
+        elif cmd == "gate_changed" and camera_id in detectors:
+            try:
+                detectors[camera_id].gate_changed(arg)
+            except Exception as e:
+                msg_q.put(("log", camera_id, f"[ERROR] Gate update failed for camera {camera_id}: {e}"))
+        elif cmd == "analyzers_changed" and camera_id in detectors:
+            try:
+                detectors[camera_id].analyzers_changed()
+            except Exception as e:
+                msg_q.put(("log", camera_id, f"[ERROR] Analyzer update failed for camera {camera_id}: {e}"))
+        elif cmd == "stop" and camera_id in detectors:
+            detectors[camera_id].stop()
+        elif cmd == "stop_all":
+            break
+
+        if time.time() - last_report >= 1.0:
+            for cid, det in detectors.items():
+                msg_q.put(("stats", cid, {"capture": det.capture_stats(), "tracks": det.track_stats(),
+                                        "motion": det.motion_stats(),
+                                        "stages": det.stage_stats(),
+                                        "clips": det.clip_stats(),
+                                        "analyzers": det.analyzer_stats()}))
+            last_report = time.time()
+
+    for det in detectors.values():
+        det.stop()
+    inference.stop()
+    if clips is not None:
+        clips.stop()
+    # 偵測執行緒可能仍在透過 numpy view 寫入共享記憶體，確定結束後才能關閉槽位
+    deadline = time.time() + 3.0
+    for t in threads:
+        t.join(max(0.0, deadline - time.time()))
+    if any(t.is_alive() for t in threads):
+        # 仍未結束的執行緒隨行程一起終止；不關閉槽位，避免寫入已釋放的記憶體
+        msg_q.put(("log", None, f"[WARN] Detector threads still running in pid={os.getpid()}, "
+                                "leaving shared memory to process exit"))
+        return
+    for slot in slots:
+        slot.close()
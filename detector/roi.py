@@ -0,0 +1,80 @@
+# 門線 ROI 裁切推論：只對門線附近的區域做推論
+#   - 門線只關心距離線段 MIN_NEAR 以內的腳點，人體則由腳點往上延伸
+#   - 以所有門線端點的外接矩形，向上加人體高度、左右與向下加邊界，作為裁切範圍
+#   - 推論尺寸依裁切大小決定（32 的倍數、不超過原設定），再把框與關鍵點平移回原影格座標
+import os, math
+
+import numpy as np
+
+from detector.gate_engine import MIN_NEAR
+from detector.inference_service import Detections
+
+STRIDE = 32
+
+
+class GateROI:
+    def __init__(self, gates, frame_shape, body_px=None, side_px=None, below_px=None,
+                 max_imgsz=960, max_fraction=None):
+        # 門線上方需容納整個人體，左右半個肩寬，下方只需 MIN_NEAR 再加一點餘裕
+        body_px = body_px or int(os.getenv("ROI_BODY_PX", 360))
+        side_px = side_px or int(os.getenv("ROI_SIDE_PX", 120))
+        below_px = below_px or int(os.getenv("ROI_BELOW_PX", MIN_NEAR + 40))
+        # 裁切面積超過此比例就不值得裁，直接用整張
+        max_fraction = max_fraction or float(os.getenv("ROI_MAX_FRACTION", 0.6))
+
+        h, w = frame_shape[:2]
+        self.frame_shape = (h, w)
+        self.rect = None          # (x1, y1, x2, y2)；None 表示整張推論
+        self.imgsz = max_imgsz
+
+        pts = [p for g in gates if g["a"][0] >= 0 and g["b"][0] >= 0 for p in (g["a"], g["b"])]
+        if not pts:
+            return
+        xs = [p[0] for p in pts]
+        ys = [p[1] for p in pts]
+        x1 = max(0, min(xs) - side_px)
+        x2 = min(w, max(xs) + side_px)
+        y1 = max(0, min(ys) - body_px)
+        y2 = min(h, max(ys) + below_px)
+        if x2 <= x1 or y2 <= y1 or (x2 - x1) * (y2 - y1) > max_fraction * w * h:
+            return
+
+        self.rect = (int(x1), int(y1), int(x2), int(y2))
+        # 原設定下整張影格的縮放比例，裁切後維持相同解析度即可
+        scale = min(1.0, max_imgsz / float(max(w, h)))
+        side = max(x2 - x1, y2 - y1) * scale
+        self.imgsz = min(max_imgsz, max(STRIDE, int(math.ceil(side / STRIDE)) * STRIDE))
+
+    @property
+    def active(self):
+        return self.rect is not None
+
+    def crop(self, frame):
+        """回傳要送推論的影格（裁切為 view，不複製）"""
+        if self.rect is None:
+            return frame
+        x1, y1, x2, y2 = self.rect
+        return frame[y1:y2, x1:x2]
+
+    def to_frame(self, dets):
+        """裁切座標 → 原影格座標"""
+        if self.rect is None or len(dets.boxes) == 0:
+            return dets
+        x1, y1 = self.rect[0], self.rect[1]
+        boxes = dets.boxes + np.array([x1, y1, x1, y1], dtype=dets.boxes.dtype)
+        kps = None
+        if dets.kps is not None:
+            kps = dets.kps.copy()
+            # 未偵測到的關鍵點為 (0, 0)，維持原值以免被誤判為有效
+            valid = (kps[..., 0] > 0) | (kps[..., 1] > 0)
+            kps[..., 0] = np.where(valid, kps[..., 0] + x1, 0)
+            kps[..., 1] = np.where(valid, kps[..., 1] + y1, 0)
+        return Detections(boxes, dets.ids, kps)
+
+    def stats(self):
+        h, w = self.frame_shape
+        if self.rect is None:
+            return {"rect": None, "imgsz": self.imgsz, "area_fraction": 1.0}
+        x1, y1, x2, y2 = self.rect
+        return {"rect": list(self.rect), "imgsz": self.imgsz,
+                "area_fraction": round((x2 - x1) * (y2 - y1) / float(w * h), 3)}
@@ -0,0 +1,98 @@
+# 排程預先編譯：把 start/end 時段轉成一天 1440 分鐘的啟用表
+#   - 支援跨日時段（例如 22:00 ~ 06:00）與同一對象多個時段
+#   - 判斷是否啟用只需一次 bytearray 索引，不解析字串、不配置物件
+#   - 時段為 [開始, 結束)：結束時間不含在內，且無條件進位到分鐘
+#     （結束 17:30 → 17:30:00 起不啟用；結束 17:30:45 → 17:30 整分鐘仍啟用）
+import time, datetime
+from datetime import timedelta
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minute(value, default, ceil=False):
+    """MySQL TIME(timedelta) / datetime.time / "HH:MM[:SS]" → 一天中的第幾分鐘。
+    ceil=True 時不足一分鐘的秒數進位（時段結束用）"""
+    if value is None or value == "":
+        return default
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds())
+    elif isinstance(value, (datetime.time, datetime.datetime)):
+        seconds = value.hour * 3600 + value.minute * 60 + value.second
+    else:
+        parts = str(value).split(":")
+        try:
+            seconds = int(parts[0]) * 3600 + int(parts[1]) * 60 + (int(float(parts[2])) if len(parts) > 2 else 0)
+        except (IndexError, ValueError):
+            return default
+    minute = -(-seconds // 60) if ceil else seconds // 60
+    return minute % MINUTES_PER_DAY
+
+
+def minute_of_day(ts=None):
+    """epoch 秒數（預設現在）→ 本地時間的第幾分鐘；每幀計算一次即可"""
+    t = time.localtime(ts)
+    return t.tm_hour * 60 + t.tm_min
+
+
+class ActiveSchedule:
+    """一天每分鐘是否啟用；時段為 [start, end) 分鐘，end <= start 表示跨日"""
+    __slots__ = ("mask", "windows")
+
+    def __init__(self, windows=()):
+        self.mask = bytearray(MINUTES_PER_DAY)
+        self.windows = []
+        for start, end in windows:
+            self.add_window(start, end)
+
+    @classmethod
+    def from_times(cls, start, end):
+        sched = cls()
+        sched.add_times(start, end)
+        return sched
+
+    @classmethod
+    def always(cls):
+        return cls([(0, MINUTES_PER_DAY)])
+
+    def add_times(self, start, end):
+        """資料庫的 start_time / end_time；未設定開始為 00:00，未設定結束為 24:00"""
+        start = to_minute(start, 0)
+        end = to_minute(end, MINUTES_PER_DAY, ceil=True)
+        if end == start == 0:
+            end = MINUTES_PER_DAY   # 00:00 ~ 00:00（或 24:00）視為全天
+        self.add_window(start, end)
+
+    def add_window(self, start, end):
+        if start < end:
+            self.mask[start:end] = b"\x01" * (end - start)
+        elif start > end:   # 跨日
+            self.mask[start:] = b"\x01" * (MINUTES_PER_DAY - start)
+            self.mask[:end] = b"\x01" * end
+        self.windows.append((start, end))
+
+    def is_active(self, minute):
+        """minute：minute_of_day() 的結果"""
+        return self.mask[minute] == 1
+
+    def __repr__(self):
+        spans = ", ".join(f"{s // 60:02d}:{s % 60:02d}~{e // 60:02d}:{e % 60:02d}" for s, e in self.windows)
+        return f"ActiveSchedule({spans})"
+
+
+def load_camera_schedules(camera_id, function_types=("falling", "climbing")):
+    """攝影機層級（不綁門線）的排程：function_type → ActiveSchedule"""
+    from db_utils import db_cursor   # 延後載入：時段計算本身不需要資料庫
+    with db_cursor(dictionary=True) as cur:
+        cur.execute(f"""
+            SELECT function_type, start_time, end_time
+            FROM func_schedules
+            WHERE camera_id = %s AND is_active = 1
+              AND function_type IN ({", ".join(["%s"] * len(function_types))});
+        """, (camera_id, *function_types))
+        rows = cur.fetchall()
+
+    schedules = {}
+    for r in rows:
+        sched = schedules.setdefault(r["function_type"], ActiveSchedule())
+        sched.add_times(r["start_time"], r["end_time"])
+    return schedules
@@ -0,0 +1,89 @@
+# 每個 track id 的門線狀態（有上限、逾時淘汰）
+#   - 追蹤器每出現一個新 id 就多一筆，長時間運轉的攝影機若不清理會持續累積
+#   - 依最後出現時間排序（OrderedDict），淘汰時只需從最舊的一端取出
+#   - 超過 N 幀或 N 秒沒出現即移除；總數超過上限時先淘汰最久未出現者
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+
+class TrackState:
+    """單一 track 對所有門線的狀態（欄位順序與 GateEngine.gates 相同）"""
+    __slots__ = ("side", "last_evt", "last_xy", "seen_frame", "seen_at")
+
+    def __init__(self, G):
+        self.side = np.zeros(G, dtype=np.int8)          # 上一幀所在側
+        self.last_evt = np.zeros(G, dtype=np.float64)   # 上次觸發時間
+        self.last_xy = np.full((G, 2), np.nan)          # 上次觸發時腳點，NaN 表示無
+        self.seen_frame = 0
+        self.seen_at = 0.0
+
+
+class TrackStore:
+    def __init__(self, ttl_frames=None, ttl_sec=None, max_tracks=None, factory=TrackState):
+        self.factory = factory         # 新 track 的狀態建構函式（參數為 touch 傳入的 G）
+        self.ttl_frames = ttl_frames or int(os.getenv("TRACK_TTL_FRAMES", 150))
+        self.ttl_sec = ttl_sec or float(os.getenv("TRACK_TTL_SEC", 10))
+        self.max_tracks = max_tracks or int(os.getenv("TRACK_MAX", 2048))
+        self._tracks = OrderedDict()   # tid → TrackState，最久未出現者在前
+
+        # 統計資料
+        self.expired = 0
+        self.evicted = 0
+        self.peak = 0
+
+    def empty_like(self):
+        """同設定、沿用統計的空容器（門線更新時搬移狀態用）"""
+        new = TrackStore(self.ttl_frames, self.ttl_sec, self.max_tracks, self.factory)
+        new.expired, new.evicted, new.peak = self.expired, self.evicted, self.peak
+        return new
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __contains__(self, tid):
+        return tid in self._tracks
+
+    def items(self):
+        return self._tracks.items()
+
+    def get(self, tid):
+        return self._tracks.get(tid)
+
+    def touch(self, tid, G, frame, now):
+        """取得（必要時建立）tid 的狀態，並標記為本幀出現"""
+        rec = self._tracks.get(tid)
+        if rec is None:
+            rec = self._tracks[tid] = self.factory(G)
+        else:
+            self._tracks.move_to_end(tid)
+        rec.seen_frame = frame
+        rec.seen_at = now
+        return rec
+
+    def put(self, tid, rec):
+        self._tracks[tid] = rec
+
+    def sweep(self, frame, now):
+        """移除逾時的 track；超過上限時淘汰最久未出現者"""
+        tracks = self._tracks
+        while tracks:
+            rec = next(iter(tracks.values()))
+            if frame - rec.seen_frame <= self.ttl_frames and now - rec.seen_at <= self.ttl_sec:
+                break
+            tracks.popitem(last=False)
+            self.expired += 1
+        while len(tracks) > self.max_tracks:
+            tracks.popitem(last=False)
+            self.evicted += 1
+        self.peak = max(self.peak, len(tracks))
+
+    def stats(self):
+        return {
+            "tracks": len(self._tracks),
+            "peak": self.peak,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "max_tracks": self.max_tracks,
+        }
@@ -1,29 +1,63 @@
 # detector/video_manager.py
 # 所有攝影機對應的偵測執行緒
+import os
+import time
 import threading
-from db_utils import get_db_connection
+from db_utils import db_cursor
 from detector.detector_inout import InOutDetector
+from detector.inference_service import InferenceService
+from event_sink import EventSink
+from detector.clip_recorder import ClipRecorder
 
 
 class VideoManager:
-    def __init__(self):
+    def __init__(self, mode=None):
         # camera_id → worker 對照表（方便查找）
         self.workers = {}
+        # camera_id → 偵測執行緒（停止時等待結束）
+        self.threads = {}
+        # 所有 worker 共用的推論服務（單一模型、批次推論）
+        self.inference = None
+        # 所有 worker 共用的事件寫入器（背景批次寫入資料庫）
+        self.events = None
+        # 執行模式："thread"（預設，同行程執行緒）或 "process"（多行程）
+        self.mode = mode or os.getenv("DETECTOR_MODE", "thread")
+        self.pool = None
+        # 事件前後影像：所有攝影機共用的記憶體上限（MB），0 表示不錄
+        self.clip_budget_mb = float(os.getenv("CLIP_BUFFER_MB", 256)) if os.getenv("CLIP_RECORDING", "1") == "1" else 0
+        self.clips = None
 
     def load_all_cameras(self):
-        conn = get_db_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT camera_id, camera_url FROM cameras;")
-        cameras = cur.fetchall()
+        with db_cursor(dictionary=True) as cur:
+            cur.execute("SELECT camera_id, camera_url FROM cameras;")
+            cameras = cur.fetchall()
 
         print(f"[DEBUG] Cameras found: {len(cameras)}")
 
+        if self.events is None:
+            self.events = EventSink()
+
+        if self.mode == "process":
+            # 子行程各自載入模型，主行程只保留代理物件；事件回傳主行程寫入
+            from detector.process_pool import ProcessPool
+            self.pool = ProcessPool(cameras, events=self.events, clip_budget_mb=self.clip_budget_mb)
+            self.workers = dict(self.pool.workers)
+            print(f"[DEBUG] Loaded {len(self.workers)} camera workers "
+                  f"in {len(self.pool.groups)} processes.")
+            return
+
+        if self.inference is None:
+            self.inference = InferenceService()
+        if self.clips is None and self.clip_budget_mb:
+            self.clips = ClipRecorder(budget_mb=self.clip_budget_mb)
+
         for cam in cameras:
             camera_id = cam["camera_id"]
             camera_url = cam["camera_url"]
 
             from detector.detector_inout import InOutDetector
-            worker = InOutDetector(camera_id, camera_url)
+            worker = InOutDetector(camera_id, camera_url, inference=self.inference,
+                                   events=self.events, clips=self.clips)
             self.workers[camera_id] = worker
 
             # cur.execute("""
@@ -34,27 +68,109 @@ class VideoManager:
             # cnt = cur.fetchone()["cnt"]
             # print(f"[DEBUG] Camera {camera_id} gate count = {cnt}")
 
-        cur.close()
-        conn.close()
         print(f"[DEBUG] Loaded {len(self.workers)} camera workers.")
 
 
     def start_all(self):
         """為所有攝影機啟動 YOLO 偵測執行緒"""
+        if self.pool is not None:
+            self.pool.start()
+            return
         for cid, w in self.workers.items():
             t = threading.Thread(target=w.run, daemon=True)
             t.start()
+            self.threads[cid] = t
             print(f"[INFO] Started InOutDetector for Camera {cid}")
 
-    def stop_all(self):
+    def stop_all(self, timeout=5.0):
         """停止所有偵測執行緒"""
-        for w in self.workers.values():
-            w.stop()
+        if self.pool is not None:
+            self.pool.stop()
+        else:
+            for w in self.workers.values():
+                w.stop()
+            if self.inference is not None:
+                self.inference.stop()   # 讓卡在 infer() 的執行緒立即返回
+            # 等偵測執行緒處理完最後一幀，該幀的事件才會進入佇列
+            deadline = time.time() + timeout
+            for cid, t in self.threads.items():
+                t.join(max(0.0, deadline - time.time()))
+                if t.is_alive():
+                    print(f"[WARN] Detector thread for camera {cid} did not stop within {timeout}s")
+            if self.clips is not None:
+                self.clips.stop()
+        # 偵測停止後把佇列中剩餘事件寫完
+        if self.events is not None:
+            self.events.stop()
 
     def get_worker(self, camera_id):
         """提供外部 API 查找對應攝影機的偵測執行緒"""
         return self.workers.get(camera_id)
 
+    def get_broadcaster(self, camera_id):
+        """取得指定攝影機的 MJPEG 廣播器"""
+        worker = self.workers.get(camera_id)
+        return worker.broadcaster if worker is not None else None
+
+    def capture_stats(self):
+        """各攝影機擷取端的統計（camera_id → stats）"""
+        return {cid: w.capture_stats() for cid, w in self.workers.items()}
+
+    def clip_stats(self):
+        """事件影像緩衝統計；多行程模式下每個子行程各一份"""
+        if self.pool is not None:
+            return [self.workers[cids[0]].clip_stats() for _, _, cids in self.pool.groups if cids]
+        return self.clips.stats() if self.clips is not None else {}
+
+    def stage_stats(self):
+        """各攝影機的階段耗時直方圖快照（camera_id → snapshot）"""
+        return {cid: w.stage_stats() for cid, w in self.workers.items()}
+
+    def inference_stats(self):
+        """共用推論服務統計（多行程模式下各子行程各自推論，不在此列）"""
+        return self.inference.stats() if self.inference is not None else {}
+
+    def motion_stats(self):
+        """各攝影機的推論 duty cycle（camera_id → stats）"""
+        return {cid: w.motion_stats() for cid, w in self.workers.items()}
+
+    def track_stats(self):
+        """各攝影機的追蹤狀態統計（camera_id → stats）"""
+        return {cid: w.track_stats() for cid, w in self.workers.items()}
+
+    def analyzer_stats(self):
+        """各攝影機啟用的功能分析器統計（camera_id → {name: stats}）"""
+        return {cid: w.analyzer_stats() for cid, w in self.workers.items()}
+
+    def event_stats(self):
+        """事件寫入器統計：佇列深度、寫入數、批次寫入延遲"""
+        return self.events.stats() if self.events is not None else {}
+
+    def notify_gate_change(self, camera_id, gate_id=None):
+        """設定寫入後由 Flask 呼叫：只把變動的門線推給對應 worker（gate_id=None 表示整支攝影機）"""
+        worker = self.get_worker(int(camera_id))
+        if worker is None:
+            return False
+        try:
+            worker.gate_changed(gate_id)
+        except Exception as e:
+            # 通知失敗不影響寫入結果，下次變更或手動 reload 會再同步
+            print(f"[WARN] Gate change for camera {camera_id} not applied: {e}")
+            return False
+        return True
+
+    def notify_analyzer_change(self, camera_id):
+        """功能模式、排程或區域寫入後由 Flask 呼叫：對應 worker 重新載入分析器設定"""
+        worker = self.get_worker(int(camera_id))
+        if worker is None:
+            return False
+        try:
+            worker.analyzers_changed()
+        except Exception as e:
+            print(f"[WARN] Analyzer change for camera {camera_id} not applied: {e}")
+            return False
+        return True
+
     def reload_worker_gates(self, camera_id):
         """由 Flask 呼叫時，重新載入指定攝影機的門線設定"""
         worker = self.get_worker(camera_id)
@@ -0,0 +1,155 @@
+# 區域索引：把一支攝影機的區域多邊形預先點陣化成位元遮罩
+#   - 遮罩以 ZONE_CELL_PX 像素為一格（預設 4，1280x720 → 320x180），每個區域佔一個 bit，
+#     每 32 個區域一張 uint32 平面
+#   - 所有腳點的區域歸屬與各區域人數只需一次陣列索引，不逐點逐區域做多邊形判斷
+#   - 區域新增 / 修改 / 刪除時只清除並重畫該區域外框範圍內的 bit，其他區域不動
+import os
+
+import cv2
+import numpy as np
+
+# 門線 / 區域座標以 1280x720 正規化儲存（與 InOutDetector._load_gates 相同）
+FRAME_W, FRAME_H = 1280, 720
+BITS = 32
+
+
+def zone_polygon(coords, frame_w=FRAME_W, frame_h=FRAME_H):
+    """polygon_json → (K, 2) 像素座標。
+    {"points": [[x, y], ...]} 為多邊形；只有 {"A", "B"} 時視為以 A、B 為對角的矩形"""
+    if isinstance(coords, dict) and "points" in coords:
+        pts = coords["points"]
+    elif isinstance(coords, list):
+        pts = coords
+    else:
+        (ax, ay), (bx, by) = coords["A"], coords["B"]
+        pts = [(ax, ay), (bx, ay), (bx, by), (ax, by)]
+    return np.array([(x * frame_w, y * frame_h) for x, y in pts], dtype=np.float32)
+
+
+class _Zone:
+    __slots__ = ("slot", "poly", "bbox")
+
+    def __init__(self, slot, poly, bbox):
+        self.slot = slot    # bit 編號（平面 = slot // 32）
+        self.poly = poly    # 原始多邊形（像素座標），用來判斷是否變更
+        self.bbox = bbox    # 遮罩格座標 (x0, y0, x1, y1)，清除時只處理此範圍
+
+
+class ZoneIndex:
+    def __init__(self, width=FRAME_W, height=FRAME_H, cell=None):
+        self.cell = cell or int(os.getenv("ZONE_CELL_PX", 4))
+        self.width, self.height = width, height
+        self.gw = -(-width // self.cell)
+        self.gh = -(-height // self.cell)
+        self.mask = np.zeros((1, self.gh, self.gw), dtype=np.uint32)
+        self._zones = {}    # zone_id → _Zone
+        self._free = []     # 已釋放、可重用的 bit
+
+        # 統計資料
+        self.rasterized = 0
+
+    def __len__(self):
+        return len(self._zones)
+
+    def __contains__(self, zone_id):
+        return zone_id in self._zones
+
+    # =====================================================
+    # 🔹 建立與增量更新
+    # =====================================================
+    def replace(self, zones):
+        """zones：{zone_id: poly}。只重畫新增或座標改變的區域，刪除不再存在的區域"""
+        for zid in [zid for zid in self._zones if zid not in zones]:
+            self.remove(zid)
+        for zid, poly in zones.items():
+            self.set(zid, poly)
+
+    def set(self, zone_id, poly):
+        """新增或更新單一區域；座標相同時不做任何事"""
+        poly = np.asarray(poly, dtype=np.float32).reshape(-1, 2)
+        z = self._zones.get(zone_id)
+        if z is not None:
+            if z.poly.shape == poly.shape and np.array_equal(z.poly, poly):
+                return
+            self._clear(z)
+            slot = z.slot
+        else:
+            slot = self._alloc()
+        self._zones[zone_id] = self._draw(slot, poly)
+        self.rasterized += 1
+
+    def remove(self, zone_id):
+        z = self._zones.pop(zone_id, None)
+        if z is not None:
+            self._clear(z)
+            self._free.append(z.slot)
+
+    def _alloc(self):
+        """優先重用已釋放的最小 bit；沒有空位時 bit 連續配置"""
+        if self._free:
+            self._free.sort()
+            return self._free.pop(0)
+        slot = len(self._zones)
+        if slot // BITS >= self.mask.shape[0]:
+            # 超過 32 個區域：加一張平面
+            self.mask = np.concatenate([self.mask, np.zeros((1, self.gh, self.gw), dtype=np.uint32)])
+        return slot
+
+    def _draw(self, slot, poly):
+        pts = np.round(poly / self.cell).astype(np.int32)
+        x0, y0 = np.clip(pts.min(axis=0), 0, (self.gw, self.gh))
+        x1, y1 = np.clip(pts.max(axis=0) + 1, 0, (self.gw, self.gh))
+        bbox = (int(x0), int(y0), int(x1), int(y1))
+        if x1 > x0 and y1 > y0:
+            tmp = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(tmp, [pts - (x0, y0)], 1)
+            plane, bit = divmod(slot, BITS)
+            self.mask[plane, y0:y1, x0:x1] |= tmp.astype(np.uint32) << np.uint32(bit)
+        return _Zone(slot, poly, bbox)
+
+    def _clear(self, z):
+        x0, y0, x1, y1 = z.bbox
+        plane, bit = divmod(z.slot, BITS)
+        self.mask[plane, y0:y1, x0:x1] &= ~np.uint32(1 << bit)
+
+    # =====================================================
+    # 🔹 查詢（偵測迴圈每幀呼叫）
+    # =====================================================
+    def lookup(self, points):
+        """points (N, 2) 像素座標 → (N, 平面數) uint32 位元；畫面外的點為 0"""
+        pts = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        gx = np.floor(pts[:, 0] / self.cell).astype(np.int64)
+        gy = np.floor(pts[:, 1] / self.cell).astype(np.int64)
+        inside = (gx >= 0) & (gx < self.gw) & (gy >= 0) & (gy < self.gh)
+        bits = self.mask[:, np.where(inside, gy, 0), np.where(inside, gx, 0)].T
+        bits[~inside] = 0
+        return bits
+
+    def slots(self, zone_ids):
+        """zone_ids → bit 編號陣列（未登記的區域為 -1）；區域設定不變時可重複使用"""
+        return np.array([self._zones[zid].slot if zid in self._zones else -1 for zid in zone_ids],
+                        dtype=np.int64)
+
+    def membership(self, points, slots):
+        """(N, Z) bool：每個點是否在各區域內；slots 由 slots() 取得"""
+        bits = self.lookup(points)
+        if len(slots) == 0:
+            return np.zeros((len(bits), 0), dtype=bool)
+        known = slots >= 0
+        planes, shifts = np.divmod(np.where(known, slots, 0), BITS)
+        out = (bits[:, planes] >> shifts.astype(np.uint32)) & np.uint32(1)
+        return out.astype(bool) & known
+
+    def counts(self, points, slots):
+        """(Z,) 各區域內的點數"""
+        return self.membership(points, slots).sum(axis=0)
+
+    def stats(self):
+        return {
+            "zones": len(self._zones),
+            "grid": [self.gw, self.gh],
+            "cell_px": self.cell,
+            "planes": self.mask.shape[0],
+            "mask_kb": round(self.mask.nbytes / 1024, 1),
+            "rasterized": self.rasterized,
+        }
@@ -0,0 +1,90 @@
+# 行程內事件廣播：偵測端發出的事件即時推送給 SSE 連線（/api/events/stream）
+#   - EventSink.emit() 立即推送 alert（帶 event_key）；批次寫入資料庫後再推送 stored（event_key → event_id）
+#   - 同步訂閱者（Flask）以 subscribe() 阻塞等待
+#   - 事件迴圈（server.py）以 add_listener() 取得通知，再以 poll() 取出新事件
+import json, time, threading
+from collections import deque
+
+
+def format_sse(event_id, event, kind="alert"):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+class EventHub:
+    """有界重播緩衝 + Condition 通知。
+    閒置的訂閱者只是阻塞在 wait() 上，不佔 CPU。"""
+
+    def __init__(self, replay_size=500):
+        self._cond = threading.Condition()
+        self._buffer = deque(maxlen=replay_size)   # (id, kind, event)
+        # 以啟動時間（毫秒）作為序號起點，重啟後 id 仍遞增
+        self._last_id = int(time.time() * 1000)
+        self.subscribers = 0
+        self._listeners = []   # 新事件通知回呼（在發出事件的執行緒呼叫，必須立即返回）
+
+    def publish(self, event, kind="alert"):
+        """kind 為 SSE 的 event 名稱：alert（新事件）/ stored（事件已寫入，附 event_id）"""
+        with self._cond:
+            self._last_id += 1
+            self._buffer.append((self._last_id, kind, event))
+            self._cond.notify_all()
+            listeners = self._listeners
+        for fn in listeners:
+            fn()
+
+    def add_listener(self, fn):
+        with self._cond:
+            self._listeners = self._listeners + [fn]
+
+    def remove_listener(self, fn):
+        with self._cond:
+            self._listeners = [f for f in self._listeners if f is not fn]
+
+    def _since(self, last_id):
+        return [item for item in self._buffer if item[0] > last_id]
+
+    def attach(self, last_id=None):
+        """登記一位訂閱者，回傳重播起點（Last-Event-ID 無效時為目前最新 id）"""
+        with self._cond:
+            self.subscribers += 1
+            if last_id is None or last_id > self._last_id:
+                last_id = self._last_id
+        return last_id
+
+    def detach(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def poll(self, last_id):
+        """不等待：回傳 (最新 id, last_id 之後的事件)"""
+        with self._cond:
+            return self._last_id, self._since(last_id)
+
+    def subscribe(self, last_id=None, match=None, keepalive=15.0):
+        """SSE 產生器：先重播 last_id 之後的事件，再持續推送新事件"""
+        last_id = self.attach(last_id)
+        try:
+            yield "retry: 3000\n\n"
+            last_write = time.monotonic()
+            while True:
+                # 以上次送出資料的時間計算：事件都被過濾掉時仍會送 keepalive
+                timeout = max(keepalive - (time.monotonic() - last_write), 0)
+                with self._cond:
+                    self._cond.wait_for(lambda: self._last_id > last_id, timeout)
+                    pending = self._since(last_id)
+                    last_id = self._last_id
+                for i, kind, e in pending:
+                    if match is None or match(e):
+                        last_write = time.monotonic()
+                        yield format_sse(i, e, kind)
+                if time.monotonic() - last_write >= keepalive:
+                    last_write = time.monotonic()
+                    yield ": keepalive\n\n"
+        finally:
+            self.detach()
+
+    def stats(self):
+        return {"subscribers": self.subscribers, "buffered": len(self._buffer), "last_id": self._last_id}
+
+
+event_hub = EventHub()
@@ -0,0 +1,157 @@
+# 事件預先彙總：每分鐘 / 每小時的計數（攝影機 × 門線 × 事件類型 × 警示等級）
+#   - EventSink 寫入事件時，在同一個交易內累加彙總表
+#   - /api/events/stats 直接讀彙總表，不掃 events 原始資料
+#   - 既有資料回填：python -m event_rollups backfill [--since 2025-01-01]
+#   - 每分鐘彙總只保留 EVENT_ROLLUP_MINUTE_DAYS 天（EventSink 定期清除，或 python -m event_rollups purge）
+import os, argparse, datetime
+from collections import Counter
+from db_utils import db_cursor, table_exists
+
+# 粒度 → (彙總表, 將 datetime 截斷到該粒度的函式, MySQL DATE_FORMAT 格式)
+GRANULARITIES = {
+    "minute": ("event_rollup_minute", lambda t: t.replace(second=0, microsecond=0), "%Y-%m-%d %H:%i:00"),
+    "hour":   ("event_rollup_hour",   lambda t: t.replace(minute=0, second=0, microsecond=0), "%Y-%m-%d %H:00:00"),
+}
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        bucket      DATETIME     NOT NULL,
+        camera_id   INT          NOT NULL,
+        gate_id     INT          NOT NULL DEFAULT 0,   -- 無門線的事件記為 0
+        event_type  VARCHAR(32)  NOT NULL,
+        alert_level VARCHAR(16)  NOT NULL,
+        cnt         INT UNSIGNED NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, camera_id, gate_id, event_type, alert_level)
+    );
+"""
+
+# 每分鐘彙總的保留天數（每小時彙總不清除）
+MINUTE_RETENTION_DAYS = float(os.getenv("EVENT_ROLLUP_MINUTE_DAYS", 7))
+
+UPSERT_SQL = """
+    INSERT INTO {table} (bucket, camera_id, gate_id, event_type, alert_level, cnt)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt);
+"""
+
+
+def ensure_tables():
+    with db_cursor(commit=True) as cur:
+        for table, _, _ in GRANULARITIES.values():
+            cur.execute(CREATE_SQL.format(table=table))
+
+
+def tables_exist():
+    return table_exists(*(table for table, _, _ in GRANULARITIES.values()))
+
+
+# =========================================================
+# 🔸 增量更新（由 EventSink 在寫入事件的交易中呼叫）
+# =========================================================
+def apply_batch(cur, batch):
+    """依一批事件累加各粒度的彙總計數"""
+    for table, trunc, _ in GRANULARITIES.values():
+        counts = Counter(
+            (trunc(e["timestamp"]), e["camera_id"], e["gate_id"] or 0, e["event_type"], e["alert_level"])
+            for e in batch
+        )
+        cur.executemany(UPSERT_SQL.format(table=table),
+                        [key + (n,) for key, n in counts.items()])
+
+
+def purge_minutes(days=None, chunk=10000):
+    """刪除超過保留天數的每分鐘彙總；分段刪除，避免長時間鎖表。回傳刪除筆數"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=MINUTE_RETENTION_DAYS if days is None else days)
+    table = GRANULARITIES["minute"][0]
+    total = 0
+    while True:
+        with db_cursor(commit=True) as cur:
+            cur.execute(f"DELETE FROM {table} WHERE bucket < %s LIMIT {int(chunk)};", (cutoff,))
+            n = cur.rowcount
+        total += n
+        if n < chunk:
+            return total
+
+
+# =========================================================
+# 🔸 查詢
+# =========================================================
+def query_stats(bucket="hour", start=None, end=None, camera_id=None, gate_id=None,
+                event_type=None, alert_level=None, group_by=("camera", "gate", "type", "level")):
+    """回傳時間分桶的計數；bucket 可為 minute / hour / day（day 由小時表彙總）。
+    minute 只涵蓋最近 MINUTE_RETENTION_DAYS 天"""
+    table = GRANULARITIES["minute" if bucket == "minute" else "hour"][0]
+    dims = {"camera": "camera_id", "gate": "gate_id", "type": "event_type", "level": "alert_level"}
+    cols = [dims[g] for g in group_by if g in dims]
+    bucket_expr = "DATE(bucket)" if bucket == "day" else "bucket"
+
+    query = f"""
+        SELECT {bucket_expr} AS bucket{''.join(', ' + c for c in cols)}, SUM(cnt) AS count
+        FROM {table}
+        WHERE bucket >= %s AND bucket < %s
+    """
+    now = datetime.datetime.now()
+    params = [start or now - datetime.timedelta(days=1), end or now + datetime.timedelta(minutes=1)]
+    for col, val in (("camera_id", camera_id), ("gate_id", gate_id),
+                     ("event_type", event_type), ("alert_level", alert_level)):
+        if val is not None:
+            query += f" AND {col} = %s"
+            params.append(val)
+    query += f" GROUP BY {', '.join(['1'] + cols)} ORDER BY 1"
+
+    with db_cursor(dictionary=True) as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    for r in rows:
+        r["count"] = int(r["count"])
+    return rows
+
+
+# =========================================================
+# 🔸 回填既有事件
+# =========================================================
+def backfill(since=None, until=None):
+    """以原始 events 表重建彙總，逐日在單一交易內「刪除 + 重算」"""
+    ensure_tables()
+    with db_cursor() as cur:
+        cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM events;")
+        lo, hi = cur.fetchone()
+    if lo is None:
+        print("[INFO] No events to backfill")
+        return
+    day = (since or lo).replace(hour=0, minute=0, second=0, microsecond=0)
+    stop = until or hi
+    while day <= stop:
+        nxt = day + datetime.timedelta(days=1)
+        with db_cursor(commit=True) as cur:
+            for table, _, fmt in GRANULARITIES.values():
+                cur.execute(f"DELETE FROM {table} WHERE bucket >= %s AND bucket < %s;", (day, nxt))
+                cur.execute(f"""
+                    INSERT INTO {table} (bucket, camera_id, gate_id, event_type, alert_level, cnt)
+                    SELECT DATE_FORMAT(timestamp, '{fmt}'), camera_id, COALESCE(gate_id, 0),
+                           event_type, alert_level, COUNT(*)
+                    FROM events
+                    WHERE timestamp >= %s AND timestamp < %s
+                    GROUP BY 1, 2, 3, 4, 5;
+                """, (day, nxt))
+        print(f"[INFO] Backfilled rollups for {day.date()}")
+        day = nxt
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Event rollup maintenance")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("init", help="create rollup tables")
+    pg = sub.add_parser("purge", help="delete minute rollups older than the retention period")
+    pg.add_argument("--days", type=float)
+    bf = sub.add_parser("backfill", help="rebuild rollups from the events table")
+    bf.add_argument("--since", type=datetime.datetime.fromisoformat)
+    bf.add_argument("--until", type=datetime.datetime.fromisoformat)
+    args = ap.parse_args()
+
+    if args.cmd == "init":
+        ensure_tables()
+    elif args.cmd == "purge":
+        print(f"[INFO] Purged {purge_minutes(args.days)} minute rollup rows")
+    else:
+        backfill(args.since, args.until)
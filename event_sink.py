@@ -0,0 +1,274 @@
+# 非同步事件寫入：偵測執行緒只把事件放進佇列，由背景執行緒批次寫入資料庫
+#   - 資料表結構不在執行期變更；部署或升級時執行一次：python -m event_sink init
+#     （events.event_key、每分鐘 / 每小時彙總表、event_media）
+import os, json, time, uuid, queue, argparse, threading, datetime
+from db_utils import db_cursor, column_exists
+import event_rollups
+from event_hub import event_hub
+from metrics import event_flush_seconds
+
+INSERT_SQL = """
+    INSERT INTO events (camera_id, gate_id, event_type, alert_level, timestamp, event_key)
+    VALUES (%s, %s, %s, %s, %s, %s);
+"""
+
+# 尚未執行 init（沒有 events.event_key）時改用舊格式寫入
+LEGACY_INSERT_SQL = """
+    INSERT INTO events (camera_id, gate_id, event_type, alert_level, timestamp)
+    VALUES (%s, %s, %s, %s, %s);
+"""
+
+
+def new_event_key():
+    return uuid.uuid4().hex
+
+
+def ensure_event_key():
+    """events.event_key：產生事件時就給定的唯一鍵，影像證據（event_media）以此對應事件。
+    只由 init 指令呼叫"""
+    if column_exists("events", "event_key"):
+        return
+    with db_cursor(commit=True) as cur:
+        cur.execute("ALTER TABLE events ADD COLUMN event_key CHAR(32) NULL, "
+                    "ADD UNIQUE KEY uk_events_event_key (event_key);")
+
+
+class EventSink:
+    """有界佇列 + 背景批次寫入（executemany）。
+    資料庫無法連線時先寫入本地暫存檔，恢復後再補寫。"""
+
+    def __init__(self, maxsize=None, batch_size=None, flush_interval=None, spool_path=None, hub=None):
+        self.batch_size = batch_size or int(os.getenv("EVENT_BATCH_SIZE", 100))
+        self.flush_interval = flush_interval or float(os.getenv("EVENT_FLUSH_SEC", 1.0))
+        self.spool_path = spool_path or os.getenv("EVENT_SPOOL_PATH", "data/event_spool.jsonl")
+        self.queue = queue.Queue(maxsize=maxsize or int(os.getenv("EVENT_QUEUE_SIZE", 10000)))
+        self.hub = hub or event_hub   # 即時推送給 SSE 訂閱者
+        self.running = True
+        self._spool_lock = threading.Lock()
+        self._next_replay = 0.0   # 暫存檔下次補寫時間（失敗時退避）
+        # 資料表結構只在第一次寫入前檢查一次（唯讀查詢，不執行 DDL）
+        self._schema_checked = False
+        self._keyed = False           # events.event_key 存在
+        self._rollups_ready = False   # 彙總表存在
+        self._next_purge = 0.0        # 下次清除過期的每分鐘彙總
+
+        # 統計資料
+        self.written = 0          # 已寫入資料庫的事件數
+        self.rollup_failed = 0    # 事件已寫入但彙總未累加的批次數（可用 event_rollups backfill 補回）
+        self.spooled = 0          # 寫入暫存檔的事件數
+        self.dropped = 0          # 佇列已滿而丟棄的事件數
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    # =====================================================
+    # 🔹 對外介面（偵測執行緒呼叫，不會阻塞）
+    # =====================================================
+    def emit(self, camera_id, gate_id, event_type, alert_level, timestamp=None, event_key=None):
+        """回傳事件鍵（寫入 events.event_key，影像證據以此對應）；佇列已滿而丟棄時回傳 None"""
+        evt = {
+            "camera_id": camera_id,
+            "gate_id": gate_id,
+            "event_type": event_type,
+            "alert_level": alert_level,
+            "timestamp": timestamp or datetime.datetime.now(),
+            "event_key": event_key or new_event_key(),
+        }
+        # 即時推送不等資料庫寫入；event_id 於寫入後以 stored 訊息補送
+        self.hub.publish({**evt, "timestamp": evt["timestamp"].isoformat()})
+        try:
+            self.queue.put_nowait(evt)
+            return evt["event_key"]
+        except queue.Full:
+            self.dropped += 1
+            return None
+
+    def stop(self, timeout=10.0):
+        """停止接收並把佇列中剩餘事件寫完"""
+        self.running = False
+        self.thread.join(timeout)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "written": self.written,
+            "spooled": self.spooled,
+            "dropped": self.dropped,
+            "rollup_failed": self.rollup_failed,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+    # =====================================================
+    # 🔹 背景寫入迴圈
+    # =====================================================
+    def _loop(self):
+        batch = []
+        deadline = None
+        while self.running or not self.queue.empty():
+            timeout = self.flush_interval if deadline is None else max(deadline - time.time(), 0)
+            try:
+                evt = self.queue.get(timeout=timeout)
+                batch.append(evt)
+                if deadline is None:
+                    deadline = time.time() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            if batch and (len(batch) >= self.batch_size or time.time() >= deadline
+                          or not self.running):
+                self._flush(batch)
+                batch, deadline = [], None
+            elif not batch and time.time() >= self._next_replay and os.path.exists(self.spool_path):
+                self._replay_spool()
+            elif not batch and time.time() >= self._next_purge:
+                self._purge_rollups()
+
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        t0 = time.time()
+        try:
+            self._write(batch)
+            self.written += len(batch)
+        except Exception as e:
+            print(f"[WARN] Event DB write failed, spooling {len(batch)} events: {e}")
+            for evt in batch:
+                evt.pop("event_id", None)   # 交易未成功，取回的 id 無效
+            self._spool(batch)
+        self._publish_ids(batch)
+        event_flush_seconds.observe(time.time() - t0)
+        ms = (time.time() - t0) * 1000.0
+        self.last_flush_ms = ms
+        self.total_flush_ms += ms
+        self.flushes += 1
+
+    def _write(self, batch):
+        self._check_schema()
+        rows = [(e["camera_id"], e["gate_id"], e["event_type"], e["alert_level"], e["timestamp"])
+                + ((e.get("event_key"),) if self._keyed else ())
+                for e in batch]
+        with db_cursor(commit=True) as cur:
+            cur.executemany(INSERT_SQL if self._keyed else LEGACY_INSERT_SQL, rows)
+            if self._rollups_ready:
+                self._apply_rollups(cur, batch)
+            if self._keyed:
+                self._assign_ids(cur, batch)
+
+    def _assign_ids(self, cur, batch):
+        """以 event_key 取回各事件的 event_id（寫入 e["event_id"]）"""
+        keys = [e["event_key"] for e in batch if e.get("event_key")]
+        if not keys:
+            return
+        cur.execute(f"SELECT event_key, event_id FROM events WHERE event_key IN ({', '.join(['%s'] * len(keys))});",
+                    keys)
+        ids = dict(cur.fetchall())
+        for e in batch:
+            e["event_id"] = ids.get(e.get("event_key"))
+
+    def _publish_ids(self, batch):
+        """已寫入的事件：推送 event_key → event_id，頁面據此補上即時列的編號"""
+        for e in batch:
+            if e.get("event_id") is not None:
+                self.hub.publish({"event_key": e["event_key"], "event_id": e["event_id"],
+                                  "camera_id": e["camera_id"], "event_type": e["event_type"],
+                                  "alert_level": e["alert_level"]}, kind="stored")
+
+    def _apply_rollups(self, cur, batch):
+        """同一交易內累加每分鐘 / 每小時彙總；彙總失敗只退回彙總部分，事件照常寫入"""
+        cur.execute("SAVEPOINT rollups;")
+        try:
+            event_rollups.apply_batch(cur, batch)
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT rollups;")
+            self.rollup_failed += 1
+            print(f"[WARN] Event rollup update failed ({len(batch)} events not counted): {e}")
+
+    def _check_schema(self):
+        """第一次寫入前確認結構並記住結果；資料庫無法連線時例外向上拋（本批改寫入暫存檔），下次再查"""
+        if self._schema_checked:
+            return
+        self._keyed = column_exists("events", "event_key")
+        self._rollups_ready = event_rollups.tables_exist()
+        self._schema_checked = True
+        if not self._keyed:
+            print("[WARN] events.event_key missing, event media will not be linked; run: python -m event_sink init")
+        if not self._rollups_ready:
+            print("[WARN] Event rollup tables missing, rollups disabled; run: python -m event_sink init")
+
+    def _purge_rollups(self):
+        """每小時清除一次過期的每分鐘彙總"""
+        self._next_purge = time.time() + 3600.0
+        if not self._rollups_ready:
+            return
+        try:
+            n = event_rollups.purge_minutes()
+            if n:
+                print(f"[INFO] Purged {n} minute rollup rows")
+        except Exception as e:
+            print(f"[WARN] Minute rollup purge failed: {e}")
+
+    # =====================================================
+    # 🔹 本地暫存（資料庫無法連線時）
+    # =====================================================
+    def _spool(self, batch):
+        with self._spool_lock:
+            os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for e in batch:
+                    f.write(json.dumps({**e, "timestamp": e["timestamp"].isoformat()}) + "\n")
+            self.spooled += len(batch)
+
+    def _replay_spool(self):
+        """資料庫恢復後補寫暫存檔；失敗就留待下次"""
+        with self._spool_lock:
+            try:
+                with open(self.spool_path, encoding="utf-8") as f:
+                    pending = [json.loads(line) for line in f if line.strip()]
+            except FileNotFoundError:
+                return
+            for e in pending:
+                e["timestamp"] = datetime.datetime.fromisoformat(e["timestamp"])
+            try:
+                for i in range(0, len(pending), self.batch_size):
+                    self._write(pending[i:i + self.batch_size])
+            except Exception:
+                # 已寫入的部分移除，避免重複
+                self._rewrite_spool(pending[i:])
+                self.written += i
+                self._next_replay = time.time() + 10.0
+                return
+            os.remove(self.spool_path)
+            self.written += len(pending)
+            print(f"[INFO] Replayed {len(pending)} spooled events")
+
+    def _rewrite_spool(self, pending):
+        with open(self.spool_path, "w", encoding="utf-8") as f:
+            for e in pending:
+                f.write(json.dumps({**e, "timestamp": e["timestamp"].isoformat()}) + "\n")
+
+
+def init_schema():
+    """建立 / 升級事件相關的資料表結構（需 CREATE / ALTER 權限）"""
+    from detector.clip_recorder import ensure_table as ensure_media_table
+    ensure_event_key()
+    print("[INFO] events.event_key ready")
+    event_rollups.ensure_tables()
+    print("[INFO] Event rollup tables ready")
+    ensure_media_table()
+    print("[INFO] event_media table ready")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Event storage maintenance")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("init", help="create or upgrade the event tables (run once per deployment)")
+    args = ap.parse_args()
+
+    if args.cmd == "init":
+        init_schema()
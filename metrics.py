@@ -0,0 +1,148 @@
+# 輕量指標：Prometheus 文字格式（/metrics）
+#   - 直方圖只在熱路徑做一次 bisect + 計數，不依賴 prometheus_client
+#   - 佇列深度、觀看人數、連線池等「現況值」不在熱路徑記錄，
+#     由 collector 在被抓取（scrape）時才向各元件的 stats() 讀取
+#   - 直方圖可 snapshot() 成純資料，多行程模式下由子行程隨狀態訊息回傳
+import bisect, threading
+
+# 秒；涵蓋 1ms 的 JPEG 編碼到數秒的資料庫寫入
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _fmt_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最後一格為 +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, _HistogramChild(self.buckets))
+        return child
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def snapshot(self):
+        """{label 值 tuple: (各桶計數, 總和)}，可直接 pickle 傳給主行程"""
+        return {key: child.snapshot() for key, child in list(self._children.items())}
+
+    def render(self, snapshot=None, extra=None):
+        """extra：附加在最前面的 (label 名稱, label 值)，用於合併各攝影機的快照"""
+        names = self.label_names
+        if extra:
+            names = (extra[0],) + names
+        lines = []
+        for key, (counts, total) in (snapshot if snapshot is not None else self.snapshot()).items():
+            values = ((extra[1],) + tuple(key)) if extra else tuple(key)
+            cum = 0
+            for le, n in zip(self.buckets + (float("inf"),), counts):
+                cum += n
+                lines.append(f"{self.name}_bucket{_fmt_labels(names + ('le',), values + (_fmt_value(le),))} {cum}")
+            lines.append(f"{self.name}_sum{_fmt_labels(names, values)} {total!r}")
+            lines.append(f"{self.name}_count{_fmt_labels(names, values)} {cum}")
+        return lines
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        h = Histogram(name, help, labels, buckets)
+        self._metrics.append(h)
+        return h
+
+    def collector(self, fn):
+        """註冊抓取時才執行的函式；fn() 回傳文字行的 list（可用 gauge() / counter() 產生）"""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for h in self._metrics:
+            lines += h.header() + h.render()
+        for fn in self._collectors:
+            try:
+                lines += fn()
+            except Exception as e:
+                lines.append(f"# collector {getattr(fn, '__name__', fn)} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def gauge(name, help, samples, labels=(), type="gauge"):
+    """samples：[(label 值 tuple, 數值)] → Prometheus 文字行"""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+    for values, v in samples:
+        lines.append(f"{name}{_fmt_labels(labels, values)} {_fmt_value(v)}")
+    return lines
+
+
+def counter(name, help, samples, labels=()):
+    return gauge(name, help, samples, labels, type="counter")
+
+
+registry = Registry()
+
+# 主行程內直接記錄的直方圖
+http_request_seconds = registry.histogram(
+    "http_request_seconds", "Flask request handling time", ("endpoint", "method", "status"))
+db_wait_seconds = registry.histogram(
+    "db_pool_wait_seconds", "Time waiting for a pooled DB connection")
+db_cursor_seconds = registry.histogram(
+    "db_cursor_seconds", "Time a db_cursor() block held its connection")
+event_flush_seconds = registry.histogram(
+    "event_flush_seconds", "Event batch write time (insert + rollups)")
+stream_encode_seconds = registry.histogram(
+    "stream_encode_seconds", "MJPEG frame encode time", ("camera", "profile"))
+
+# 偵測器各階段耗時；每個偵測器各自持有（子行程可回傳快照），抓取時合併輸出
+STAGE_METRIC = ("detector_stage_seconds", "Per-frame detector stage time",
+                ("stage",), DEFAULT_BUCKETS)
+
+
+def stage_histogram():
+    return Histogram(*STAGE_METRIC)
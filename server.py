@@ -0,0 +1,254 @@
+# server.py
+# 正式環境服務模式：ASGI（Starlette + uvicorn）
+#   python server.py            （HOST / PORT / API_THREADS / STREAM_ENCODE_THREADS）
+#
+#   - /video_feed 與 /api/events/stream 由事件迴圈直接服務：觀看者只是等待中的協程，
+#     偵測端 publish 新影格 / 新事件時才被喚醒，不再是每人一條 sleep 輪詢的執行緒
+#   - 繪圖與 JPEG 編碼在固定大小的執行緒池（同一影格同一規格只編碼一次）
+#   - 其餘 JSON API 與頁面沿用 Flask app，經 WSGI 轉接在固定大小的執行緒池執行
+#   - 偵測系統在 lifespan 啟動時啟動一次；收到停止訊號時結束串流、停止偵測並寫完剩餘事件
+import os, time, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import app as flask_app, manager, start_detection_system
+from detector.broadcaster import parse_profile, mjpeg_part
+from event_hub import event_hub, format_sse
+import metrics
+
+
+class _Signal:
+    """其他執行緒 → 事件迴圈的通知。
+    notify() 可在任何執行緒呼叫；協程先 arm() 取得 future 再檢查資料，沒有新資料才 await，
+    兩者之間發生的通知不會遺失。"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._fut = loop.create_future()
+        self.users = 0
+
+    def notify(self):
+        self.loop.call_soon_threadsafe(self._fire)
+
+    def _fire(self):
+        fut, self._fut = self._fut, self.loop.create_future()
+        if not fut.done():
+            fut.set_result(None)
+
+    def arm(self):
+        return self._fut
+
+
+class StreamHub:
+    """事件迴圈端的串流狀態：每支攝影機一個影格通知（有觀看者時才向廣播器登記）、
+    一個事件通知、編碼執行緒池，以及停止旗標"""
+
+    def __init__(self, loop, encode_threads=None):
+        self.loop = loop
+        self.pool = ThreadPoolExecutor(encode_threads or int(os.getenv("STREAM_ENCODE_THREADS", 4)),
+                                       thread_name_prefix="stream-encode")
+        self.frames = {}    # camera_id → (broadcaster, _Signal)
+        self.events = _Signal(loop)
+        self.stopping = loop.create_future()
+        event_hub.add_listener(self.events.notify)
+
+    def acquire(self, camera_id, broadcaster):
+        entry = self.frames.get(camera_id)
+        if entry is None or entry[0] is not broadcaster:
+            entry = self.frames[camera_id] = (broadcaster, _Signal(self.loop))
+            broadcaster.add_listener(entry[1].notify)
+        entry[1].users += 1
+        return entry[1]
+
+    def release(self, camera_id, signal):
+        signal.users -= 1
+        entry = self.frames.get(camera_id)
+        if signal.users == 0 and entry is not None and entry[1] is signal:
+            # 沒人看的攝影機不再每幀喚醒事件迴圈
+            entry[0].remove_listener(signal.notify)
+            del self.frames[camera_id]
+
+    async def wait(self, fut, timeout):
+        """等待通知、停止或逾時；回傳 False 表示服務正在停止"""
+        await asyncio.wait((fut, self.stopping), timeout=timeout)
+        return not self.stopping.done()
+
+    def stop(self):
+        """喚醒並結束所有串流（在事件迴圈執行緒呼叫）"""
+        if not self.stopping.done():
+            self.stopping.set_result(None)
+        event_hub.remove_listener(self.events.notify)
+        for broadcaster, signal in self.frames.values():
+            broadcaster.remove_listener(signal.notify)
+
+    def close(self):
+        self.stop()
+        self.pool.shutdown(wait=True)
+
+
+hub = None   # lifespan 啟動時建立
+
+
+def _observe(endpoint, t0, status=200):
+    # 與 Flask 端相同：串流回應只計到開始傳送為止
+    metrics.http_request_seconds.labels(endpoint, "GET", status).observe(time.perf_counter() - t0)
+
+
+# =========================================================
+# 🔸 MJPEG 串流
+# =========================================================
+async def _mjpeg(camera_id, profile):
+    # 偵測系統可能尚未啟動完成，等到對應的廣播器出現
+    broadcaster = manager.get_broadcaster(camera_id)
+    while broadcaster is None:
+        if not await hub.wait(hub.loop.create_future(), 1.0):   # 只等逾時或停止
+            return
+        broadcaster = manager.get_broadcaster(camera_id)
+
+    signal = hub.acquire(camera_id, broadcaster)
+    interval = 1.0 / profile.fps
+    try:
+        with broadcaster.watching(profile):
+            seq, sent, next_at = 0, 0, 0.0
+            while not hub.stopping.done():
+                delay = next_at - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)   # fps 節流
+                fut = signal.arm()
+                seq_new, enc_seq, jpeg = await hub.loop.run_in_executor(
+                    hub.pool, broadcaster.next_jpeg, profile, seq)
+                if seq_new == seq:
+                    # 沒有新影格：等 publish 通知（逾時只為了定期檢查停止旗標）
+                    if not await hub.wait(fut, 5.0):
+                        return
+                    continue
+                seq = seq_new
+                if jpeg is None or enc_seq == sent:
+                    continue
+                sent, next_at = enc_seq, time.time() + interval
+                yield mjpeg_part(jpeg)
+    finally:
+        hub.release(camera_id, signal)
+
+
+async def video_feed(request):
+    t0 = time.perf_counter()
+    # 串流規格：?profile=full|hd|sd|thumb，可再用 max_width / fps / quality 覆寫
+    profile = parse_profile(request.query_params)
+    camera_id = request.path_params["camera_id"]
+    resp = StreamingResponse(_mjpeg(camera_id, profile),
+                             media_type="multipart/x-mixed-replace; boundary=frame")
+    _observe("video_feed", t0)
+    return resp
+
+
+# =========================================================
+# 🔸 Server-Sent Events
+# =========================================================
+async def _sse(last_id, match, keepalive=15.0):
+    last_id = event_hub.attach(last_id)
+    try:
+        yield "retry: 3000\n\n"
+        last_write = time.monotonic()
+        while True:
+            fut = hub.events.arm()
+            newest, pending = event_hub.poll(last_id)
+            if not pending:
+                # 以上次送出資料的時間計算：事件都被過濾掉時仍會送 keepalive
+                timeout = max(keepalive - (time.monotonic() - last_write), 0)
+                if not await hub.wait(fut, timeout):
+                    return
+                newest, pending = event_hub.poll(last_id)
+            last_id = newest
+            for i, kind, e in pending:
+                if match is None or match(e):
+                    last_write = time.monotonic()
+                    yield format_sse(i, e, kind)
+            if time.monotonic() - last_write >= keepalive:
+                last_write = time.monotonic()
+                yield ": keepalive\n\n"
+    finally:
+        event_hub.detach()
+
+
+def _int_or_none(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+async def stream_events(request):
+    """Server-Sent Events：即時推送新事件
+    ?camera_id=&type=&level= 於伺服器端過濾；斷線重連時依 Last-Event-ID 重播"""
+    t0 = time.perf_counter()
+    args = request.query_params
+    camera_id = _int_or_none(args.get("camera_id"))
+    event_type = args.get("type")
+    level = args.get("level")
+    last_id = _int_or_none(request.headers.get("Last-Event-ID"))
+
+    def match(e):
+        return ((camera_id is None or e["camera_id"] == camera_id) and
+                (not event_type or e["event_type"] == event_type) and
+                (not level or e["alert_level"] == level))
+
+    resp = StreamingResponse(_sse(last_id, match), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    _observe("stream_events", t0)
+    return resp
+
+
+# =========================================================
+# 🔸 啟動與停止
+# =========================================================
+class _Lifespan:
+    def __init__(self, app):
+        self.starter = None
+
+    async def __aenter__(self):
+        global hub
+        loop = asyncio.get_running_loop()
+        hub = StreamHub(loop)
+        # 載入攝影機與模型需要一段時間，背景進行，服務可先開始接受連線
+        self.starter = threading.Thread(target=start_detection_system, name="detection-start", daemon=True)
+        self.starter.start()
+
+    async def __aexit__(self, *exc):
+        loop = asyncio.get_running_loop()
+        hub.stop()
+        await loop.run_in_executor(None, hub.close)
+        # 偵測系統仍在啟動中時等它完成，再一起停止（並寫完佇列中的事件）
+        await loop.run_in_executor(None, self.starter.join)
+        await loop.run_in_executor(None, manager.stop_all)
+        print("[INFO] Detection system stopped")
+
+
+app = Starlette(
+    routes=[
+        Route("/video_feed/{camera_id:int}", video_feed),
+        Route("/api/events/stream", stream_events),
+        Mount("/", app=WSGIMiddleware(flask_app, workers=int(os.getenv("API_THREADS", 8)))),
+    ],
+    lifespan=_Lifespan,
+)
+
+
+class _Server(uvicorn.Server):
+    """收到停止訊號時先結束所有串流，uvicorn 才不會等長連線逾時"""
+
+    def handle_exit(self, sig, frame):
+        if hub is not None:
+            hub.loop.call_soon_threadsafe(hub.stop)
+        super().handle_exit(sig, frame)
+
+
+if __name__ == "__main__":
+    config = uvicorn.Config(app, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", 5000)),
+                            timeout_graceful_shutdown=5)
+    _Server(config).run()
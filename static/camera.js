@@ -1,3 +1,5 @@
+import { videoFeedUrl } from "./stream_profile.js";
+
 window.onload = async function () {
   const imgStream = document.getElementById("videoStream");
   const canvas = document.getElementById("drawCanvas");
@@ -24,7 +26,8 @@ window.onload = async function () {
 
     // 顯示影片
     document.getElementById("cameraTitle").textContent = data.camera_name;
-    imgStream.src = `/video_feed/${cameraId}`;
+    // 依影片區實際寬度挑選串流規格，避免小螢幕拉全解析度
+    imgStream.src = videoFeedUrl(cameraId, imgStream.parentElement.clientWidth);
 
     // === 綁定開關 ===
     const climbSwitch = document.getElementById("climb-switch");
@@ -73,6 +76,18 @@ window.onload = async function () {
   }
   await loadCamera();
 
+  /* === 即時警示（SSE）：只訂閱這支攝影機 === */
+  const liveAlert = document.getElementById("liveAlert");
+  let alertTimer = null;
+  const alerts = new EventSource(`/api/events/stream?camera_id=${cameraId}`);
+  alerts.addEventListener("alert", (msg) => {
+    const e = JSON.parse(msg.data);
+    liveAlert.textContent = `⚠ ${e.event_type} (${e.alert_level})`;
+    liveAlert.classList.remove("hidden");
+    clearTimeout(alertTimer);
+    alertTimer = setTimeout(() => liveAlert.classList.add("hidden"), 5000);
+  });
+
   imgStream.onload = function () {
     canvas.width = imgStream.clientWidth;
     canvas.height = imgStream.clientHeight;
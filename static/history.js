@@ -7,7 +7,17 @@ function formatDateTime(dateStr) {
        + `${pad(date.getHours())}:${pad(date.getMinutes())}:${pad(date.getSeconds())}`;
 }
 
-async function loadEvents() {
+const PAGE_SIZE = 100;
+
+// 🔹 目前的查詢狀態（分頁游標）
+let currentParams = null;
+let nextCursor = null;
+let loading = false;
+let hasMore = false;
+let queryToken = 0;        // 每次重新查詢遞增；較舊查詢的回應直接丟棄
+let pageController = null;
+
+function buildParams() {
   const start = document.getElementById("startDate").value;
   const end = document.getElementById("endDate").value;
   const type = document.getElementById("typeSelect").value;
@@ -18,40 +28,141 @@ async function loadEvents() {
   if (end) params.append("end", end + " 23:59:59");
   if (type) params.append("type", type);
   if (level) params.append("level", level);
+  params.append("limit", PAGE_SIZE);
+  return params;
+}
+
+function appendRows(rows) {
+  const tbody = document.querySelector("#eventTable tbody");
+  for (const e of rows) {
+    const tr = document.createElement("tr");
+    tr.innerHTML = `
+      <td>${e.event_id}</td>
+      <td>${e.camera_name || "—"}</td>
+      <td>${e.gate_name || "—"}</td>
+      <td>${e.event_type}</td>
+      <td class="${e.alert_level}">${e.alert_level}</td>
+      <td>${formatDateTime(e.timestamp)}</td>
+    `;
+    tbody.appendChild(tr);
+  }
+}
+
+// 🔹 載入下一頁（以 next_cursor 接續）
+async function loadNextPage() {
+  if (loading) return;
+  loading = true;
+
+  const token = queryToken;
+  const controller = pageController = new AbortController();
+  const params = new URLSearchParams(currentParams);
+  if (nextCursor) params.append("cursor", nextCursor);
 
   try {
-    const res = await fetch("/api/events?" + params.toString());
+    const res = await fetch("/api/events?" + params.toString(), { signal: controller.signal });
     if (!res.ok) throw new Error("Failed to fetch events");
     const data = await res.json();
+    if (token !== queryToken) return;   // 查詢條件已變更
 
     const tbody = document.querySelector("#eventTable tbody");
-    tbody.innerHTML = "";
-
-    if (data.length === 0) {
+    if (!nextCursor && data.items.length === 0) {
       const tr = document.createElement("tr");
       tr.innerHTML = `<td colspan="6" class="no-data">No records found</td>`;
       tbody.appendChild(tr);
-      return;
     }
 
-    for (const e of data) {
-      const tr = document.createElement("tr");
-      tr.innerHTML = `
-        <td>${e.event_id}</td>
-        <td>${e.camera_name || "—"}</td>
-        <td>${e.gate_name || "—"}</td>
-        <td>${e.event_type}</td>
-        <td class="${e.alert_level}">${e.alert_level}</td>
-        <td>${formatDateTime(e.timestamp)}</td>
-      `;
-      tbody.appendChild(tr);
-    }
+    appendRows(data.items);
+    nextCursor = data.next_cursor;
+    hasMore = data.next_cursor !== null;
   } catch (err) {
-    console.error(err);
+    if (err.name !== "AbortError") console.error(err);
+  } finally {
+    if (token === queryToken) loading = false;
   }
+  if (token !== queryToken) return;
+
+  // 第一頁不足以填滿畫面時，繼續載入
+  const sentinel = document.getElementById("loadMore");
+  if (hasMore && sentinel.getBoundingClientRect().top < window.innerHeight) {
+    loadNextPage();
+  }
+}
+
+// 🔹 即時事件（SSE）：新事件直接插在表格最上方
+let liveSource = null;
+let cameraNames = {};
+
+function startLiveStream() {
+  if (liveSource) liveSource.close();
+
+  // 查詢的結束日期早於今天時，新事件不會落在範圍內
+  const end = document.getElementById("endDate").value;
+  const today = new Date().toISOString().slice(0, 10);
+  if (end && end < today) return;
+
+  const params = new URLSearchParams();
+  const type = document.getElementById("typeSelect").value;
+  const level = document.getElementById("levelSelect").value;
+  if (type) params.append("type", type);
+  if (level) params.append("level", level);
+
+  liveSource = new EventSource("/api/events/stream?" + params.toString());
+  liveSource.addEventListener("alert", (msg) => {
+    const e = JSON.parse(msg.data);
+    const tbody = document.querySelector("#eventTable tbody");
+    const empty = tbody.querySelector(".no-data");
+    if (empty) empty.parentElement.remove();
+
+    const tr = document.createElement("tr");
+    tr.className = "live";
+    tr.dataset.key = e.event_key;   // 寫入資料庫後由 stored 訊息補上 event_id
+    tr.innerHTML = `
+      <td>—</td>
+      <td>${cameraNames[e.camera_id] || e.camera_id}</td>
+      <td>${e.gate_id ? "#" + e.gate_id : "—"}</td>
+      <td>${e.event_type}</td>
+      <td class="${e.alert_level}">${e.alert_level}</td>
+      <td>${formatDateTime(e.timestamp)}</td>
+    `;
+    tbody.prepend(tr);
+  });
+  liveSource.addEventListener("stored", (msg) => {
+    const e = JSON.parse(msg.data);
+    const tr = document.querySelector(`#eventTable tr.live[data-key="${e.event_key}"]`);
+    if (tr) tr.cells[0].textContent = e.event_id;
+  });
+}
+
+// 🔹 重新查詢（清空表格、從第一頁開始）
+async function loadEvents() {
+  // 取消進行中的分頁請求，避免舊結果接在新查詢後面
+  queryToken++;
+  if (pageController) pageController.abort();
+  loading = false;
+
+  currentParams = buildParams();
+  nextCursor = null;
+  hasMore = false;
+  document.querySelector("#eventTable tbody").innerHTML = "";
+  await loadNextPage();
+  startLiveStream();
 }
 
 document.addEventListener("DOMContentLoaded", () => {
   document.getElementById("filterBtn").addEventListener("click", loadEvents);
+
+  // 捲到表格底部時自動載入下一頁
+  const sentinel = document.getElementById("loadMore");
+  const observer = new IntersectionObserver(entries => {
+    if (entries[0].isIntersecting && hasMore) loadNextPage();
+  });
+  observer.observe(sentinel);
+
+  // 攝影機名稱對照（即時事件只帶 camera_id）
+  fetch("/api/cameras")
+    .then(res => res.json())
+    .then(list => list.forEach(c => { cameraNames[c.camera_id] = c.camera_name; }))
+    .catch(err => console.error(err));
+
   loadEvents();
 });
@@ -1,3 +1,5 @@
+import { videoFeedUrl } from "./stream_profile.js";
+
 // 🔹 找到要放攝影機卡片的容器
 const cameraList = document.getElementById("cameraList");
 
@@ -34,7 +36,6 @@ function addCameraCard(cam) {
     <div class="camera-info">
       <h3>${cam.camera_name}</h3>
       <img
-        src="/video_feed/${cam.camera_id}"
         alt="Live stream for ${cam.camera_name}"
         style="width:100%; height:auto; object-fit:cover; border-radius:8px;"
       />
@@ -44,6 +45,10 @@ function addCameraCard(cam) {
     </div>
   `;
   cameraList.appendChild(card);
+
+  // 卡片加入畫面後才知道實際寬度，依寬度挑選串流規格
+  const img = card.querySelector("img");
+  img.src = videoFeedUrl(cam.camera_id, img.clientWidth);
 }
 
 
@@ -0,0 +1,14 @@
+// 🔹 依畫面顯示寬度挑選 /video_feed 串流規格（與後端 PROFILES 對應）
+//    full: 原始解析度 / hd: 1280px / sd: 640px / thumb: 320px
+export function pickStreamProfile(displayWidth) {
+  const px = displayWidth * (window.devicePixelRatio || 1);
+  if (px > 1280) return "full";
+  if (px > 640) return "hd";
+  if (px > 320) return "sd";
+  return "thumb";
+}
+
+// 🔹 產生串流網址
+export function videoFeedUrl(cameraId, displayWidth) {
+  return `/video_feed/${cameraId}?profile=${pickStreamProfile(displayWidth)}`;
+}
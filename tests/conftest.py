@@ -0,0 +1,4 @@
+# 測試時以專案根目錄為匯入起點（detector.*、benchmarks.*、config_cache 等）
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
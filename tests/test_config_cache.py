@@ -0,0 +1,92 @@
+# 設定快取：TTL、前綴失效，以及載入期間被失效的結果不得存入快取
+import threading
+
+from config_cache import ConfigCache
+
+
+class Loader:
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.values[min(self.calls, len(self.values)) - 1]
+
+
+def test_hit_after_miss():
+    cache = ConfigCache(ttl=60)
+    load = Loader({"a": 1})
+    v1, etag1 = cache.get(("cameras",), load)
+    v2, etag2 = cache.get(("cameras",), load)
+    assert v1 == v2 == {"a": 1} and etag1 == etag2
+    assert load.calls == 1
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_ttl_expiry():
+    cache = ConfigCache(ttl=0)
+    load = Loader([1], [2])
+    assert cache.get(("cameras",), load)[0] == [1]
+    assert cache.get(("cameras",), load)[0] == [2]
+    assert load.calls == 2
+
+
+def test_etag_follows_content():
+    cache = ConfigCache(ttl=60)
+    _, e1 = cache.get(("fence", 1), Loader({"x": 1}))
+    _, e2 = cache.get(("fence", 2), Loader({"x": 1}))
+    _, e3 = cache.get(("fence", 3), Loader({"x": 2}))
+    assert e1 == e2 != e3
+
+
+def test_prefix_invalidation():
+    cache = ConfigCache(ttl=60)
+    for key in [("fence", 3, "inout"), ("fence", 3, "intrusion"), ("fence", 4, "inout"), ("cameras",)]:
+        cache.get(key, Loader(key))
+    cache.invalidate(("fence", 3))
+    load = Loader("reloaded")
+    assert cache.get(("fence", 3, "inout"), load)[0] == "reloaded"
+    assert cache.get(("fence", 4, "inout"), load)[0] == ("fence", 4, "inout")
+    assert cache.get(("cameras",), load)[0] == ("cameras",)
+    assert load.calls == 1
+
+
+def test_invalidate_multiple_prefixes():
+    cache = ConfigCache(ttl=60)
+    cache.get(("camera", 1), Loader(1))
+    cache.get(("cameras",), Loader(2))
+    cache.invalidate(("camera", 1), ("cameras",))
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_during_load_is_not_cached():
+    cache = ConfigCache(ttl=60)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_loader():
+        started.set()
+        release.wait(5)
+        return "stale"
+
+    result = {}
+    t = threading.Thread(target=lambda: result.setdefault("v", cache.get(("cameras",), slow_loader)))
+    t.start()
+    started.wait(5)
+    cache.invalidate(("cameras",))   # 寫入 API 在載入途中更新了資料
+    release.set()
+    t.join(5)
+
+    assert result["v"][0] == "stale"   # 呼叫端仍取得載入結果
+    assert cache.get(("cameras",), Loader("fresh"))[0] == "fresh"
+
+
+def test_clear_during_load_is_not_cached():
+    cache = ConfigCache(ttl=60)
+
+    def loader():
+        cache.clear()
+        return "stale"
+
+    cache.get(("cameras",), loader)
+    assert cache.stats()["entries"] == 0
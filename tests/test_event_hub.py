@@ -0,0 +1,76 @@
+# SSE 事件廣播：重播、過濾與 keepalive
+import time
+
+from event_hub import EventHub, format_sse
+
+
+def test_format_sse():
+    text = format_sse(5, {"event_type": "inout"})
+    assert text == 'id: 5\nevent: alert\ndata: {"event_type": "inout"}\n\n'
+    assert format_sse(6, {}, "stored").startswith("id: 6\nevent: stored\n")
+
+
+def test_poll_returns_events_after_last_id():
+    hub = EventHub()
+    start = hub.attach()
+    hub.publish({"n": 1})
+    hub.publish({"n": 2})
+    newest, pending = hub.poll(start)
+    assert [e["n"] for _, _, e in pending] == [1, 2]
+    assert newest == pending[-1][0]
+    assert hub.poll(newest) == (newest, [])
+
+
+def test_attach_ignores_future_last_id():
+    hub = EventHub()
+    hub.publish({"n": 1})
+    newest, _ = hub.poll(0)
+    assert hub.attach(newest + 1000) == newest
+    assert hub.stats()["subscribers"] == 1
+    hub.detach()
+
+
+def test_listener_called_on_publish():
+    hub = EventHub()
+    calls = []
+    fn = lambda: calls.append(1)
+    hub.add_listener(fn)
+    hub.publish({})
+    hub.remove_listener(fn)
+    hub.publish({})
+    assert calls == [1]
+
+
+def test_subscribe_replays_from_last_event_id():
+    hub = EventHub(replay_size=10)
+    hub.publish({"n": 1})
+    first, _ = hub.poll(0)
+    hub.publish({"n": 2})
+    gen = hub.subscribe(last_id=first, keepalive=5)
+    assert next(gen).startswith("retry:")
+    assert '"n": 2' in next(gen)
+    gen.close()
+    assert hub.stats()["subscribers"] == 0
+
+
+def test_subscribe_keeps_event_kind():
+    hub = EventHub()
+    gen = hub.subscribe(keepalive=5)
+    next(gen)
+    hub.publish({"event_key": "k", "event_id": 9}, kind="stored")
+    assert next(gen).split("\n")[1] == "event: stored"
+    gen.close()
+
+
+def test_keepalive_sent_when_all_events_filtered():
+    hub = EventHub()
+    gen = hub.subscribe(match=lambda e: e["n"] == 1, keepalive=0.2)
+    next(gen)
+    for _ in range(5):
+        hub.publish({"n": 0})   # 持續有事件但都被過濾掉
+    t0 = time.monotonic()
+    assert next(gen) == ": keepalive\n\n"
+    assert time.monotonic() - t0 < 1.0
+    hub.publish({"n": 1})
+    assert '"n": 1' in next(gen)
+    gen.close()
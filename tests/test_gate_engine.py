@@ -0,0 +1,68 @@
+# GateEngine（向量化）與原本逐點迴圈的結果必須完全一致
+import numpy as np
+import pytest
+
+from benchmarks.gate_engine_bench import ScalarGates, make_scene
+from detector.gate_engine import GateEngine
+
+
+def _run_both(gates, frames, fps=15.0):
+    tids = list(range(1, len(frames[0]) + 1))
+    scalar, engine = ScalarGates(gates), GateEngine(gates)
+    for k, feet in enumerate(frames):
+        t = k / fps
+        expected = scalar.step(feet, tids, t, t)
+        got = [(c.person, c.tid, c.gate["id"], c.cross_dir, c.state)
+               for c in engine.step(np.array(feet), tids, t, t)]
+        assert got == expected, f"frame {k}"
+    return engine
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+def test_parity_random_scenes(seed):
+    gates, frames = make_scene(20, 8, 200, seed=seed)
+    _run_both(gates, frames)
+
+
+def test_parity_with_unset_gate():
+    # 端點為負的門線兩邊都要略過
+    gates, frames = make_scene(10, 4, 100, seed=5)
+    gates.append({"id": 99, "name": "unset", "a": (-1, -1), "b": (100, 100), "in_dir": 1})
+    engine = _run_both(gates, frames)
+    assert 99 not in engine.ids
+
+
+def test_crossing_direction_and_cooldown():
+    gate = {"id": 1, "name": "door", "a": (0, 100), "b": (200, 100), "in_dir": 1}
+    engine = GateEngine([gate])
+    # A->B 的左法向（影像座標）朝下：y=110 為 +1 側，y=90 為 -1 側
+    assert engine.step([(100, 110)], [7], 0.0, 0.0) == []
+    (c,) = engine.step([(100, 90)], [7], 1.0, 1.0)
+    assert (c.tid, c.cross_dir, c.state) == (7, "A->B", "Entry")
+    # 冷卻時間內回頭不觸發，側邊也不更新
+    assert engine.step([(100, 110)], [7], 1.1, 1.1) == []
+    (c,) = engine.step([(100, 110)], [7], 2.0, 2.0)
+    assert (c.cross_dir, c.state) == ("B->A", "inout")
+
+
+def test_far_from_gate_is_ignored():
+    gate = {"id": 1, "name": "door", "a": (0, 100), "b": (200, 100), "in_dir": 1}
+    engine = GateEngine([gate])
+    engine.step([(500, 110)], [1], 0.0, 0.0)
+    assert engine.step([(500, 90)], [1], 1.0, 1.0) == []
+
+
+def test_with_gates_keeps_unchanged_state():
+    g1 = {"id": 1, "name": "g1", "a": (0, 100), "b": (200, 100), "in_dir": 1}
+    g2 = {"id": 2, "name": "g2", "a": (0, 300), "b": (200, 300), "in_dir": 1}
+    engine = GateEngine([g1, g2])
+    engine.step([(100, 110), (100, 305)], [7, 8], 0.0, 0.0)
+    assert engine.tracks.get(8).side.tolist() == [0, 1]
+
+    # 欄位依新清單順序重排；端點變更的門線歸零，未變的沿用
+    moved = dict(g2, a=(0, 310), b=(200, 310))
+    new = engine.with_gates([moved, g1])
+    assert new.tracks.get(7).side.tolist() == [0, 1]
+    assert new.tracks.get(8).side.tolist() == [0, 0]
+    (c,) = new.step([(100, 90)], [7], 1.0, 1.0)
+    assert c.gate["id"] == 1
@@ -0,0 +1,57 @@
+# /metrics 的 Prometheus 文字格式
+from metrics import Histogram, Registry, counter, gauge
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("req_seconds", "Request time", ("endpoint",), buckets=(0.1, 1.0))
+    child = h.labels("api")
+    for v in (0.05, 0.5, 0.5, 3.0):
+        child.observe(v)
+    assert h.render() == [
+        'req_seconds_bucket{endpoint="api",le="0.1"} 1',
+        'req_seconds_bucket{endpoint="api",le="1.0"} 3',
+        'req_seconds_bucket{endpoint="api",le="+Inf"} 4',
+        'req_seconds_sum{endpoint="api"} 4.05',
+        'req_seconds_count{endpoint="api"} 4',
+    ]
+
+
+def test_histogram_boundary_goes_to_lower_bucket():
+    h = Histogram("x", "x", buckets=(0.1,))
+    h.observe(0.1)
+    assert h.render()[0] == 'x_bucket{le="0.1"} 1'
+
+
+def test_render_snapshot_with_extra_label():
+    h = Histogram("stage_seconds", "Stage time", ("stage",), buckets=(1.0,))
+    h.labels("infer").observe(0.5)
+    lines = h.render(h.snapshot(), extra=("camera", 3))
+    assert lines[0] == 'stage_seconds_bucket{camera="3",stage="infer",le="1.0"} 1'
+
+
+def test_gauge_and_counter():
+    assert gauge("queue_depth", "Queue depth", [(("events",), 7)], ("queue",)) == [
+        "# HELP queue_depth Queue depth",
+        "# TYPE queue_depth gauge",
+        'queue_depth{queue="events"} 7',
+    ]
+    assert counter("dropped_total", "Dropped", [((), 2.5)])[1:] == [
+        "# TYPE dropped_total counter",
+        "dropped_total 2.5",
+    ]
+
+
+def test_registry_render_and_failing_collector():
+    reg = Registry()
+    reg.histogram("h", "Help", buckets=(1.0,)).observe(0.5)
+    reg.collector(lambda: gauge("g", "G", [((), 1)]))
+
+    @reg.collector
+    def broken():
+        raise RuntimeError("boom")
+
+    text = reg.render()
+    assert text.startswith("# HELP h Help\n# TYPE h histogram\n")
+    assert "g 1\n" in text
+    assert "# collector broken failed: boom" in text
+    assert text.endswith("\n")
@@ -0,0 +1,97 @@
+# 排程時段邊界：[開始, 結束)，結束時間進位到分鐘，支援跨日與多時段
+import datetime
+from datetime import timedelta
+
+import pytest
+
+from detector.schedule import ActiveSchedule, MINUTES_PER_DAY, minute_of_day, to_minute
+
+
+def hm(h, m):
+    return h * 60 + m
+
+
+@pytest.mark.parametrize("value, expected", [
+    (timedelta(hours=17, minutes=30), hm(17, 30)),
+    (timedelta(hours=17, minutes=30, seconds=45), hm(17, 30)),
+    (datetime.time(8, 5, 59), hm(8, 5)),
+    ("08:05", hm(8, 5)),
+    ("08:05:30", hm(8, 5)),
+    ("24:00", 0),
+])
+def test_to_minute_floor(value, expected):
+    assert to_minute(value, -1) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    (timedelta(hours=17, minutes=30), hm(17, 30)),
+    (timedelta(hours=17, minutes=30, seconds=1), hm(17, 31)),
+    (datetime.time(23, 59, 59), 0),   # 進位到 24:00
+    ("17:30:45", hm(17, 31)),
+])
+def test_to_minute_ceil(value, expected):
+    assert to_minute(value, -1, ceil=True) == expected
+
+
+@pytest.mark.parametrize("value", [None, "", "bad", "12"])
+def test_to_minute_default(value):
+    assert to_minute(value, 42) == 42
+
+
+def test_end_is_exclusive():
+    s = ActiveSchedule.from_times("08:00", "17:30")
+    assert not s.is_active(hm(7, 59))
+    assert s.is_active(hm(8, 0))
+    assert s.is_active(hm(17, 29))
+    assert not s.is_active(hm(17, 30))
+
+
+def test_end_seconds_round_up():
+    s = ActiveSchedule.from_times(timedelta(hours=8), timedelta(hours=17, minutes=30, seconds=45))
+    assert s.is_active(hm(17, 30))
+    assert not s.is_active(hm(17, 31))
+
+
+def test_overnight_window():
+    s = ActiveSchedule.from_times("22:00", "06:00")
+    assert s.is_active(hm(22, 0))
+    assert s.is_active(hm(23, 59))
+    assert s.is_active(0)
+    assert s.is_active(hm(5, 59))
+    assert not s.is_active(hm(6, 0))
+    assert not s.is_active(hm(21, 59))
+
+
+@pytest.mark.parametrize("start, end", [
+    (None, None), ("00:00", "00:00"), ("00:00", "24:00"), ("00:00", "23:59:59"),
+])
+def test_whole_day(start, end):
+    s = ActiveSchedule.from_times(start, end)
+    assert all(s.is_active(m) for m in range(MINUTES_PER_DAY))
+
+
+def test_until_midnight():
+    s = ActiveSchedule.from_times("20:00", None)
+    assert s.is_active(hm(23, 59))
+    assert not s.is_active(0)
+
+
+def test_multiple_windows():
+    s = ActiveSchedule()
+    s.add_times("08:00", "12:00")
+    s.add_times("13:00", "17:00")
+    assert s.is_active(hm(11, 59))
+    assert not s.is_active(hm(12, 30))
+    assert s.is_active(hm(13, 0))
+    assert not s.is_active(hm(17, 0))
+    assert len(s.windows) == 2
+
+
+def test_always_and_empty():
+    assert all(ActiveSchedule.always().is_active(m) for m in range(MINUTES_PER_DAY))
+    assert not any(ActiveSchedule().is_active(m) for m in range(MINUTES_PER_DAY))
+
+
+def test_minute_of_day_local_time():
+    ts = datetime.datetime(2025, 1, 2, 17, 30, 45).timestamp()
+    assert minute_of_day(ts) == hm(17, 30)
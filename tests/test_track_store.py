@@ -0,0 +1,54 @@
+# track 狀態容器：逾時（幀數 / 秒數）淘汰與數量上限
+from detector.track_store import TrackState, TrackStore
+
+
+def test_touch_creates_and_reuses():
+    store = TrackStore(ttl_frames=10, ttl_sec=10, max_tracks=10)
+    rec = store.touch(1, 3, frame=1, now=0.0)
+    assert isinstance(rec, TrackState) and rec.side.shape == (3,)
+    assert store.touch(1, 3, frame=2, now=0.1) is rec
+    assert rec.seen_frame == 2 and rec.seen_at == 0.1
+
+
+def test_expire_by_frames():
+    store = TrackStore(ttl_frames=2, ttl_sec=100, max_tracks=10)
+    store.touch(1, 1, frame=1, now=0.0)
+    store.touch(2, 1, frame=3, now=0.0)
+    store.sweep(frame=4, now=0.0)
+    assert 1 not in store and 2 in store
+    assert store.expired == 1
+
+
+def test_expire_by_seconds():
+    store = TrackStore(ttl_frames=100, ttl_sec=1.0, max_tracks=10)
+    store.touch(1, 1, frame=1, now=0.0)
+    store.touch(2, 1, frame=1, now=5.0)
+    store.sweep(frame=1, now=5.5)
+    assert 1 not in store and 2 in store
+
+
+def test_recently_seen_track_survives():
+    # 重新出現的 track 移到尾端，不被較舊的 track 擋住淘汰
+    store = TrackStore(ttl_frames=2, ttl_sec=100, max_tracks=10)
+    store.touch(1, 1, frame=1, now=0.0)
+    store.touch(2, 1, frame=1, now=0.0)
+    store.touch(1, 1, frame=4, now=0.0)
+    store.sweep(frame=4, now=0.0)
+    assert 1 in store and 2 not in store
+
+
+def test_max_tracks_evicts_oldest():
+    store = TrackStore(ttl_frames=100, ttl_sec=100, max_tracks=2)
+    for tid in (1, 2, 3):
+        store.touch(tid, 1, frame=1, now=0.0)
+    store.sweep(frame=1, now=0.0)
+    assert list(t for t, _ in store.items()) == [2, 3]
+    assert store.stats()["evicted"] == 1
+
+
+def test_custom_factory_and_empty_like():
+    store = TrackStore(ttl_frames=5, ttl_sec=5, max_tracks=5, factory=lambda _: TrackState(2))
+    store.touch(1, None, frame=1, now=0.0)
+    store.sweep(frame=1, now=0.0)
+    clone = store.empty_like()
+    assert len(clone) == 0 and clone.peak == 1 and clone.factory is store.factory
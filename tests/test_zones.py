@@ -0,0 +1,62 @@
+# 區域索引：點陣化遮罩的查詢與增量更新
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from detector.zones import ZoneIndex, zone_polygon
+
+SQUARE = [(100, 100), (200, 100), (200, 200), (100, 200)]
+
+
+def test_zone_polygon_formats():
+    rect = zone_polygon({"A": (0.0, 0.0), "B": (0.5, 0.5)})
+    assert rect.tolist() == [[0, 0], [640, 0], [640, 360], [0, 360]]
+    pts = zone_polygon({"points": [[0.5, 0.5], [1.0, 0.5], [1.0, 1.0]]})
+    assert pts.shape == (3, 2)
+
+
+def test_membership_and_counts():
+    idx = ZoneIndex(cell=4)
+    idx.replace({1: SQUARE, 2: [(150, 150), (300, 150), (300, 300), (150, 300)]})
+    slots = idx.slots([1, 2, 99])
+    feet = np.array([(120, 120), (170, 170), (250, 250), (600, 600), (-5, 10)])
+    inside = idx.membership(feet, slots)
+    assert inside.tolist() == [
+        [True, False, False],
+        [True, True, False],
+        [False, True, False],
+        [False, False, False],
+        [False, False, False],
+    ]
+    assert idx.counts(feet, slots).tolist() == [2, 2, 0]
+
+
+def test_update_and_remove_only_touch_own_bits():
+    idx = ZoneIndex(cell=4)
+    idx.replace({1: SQUARE, 2: SQUARE})
+    idx.set(1, [(400, 400), (500, 400), (500, 500), (400, 500)])
+    slots = idx.slots([1, 2])
+    assert idx.membership([(150, 150)], slots).tolist() == [[False, True]]
+    assert idx.membership([(450, 450)], slots).tolist() == [[True, False]]
+
+    idx.replace({2: SQUARE})
+    assert 1 not in idx and len(idx) == 1
+    assert idx.membership([(450, 450)], idx.slots([2])).tolist() == [[False]]
+
+
+def test_unchanged_zone_is_not_redrawn():
+    idx = ZoneIndex(cell=4)
+    idx.replace({1: SQUARE})
+    idx.replace({1: SQUARE})
+    assert idx.rasterized == 1
+
+
+def test_more_than_32_zones_adds_plane():
+    idx = ZoneIndex(cell=4)
+    zones = {i: [(i * 16, 0), (i * 16 + 8, 0), (i * 16 + 8, 8), (i * 16, 8)] for i in range(40)}
+    idx.replace(zones)
+    assert idx.mask.shape[0] == 2
+    slots = idx.slots(list(zones))
+    counts = idx.counts([(i * 16 + 4, 4) for i in range(40)], slots)
+    assert counts.tolist() == [1] * 40